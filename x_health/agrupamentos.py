@@ -0,0 +1,409 @@
+### motor de agrupamento compartilhado pelas funções agrupar_* de eda_utils e xgboost_utils
+
+from functools import lru_cache
+import re
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# memória dos valores já classificados, compartilhada entre chamadas (um dicionário por classificador)
+_MEMO: Dict[str, Dict[Tuple[type, Any], str]] = {}
+
+
+def limpar_memo() -> None:
+    """
+    Esvazia a memória de classificações compartilhada entre chamadas.
+    """
+    _MEMO.clear()
+
+
+#######################################
+#       MOTOR DE AGRUPAMENTO          #
+#######################################
+def agrupar_valores(
+    serie: pd.Series,
+    classificador: Callable[[Any], str],
+    categorias: List[str],
+    usar_memo: bool = True
+) -> pd.Series:
+    """
+    Aplica um classificador a uma coluna visitando cada valor distinto uma única vez.
+
+    A coluna é fatorada (`pd.factorize`), o classificador roda apenas sobre os valores
+    distintos e os rótulos voltam para as linhas com uma indexação vetorizada. Assim, o
+    custo em Python passa a ser proporcional à quantidade de valores distintos, e não à
+    quantidade de linhas.
+
+    Parâmetros:
+    -----------
+    serie : pd.Series
+        Coluna com os valores brutos.
+    classificador : Callable[[Any], str]
+        Função que recebe um valor bruto e devolve o rótulo do grupo.
+    categorias : List[str]
+        Todos os rótulos que o classificador pode devolver, na ordem das categorias.
+    usar_memo : bool, opcional (default=True)
+        Se True, reaproveita classificações de chamadas anteriores com o mesmo classificador.
+
+    Retorno:
+    --------
+    pd.Series
+        Série categórica (pd.Categorical) com o mesmo índice e nome da série de entrada.
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+
+    memo = _MEMO.setdefault(classificador.__qualname__, {}) if usar_memo else {}
+    posicao = {rotulo: i for i, rotulo in enumerate(categorias)}
+
+    codigo_por_unico = np.empty(len(unicos), dtype=np.int16)
+    for i, valor in enumerate(unicos):
+        # valores nulos não servem de chave de dicionário (nan != nan), então não são memorizados;
+        # o tipo entra na chave porque 1, 1.0 e True têm o mesmo hash mas textos diferentes
+        if pd.isna(valor):
+            rotulo = classificador(valor)
+        else:
+            chave = (type(valor), valor)
+            rotulo = memo.get(chave)
+            if rotulo is None:
+                rotulo = memo[chave] = classificador(valor)
+        codigo_por_unico[i] = posicao[rotulo]
+
+    return pd.Series(
+        pd.Categorical.from_codes(codigo_por_unico[codigos], categories=categorias),
+        index=serie.index,
+        name=serie.name,
+    )
+
+
+def _ausente(valor: Any) -> bool:
+    # Verificar se o valor está ausente (nan, "", "none")
+    return pd.isna(valor) or str(valor).strip().lower() in ["nan", "", "none"]
+
+
+#######################################
+#       PRAZO DE PAGAMENTO            #
+#######################################
+CATEGORIAS_PRAZO = [
+    "Sem pagamento",
+    "Desconhecido",
+    "À vista (até 15 dias)",
+    "Curto prazo (16-30 dias)",
+    "Médio prazo (31-90 dias)",
+    "Longo prazo (+90 dias)",
+    "Outros",
+]
+
+
+def classificar_prazo(fp: Any) -> str:
+    if _ausente(fp):
+        return "Desconhecido"
+
+    # Verificar se o pagamento é explicitamente ausente
+    if str(fp).strip().lower() in ["nenhum", "sem pagamento"]:
+        return "Sem pagamento"
+
+    # Converter para string e substituir "x" por "/" para padronizar
+    prazos = [int(x) for x in str(fp).replace("x", "/").split("/") if x.isdigit()]
+
+    # Se não houver prazos identificáveis, classificar como "Outros"
+    if not prazos:
+        return "Outros"
+
+    # Calcular o prazo médio
+    prazo_medio = sum(prazos) / len(prazos)
+
+    # Definir categorias de prazo
+    if len(prazos) == 1 and prazo_medio <= 15:
+        return "À vista (até 15 dias)"
+    elif prazo_medio <= 30:
+        return "Curto prazo (16-30 dias)"
+    elif prazo_medio <= 90:
+        return "Médio prazo (31-90 dias)"
+    else:
+        return "Longo prazo (+90 dias)"
+
+
+# colunas numéricas extraídas da forma de pagamento por `extrair_prazos`
+COLUNAS_PRAZO = ["qtd_parcelas", "prazo_medio", "prazo_max"]
+
+
+@lru_cache(maxsize=4096, typed=True)
+def _prazos_memo(fp: Any) -> Tuple[int, float, float]:
+    if _ausente(fp) or str(fp).strip().lower() in ["nenhum", "sem pagamento"]:
+        return 0, np.nan, np.nan
+
+    # mesmos pedaços de `extrair_prazos`: só os compostos apenas por dígitos
+    prazos = [int(x) for x in str(fp).replace("x", "/").split("/") if re.fullmatch(r"\d+", x)]
+    if not prazos:
+        return 0, np.nan, np.nan
+    return len(prazos), float(np.float32(sum(prazos) / len(prazos))), float(max(prazos))
+
+
+def prazos_pagamento(fp: Any) -> Tuple[int, float, float]:
+    """
+    Versão escalar de `extrair_prazos` para uma única forma de pagamento, sem criar objetos
+    do pandas. Os resultados ficam memorizados por valor (o tipo entra na chave, já que
+    1 e 1.0 têm textos diferentes).
+
+    Retorno:
+    --------
+    Tuple[int, float, float]
+        (qtd_parcelas, prazo_medio, prazo_max), com os mesmos valores das colunas de
+        `extrair_prazos`.
+    """
+    try:
+        return _prazos_memo(fp)
+    except TypeError:
+        # valores não hasheáveis não são memorizados
+        return _prazos_memo.__wrapped__(fp)
+
+
+def extrair_prazos(serie: pd.Series, coluna_agrup: str = "forma_pagamento_agrup") -> pd.DataFrame:
+    """
+    Interpreta a forma de pagamento ("30/60/90", "3x", "28", ...) de uma coluna inteira de uma vez
+    e devolve os prazos em formato numérico junto com o agrupamento de `classificar_prazo`.
+
+    As regras são as mesmas de `classificar_prazo`: o texto é quebrado em "/" (com "x" tratado
+    como "/") e só os pedaços compostos apenas por dígitos contam como prazo. A extração é feita
+    com os métodos vetorizados de `Series.str` sobre os valores distintos da coluna.
+
+    Parâmetros:
+    -----------
+    serie : pd.Series
+        Coluna com as formas de pagamento brutas.
+    coluna_agrup : str, opcional (default="forma_pagamento_agrup")
+        Nome da coluna de agrupamento no resultado.
+
+    Retorno:
+    --------
+    pd.DataFrame
+        DataFrame no mesmo índice de `serie`, com as colunas:
+        - qtd_parcelas : quantidade de prazos identificados (0 quando nenhum).
+        - prazo_medio : prazo médio em dias (NaN quando não há prazos).
+        - prazo_max : maior prazo em dias (NaN quando não há prazos).
+        - coluna_agrup : agrupamento categórico, idêntico ao de `agrupar_prazo`.
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    unicos = pd.Series(unicos, dtype=object)
+
+    texto = unicos.astype(str).str.strip().str.lower()
+    ausente = unicos.isna().to_numpy() | texto.isin(["nan", "", "none"]).to_numpy()
+    sem_pagamento = texto.isin(["nenhum", "sem pagamento"]).to_numpy()
+
+    # um pedaço por linha; só os compostos apenas por dígitos são prazos
+    pedacos = unicos.astype(str).str.replace("x", "/", regex=False).str.split("/").explode()
+    pedacos = pedacos[pedacos.str.fullmatch(r"\d+", na=False)].astype("int64")
+    por_valor = pedacos.groupby(level=0).agg(["count", "mean", "max"]).reindex(unicos.index)
+
+    qtd = por_valor["count"].fillna(0).to_numpy(dtype=np.int16)
+    medio = por_valor["mean"].to_numpy(dtype=np.float32)
+    maximo = por_valor["max"].to_numpy(dtype=np.float32)
+
+    # mesmas regras, na mesma ordem, de classificar_prazo
+    rotulos = np.select(
+        [
+            ausente,
+            sem_pagamento,
+            qtd == 0,
+            (qtd == 1) & (medio <= 15),
+            medio <= 30,
+            medio <= 90,
+        ],
+        [
+            CATEGORIAS_PRAZO.index("Desconhecido"),
+            CATEGORIAS_PRAZO.index("Sem pagamento"),
+            CATEGORIAS_PRAZO.index("Outros"),
+            CATEGORIAS_PRAZO.index("À vista (até 15 dias)"),
+            CATEGORIAS_PRAZO.index("Curto prazo (16-30 dias)"),
+            CATEGORIAS_PRAZO.index("Médio prazo (31-90 dias)"),
+        ],
+        default=CATEGORIAS_PRAZO.index("Longo prazo (+90 dias)"),
+    )
+
+    # prazos só fazem sentido quando o valor não é ausente nem "sem pagamento"
+    invalido = ausente | sem_pagamento
+    qtd[invalido] = 0
+    medio[invalido] = np.nan
+    maximo[invalido] = np.nan
+
+    return pd.DataFrame(
+        {
+            "qtd_parcelas": qtd[codigos],
+            "prazo_medio": medio[codigos],
+            "prazo_max": maximo[codigos],
+            coluna_agrup: pd.Categorical.from_codes(rotulos.astype(np.int16)[codigos], categories=CATEGORIAS_PRAZO),
+        },
+        index=serie.index,
+    )
+
+
+#######################################
+#       TIPO DE SOCIEDADE             #
+#######################################
+CATEGORIAS_SOCIEDADE = [
+    "Sociedade Limitada",
+    "Empresa Individual",
+    "Microempreendedor (MEI)",
+    "Sociedade Anônima",
+    "Cooperativas & Associações",
+    "Organizações Públicas & Fundações",
+    "Outros",
+    "Desconhecido",
+]
+
+
+def classificar_sociedade(tipo: Any) -> str:
+    if _ausente(tipo):
+        return "Desconhecido"
+
+    # Normalizar para minúsculo
+    tipo = str(tipo).strip().lower()
+
+    # Classificar os tipos de sociedade
+    if "limitada" in tipo:
+        return "Sociedade Limitada"
+    elif "individual" in tipo:
+        return "Empresa Individual"
+    elif "mei" in tipo:
+        return "Microempreendedor (MEI)"
+    elif "anonima" in tipo:
+        return "Sociedade Anônima"
+    elif "cooperativa" in tipo or "associacao" in tipo or "sindical" in tipo:
+        return "Cooperativas & Associações"
+    elif "municipio" in tipo or "fundacao" in tipo or "mista" in tipo or "religiosa" in tipo:
+        return "Organizações Públicas & Fundações"
+    else:
+        return "Outros"
+
+
+#######################################
+#       ATIVIDADE PRINCIPAL           #
+#######################################
+CATEGORIAS_ATIVIDADE = [
+    "Comércio",
+    "Indústria",
+    "Serviços",
+    "Construção Civil",
+    "Agronegócio",
+    "Educação",
+    "Saúde",
+    "OSC",
+    "Transporte",
+    "RH",
+    "Outros",
+    "Desconhecido",
+]
+
+
+def classificar_atividade(atividade: Any) -> str:
+    if _ausente(atividade):
+        return "Desconhecido"
+
+    # Normalizar para minúsculo
+    atividade = str(atividade).strip().lower()
+
+    # Classificar as atividades em grandes grupos
+    if "comércio" in atividade or "varejo" in atividade or "atacado" in atividade or "distribuição" in atividade or 'com de' in atividade:
+        return "Comércio"
+    elif "indústria" in atividade or "fábrica" in atividade or "produção" in atividade or 'ind de' in atividade:
+        return "Indústria"
+    elif "serviço" in atividade or "consultoria" in atividade or "tecnologia" in atividade or "transporte" in atividade or "advocacia" in atividade:
+        return "Serviços"
+    elif "construção" in atividade or "engenharia" in atividade or "arquitetura" in atividade:
+        return "Construção Civil"
+    elif "agricultura" in atividade or "pecuária" in atividade or "rural" in atividade:
+        return "Agronegócio"
+    elif "educação" in atividade or "escola" in atividade or "curso" in atividade or "treinamento" in atividade:
+        return "Educação"
+    elif "saúde" in atividade or "hospital" in atividade or "clínica" in atividade or "farmácia" in atividade:
+        return "Saúde"
+    elif 'entidades sem fins lucrativos' in atividade:
+        return 'OSC'
+    elif 'transporte' in atividade:
+        return "Transporte"
+    elif 'serv de selecao e administracao de pessoal' in atividade:
+        return 'RH'
+    else:
+        return "Outros"
+
+
+#######################################
+#       TIPO DE COMÉRCIO              #
+#######################################
+CATEGORIAS_COMERCIO = [
+    "Tecnologia & Eletrônicos",
+    "Livros & Papelaria",
+    "Móveis & Decoração",
+    "Moda & Vestuário",
+    "Automotivo",
+    "Saúde & Ortopedia",
+    "Construção & Ferragens",
+    "Alimentação & Bebidas",
+    "Esportes & Lazer",
+    "Outros",
+    "Desconhecido",
+]
+
+
+def classificar_comercio(comercio: Any) -> str:
+    if _ausente(comercio):
+        return "Desconhecido"
+
+    # Normalizar para minúsculo
+    comercio = str(comercio).strip().lower()
+
+    # Classificação por similaridade
+    if "informatica" in comercio or "eletron" in comercio or "telefones" in comercio:
+        return "Tecnologia & Eletrônicos"
+    elif "livros" in comercio or "revistas" in comercio or "jornais" in comercio:
+        return "Livros & Papelaria"
+    elif "moveis" in comercio or "decoracao" in comercio or "estofados" in comercio:
+        return "Móveis & Decoração"
+    elif "confeccoes" in comercio or "calcados" in comercio or "tecidos" in comercio:
+        return "Moda & Vestuário"
+    elif "auto pecas" in comercio or "pneus" in comercio or "motocicletas" in comercio or "tratores" in comercio or "veiculos" in comercio:
+        return "Automotivo"
+    elif "medico" in comercio or "hospitalar" in comercio or "ortopedicos" in comercio or "odontologicos" in comercio:
+        return "Saúde & Ortopedia"
+    elif "construcao" in comercio or "ferragens" in comercio or "tintas" in comercio:
+        return "Construção & Ferragens"
+    elif "alimentos" in comercio or "bebidas" in comercio or "paes" in comercio or "doces" in comercio:
+        return "Alimentação & Bebidas"
+    elif "esportivos" in comercio or "brinquedos" in comercio or "bicicletas" in comercio:
+        return "Esportes & Lazer"
+    else:
+        return "Outros"
+
+
+#######################################
+#       OPÇÃO TRIBUTÁRIA              #
+#######################################
+CATEGORIAS_OPCAO_TRIBUTARIA = [
+    "Simples Nacional",
+    "Lucro Presumido",
+    "Lucro Real",
+    "MEI",
+    "Outros",
+    "Desconhecido",
+]
+
+
+def classificar_opcao_tributaria(opcao: Any) -> str:
+    if _ausente(opcao):
+        return "Desconhecido"
+
+    # Normalizar para minúsculo
+    opcao = str(opcao).strip().lower()
+
+    # Classificar as opções tributárias
+    if "simples" in opcao:
+        return "Simples Nacional"
+    elif "presumido" in opcao:
+        return "Lucro Presumido"
+    elif "real" in opcao:
+        return "Lucro Real"
+    elif "mei" in opcao:
+        return "MEI"
+    else:
+        return "Outros"
@@ -1,14 +1,9 @@
 from pathlib import Path
 
-from dotenv import load_dotenv
 from loguru import logger
 
-# Load environment variables from .env file if it exists
-load_dotenv()
-
 # Paths
 PROJ_ROOT = Path(__file__).resolve().parents[1]
-logger.info(f"PROJ_ROOT path is: {PROJ_ROOT}")
 
 DATA_DIR = PROJ_ROOT / "data"
 RAW_DATA_DIR = DATA_DIR / "raw"
@@ -21,12 +16,31 @@ MODELS_DIR = PROJ_ROOT / "models"
 REPORTS_DIR = PROJ_ROOT / "reports"
 FIGURES_DIR = REPORTS_DIR / "figures"
 
-# If tqdm is installed, configure loguru with tqdm.write
-# https://github.com/Delgan/loguru/issues/135
-try:
-    from tqdm import tqdm
+_CONFIGURADO = False
+
+
+def configurar() -> None:
+    """
+    Carrega o .env e configura o loguru. Chamado pelos comandos de linha de comando (e
+    pelos notebooks, se quiserem); importar este módulo não tem efeitos colaterais.
+    """
+    global _CONFIGURADO
+    if _CONFIGURADO:
+        return
+    _CONFIGURADO = True
+
+    # Load environment variables from .env file if it exists
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logger.info(f"PROJ_ROOT path is: {PROJ_ROOT}")
+
+    # If tqdm is installed, configure loguru with tqdm.write
+    # https://github.com/Delgan/loguru/issues/135
+    try:
+        from tqdm import tqdm
 
-    logger.remove(0)
-    logger.add(lambda msg: tqdm.write(msg, end=""), colorize=True)
-except ModuleNotFoundError:
-    pass
+        logger.remove(0)
+        logger.add(lambda msg: tqdm.write(msg, end=""), colorize=True)
+    except (ModuleNotFoundError, ValueError):
+        pass
@@ -1,5 +1,9 @@
+import hashlib
 from pathlib import Path
+import re
+from typing import Iterator, List, Optional, Union
 
+import pandas as pd
 import typer
 from loguru import logger
 from tqdm import tqdm
@@ -12,6 +16,254 @@ from x_health.config import *
 app = typer.Typer()
 
 
+# base externa exportada pelo sistema de pedidos
+DATASET_PATH = EXTERNAL_DATA_DIR / "dataset_2021-5-26-10-14.csv"
+
+# esquema da base externa: o alvo (default) e o mês em int8, contagens em int16,
+# valores em float32 e textos como category. default_3months é uma contagem de
+# inadimplências no trimestre (chega a 26 na base), não uma flag
+SCHEMA_DATASET = {
+    "default_3months": "int16",
+    "ioi_36months": "float32",
+    "ioi_3months": "float32",
+    "valor_por_vencer": "float32",
+    "valor_vencido": "float32",
+    "valor_quitado": "float32",
+    "quant_protestos": "int16",
+    "valor_protestos": "float32",
+    "quant_acao_judicial": "int16",
+    "acao_judicial_valor": "float32",
+    "participacao_falencia_valor": "float32",
+    "dividas_vencidas_valor": "float32",
+    "dividas_vencidas_qtd": "int16",
+    "falencia_concordata_qtd": "int16",
+    "tipo_sociedade": "category",
+    "opcao_tributaria": "category",
+    "atividade_principal": "category",
+    "forma_pagamento": "category",
+    "valor_total_pedido": "float32",
+    "month": "int8",
+    "year": "int16",
+    "default": "int8",
+}
+
+
+#######################################
+#       LEITURA DA BASE EXTERNA       #
+#######################################
+def carregar_dataset(
+    caminho: Path = DATASET_PATH,
+    colunas: Optional[List[str]] = None,
+    chunksize: Optional[int] = None,
+    usar_cache: Optional[bool] = None
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Lê a base externa (separada por tabulação) com o esquema declarado em SCHEMA_DATASET,
+    carregando apenas as colunas pedidas.
+
+    Parâmetros:
+    -----------
+    caminho : Path, opcional (default=DATASET_PATH)
+        Caminho do arquivo exportado.
+    colunas : List[str], opcional (default=None)
+        Colunas a carregar. Se None, carrega todas as colunas do esquema.
+    chunksize : int, opcional (default=None)
+        Se informado, devolve um iterador de DataFrames com até `chunksize` linhas cada,
+        para exportações que não cabem inteiras na memória.
+    usar_cache : bool, opcional (default=None)
+        Cópia em Parquet em INTERIM_DATA_DIR, gerada pelo comando `cache` (`make data`):
+        - None: lê do cache se ele já existir para o conteúdo atual; nunca grava nada.
+        - True: gera o cache se ele faltar (ou estiver desatualizado) e lê dele.
+        - False: sempre interpreta o texto.
+
+    Retorno:
+    --------
+    pd.DataFrame ou Iterator[pd.DataFrame]
+        Base tipada (ou iterador de blocos tipados).
+    """
+    colunas = list(colunas or SCHEMA_DATASET)
+    desconhecidas = [col for col in colunas if col not in SCHEMA_DATASET]
+    if desconhecidas:
+        raise KeyError(f"Colunas fora do esquema da base: {desconhecidas}")
+
+    if usar_cache:
+        try:
+            return _ler_cache(gerar_cache(caminho), colunas, chunksize)
+        except ModuleNotFoundError:
+            logger.warning("pyarrow não instalado: lendo a base direto do arquivo de texto.")
+    elif usar_cache is None and _caches_da_origem(caminho):
+        # só confere a impressão digital quando há algum cache da origem para reaproveitar
+        destino = caminho_cache(caminho)
+        if destino.exists():
+            try:
+                return _ler_cache(destino, colunas, chunksize)
+            except ModuleNotFoundError:
+                logger.warning("pyarrow não instalado: lendo a base direto do arquivo de texto.")
+        else:
+            logger.warning(f"Cache de {caminho} desatualizado: lendo o texto (refaça com `make data`).")
+
+    return pd.read_csv(
+        caminho,
+        sep="\t",
+        encoding="utf-8",
+        na_values="missing",
+        usecols=colunas,
+        dtype={col: SCHEMA_DATASET[col] for col in colunas},
+        chunksize=chunksize,
+    )
+
+
+#######################################
+#     CACHE COLUNAR DA BASE EXTERNA   #
+#######################################
+COLUNAS_TEXTO = [col for col, tipo in SCHEMA_DATASET.items() if tipo == "category"]
+
+
+def _schema_arrow():
+    import pyarrow as pa
+
+    tipos = {"int8": pa.int8(), "int16": pa.int16(), "float32": pa.float32(), "category": pa.string()}
+    return pa.schema([(col, tipos[tipo]) for col, tipo in SCHEMA_DATASET.items()])
+
+
+def _id_origem(caminho: Path) -> str:
+    """
+    Prefixo dos arquivos de cache de uma origem: nome do arquivo mais um hash do caminho
+    absoluto, para que arquivos de mesmo nome em diretórios diferentes não se misturem.
+    """
+    caminho = Path(caminho)
+    hash_caminho = hashlib.blake2b(str(caminho.resolve()).encode("utf-8"), digest_size=4).hexdigest()
+    return f"{caminho.stem}-{hash_caminho}"
+
+
+def _caches_da_origem(caminho: Path) -> List[Path]:
+    """
+    Parquets em cache da origem, em qualquer versão: exatamente `{origem}-{fingerprint}.parquet`,
+    sem pegar caches de outras origens cujo nome comece igual.
+    """
+    padrao = re.compile(rf"{re.escape(_id_origem(caminho))}-[0-9a-f]{{32}}\.parquet")
+    return [arquivo for arquivo in INTERIM_DATA_DIR.glob("*.parquet") if padrao.fullmatch(arquivo.name)]
+
+
+def fingerprint_arquivo(caminho: Path) -> str:
+    """
+    Calcula a impressão digital (BLAKE2b) do conteúdo do arquivo.
+
+    O resultado fica anotado num arquivo `.fingerprint` em INTERIM_DATA_DIR (um por caminho
+    absoluto da origem) junto com o tamanho e a data de modificação da origem; enquanto esses
+    dois não mudarem, o conteúdo não é lido de novo.
+    """
+    caminho = Path(caminho)
+    info = caminho.stat()
+    INTERIM_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    anotacao = INTERIM_DATA_DIR / f"{_id_origem(caminho)}.fingerprint"
+
+    if anotacao.exists():
+        with open(anotacao, "r") as file:
+            salvo = json.load(file)
+        if salvo["tamanho"] == info.st_size and salvo["mtime_ns"] == info.st_mtime_ns:
+            return salvo["fingerprint"]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(caminho, "rb") as file:
+        for bloco in iter(lambda: file.read(1 << 20), b""):
+            h.update(bloco)
+    fingerprint = h.hexdigest()
+
+    with open(anotacao, "w") as file:
+        json.dump({"tamanho": info.st_size, "mtime_ns": info.st_mtime_ns, "fingerprint": fingerprint}, file)
+
+    return fingerprint
+
+
+def caminho_cache(caminho: Path) -> Path:
+    """
+    Caminho do Parquet em cache para a versão atual do arquivo de origem.
+    """
+    return INTERIM_DATA_DIR / f"{_id_origem(caminho)}-{fingerprint_arquivo(caminho)}.parquet"
+
+
+def gerar_cache(caminho: Path = DATASET_PATH, forcar: bool = False, chunksize: int = 200_000) -> Path:
+    """
+    Converte a base externa para Parquet em INTERIM_DATA_DIR, uma única vez por conteúdo.
+
+    O nome do arquivo leva a impressão digital da origem: se a origem não mudou, o cache
+    existente é reaproveitado; se mudou, o Parquet é refeito e as versões antigas são
+    apagadas. A conversão é feita em blocos, com memória limitada ao tamanho do bloco.
+
+    Parâmetros:
+    -----------
+    caminho : Path, opcional (default=DATASET_PATH)
+        Arquivo de origem (texto separado por tabulação).
+    forcar : bool, opcional (default=False)
+        Se True, refaz o cache mesmo que ele já exista.
+    chunksize : int, opcional (default=200000)
+        Linhas lidas do texto por bloco durante a conversão.
+
+    Retorno:
+    --------
+    Path
+        Caminho do Parquet em cache.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema_arrow()
+    destino = caminho_cache(caminho)
+    if destino.exists() and not forcar:
+        return destino
+
+    logger.info(f"Gerando cache colunar de {caminho}...")
+    temporario = destino.with_suffix(".parquet.tmp")
+    with pq.ParquetWriter(temporario, schema, compression="zstd") as escritor:
+        for bloco in carregar_dataset(caminho, chunksize=chunksize, usar_cache=False):
+            # textos gravados como string; o Parquet já os guarda com codificação de dicionário
+            for col in COLUNAS_TEXTO:
+                bloco[col] = bloco[col].astype(object)
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=schema, preserve_index=False))
+    temporario.replace(destino)
+
+    # remove versões antigas do cache da mesma origem
+    for antigo in _caches_da_origem(caminho):
+        if antigo != destino:
+            antigo.unlink()
+
+    logger.success(f"Cache salvo em: {destino}")
+    return destino
+
+
+def _ler_cache(
+    caminho: Path,
+    colunas: List[str],
+    chunksize: Optional[int] = None
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Lê colunas do Parquet em cache com memory-map; textos voltam como category.
+    """
+    import pyarrow.parquet as pq
+
+    textos = [col for col in colunas if col in COLUNAS_TEXTO]
+
+    if chunksize is None:
+        tabela = pq.read_table(caminho, columns=colunas, memory_map=True, read_dictionary=textos)
+        return tabela.to_pandas()
+
+    arquivo = pq.ParquetFile(caminho, memory_map=True, read_dictionary=textos)
+    return (lote.to_pandas() for lote in arquivo.iter_batches(batch_size=chunksize, columns=colunas))
+
+
+@app.command()
+def cache(
+    caminho: Path = DATASET_PATH,
+    forcar: bool = False,
+):
+    """
+    Converte a base externa para o cache colunar em data/interim.
+    """
+    gerar_cache(caminho, forcar=forcar)
+
+
+@app.command("gerar-dados-teste")
 def gerar_dados_teste():
     """
     Gera um dicionário com valores aleatórios para teste e salva em um arquivo JSON.
@@ -66,4 +318,5 @@ def gerar_dados_teste():
     print(f"Arquivo salvo com sucesso em {caminho_arquivo_entrada}!")
 
 if __name__ == "__main__":
-    gerar_dados_teste()
\ No newline at end of file
+    configurar()
+    app()
\ No newline at end of file
@@ -3,13 +3,23 @@
 import pandas as pd 
 import numpy as np
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-from sklearn.feature_selection import mutual_info_classif
 from typing import List, Union, Any, Optional, Tuple
 
-from sklearn.preprocessing import LabelEncoder
+# sklearn é importado dentro das funções que o usam (carga sob demanda)
+
+from x_health.agrupamentos import (
+    CATEGORIAS_ATIVIDADE,
+    CATEGORIAS_COMERCIO,
+    CATEGORIAS_OPCAO_TRIBUTARIA,
+    CATEGORIAS_PRAZO,
+    CATEGORIAS_SOCIEDADE,
+    agrupar_valores,
+    classificar_atividade,
+    classificar_comercio,
+    classificar_opcao_tributaria,
+    classificar_prazo,
+    classificar_sociedade,
+)
 
 #######################################
 #       Tratamento de Categóricas     #
@@ -32,9 +42,12 @@ def tratar_categoricas(df: pd.DataFrame) -> pd.DataFrame:
     """
     df = df.copy()
 
-    # Preenche valores nulos com "Desconhecido"
-    for col in df.select_dtypes(include=['object']).columns:
-        df[col] = df[col].fillna("Desconhecido")
+    # Preenche valores nulos com "Desconhecido" (colunas categóricas, como as geradas
+    # pelas funções agrupar_*, voltam para texto antes de codificar)
+    for col in df.select_dtypes(include=['object', 'category']).columns:
+        df[col] = df[col].astype(object).fillna("Desconhecido")
+
+    from sklearn.preprocessing import LabelEncoder
 
     # Converte variáveis categóricas para numéricas
     label_encoders = {}
@@ -68,9 +81,9 @@ target : str
     Nome da variável alvo binária (0/1).
 bins : int, opcional (default=10)
     Número de intervalos (bins) para discretizar variáveis contínuas.
-show_woe : bool, opcional (default=True)
+show_woe : bool, opcional (default=False)
     Se True, exibe a tabela de WOE para cada variável analisada.
-show_iv : bool, opcional (default=True)
+show_iv : bool, opcional (default=False)
     Se True, exibe o Information Value (IV) de cada variável.
 
 Retorno
@@ -82,17 +95,95 @@ woeDF : pd.DataFrame
 
 Exemplo de Uso
 --------------
-df_iv, df_woe = iv_woe(df, target='default', bins=10, show_woe=True, show_iv=True)
+df_iv, df_woe = iv_woe(df, target='default', bins=10)
 """
 #################################################
 #                   IV / WOE                    #
 #################################################
+def _codigos_iv(serie: pd.Series, cortes: Optional[np.ndarray] = None) -> Tuple[np.ndarray, list]:
+    """
+    Códigos das faixas de uma variável (-1 para nulos) e o rótulo de cada faixa, na ordem
+    em que o `groupby` original as listava.
+    """
+    if cortes is not None:
+        # mesma regra de pd.qcut: faixas (a, b], com o primeiro corte incluído na 1ª faixa
+        valores = serie.to_numpy(dtype=np.float64)
+        ids = np.searchsorted(cortes, valores, side="left")
+        ids[valores == cortes[0]] = 1
+        codigos = ids - 1
+        codigos[np.isnan(valores) | (ids == 0) | (ids == len(cortes))] = -1
+        rotulos = pd.cut(cortes[:1], bins=cortes, include_lowest=True, precision=3).categories
+        return codigos, list(rotulos)
+
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # categorias não observadas também aparecem (groupby com observed=False)
+        return serie.cat.codes.to_numpy(), list(serie.cat.categories)
+
+    codigos, uniques = pd.factorize(serie, sort=True)
+    return codigos, list(uniques)
+
+
+def _tabelas_iv(
+    variaveis: List[str],
+    tamanhos: List[int],
+    rotulos: list,
+    N: np.ndarray,
+    eventos: np.ndarray,
+    show_woe: bool = False,
+    show_iv: bool = False
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Monta as tabelas de IV e WoE a partir das contagens por faixa, com as faixas de todas
+    as variáveis em sequência (`tamanhos[i]` faixas para `variaveis[i]`).
+    """
+    # totais por variável, repetidos para cada faixa
+    tamanhos = np.array(tamanhos, dtype=np.int64)
+    var_idx = np.repeat(np.arange(len(variaveis)), tamanhos)
+    inicio = np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+    nao_eventos = N - eventos
+    total_eventos = np.bincount(var_idx, weights=eventos, minlength=len(variaveis))[var_idx]
+    total_nao_eventos = np.bincount(var_idx, weights=nao_eventos, minlength=len(variaveis))[var_idx]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_eventos = np.maximum(eventos, 0.5) / total_eventos
+        pct_nao_eventos = np.maximum(nao_eventos, 0.5) / total_nao_eventos
+        woe = np.log(pct_eventos / pct_nao_eventos)
+    iv = woe * (pct_eventos - pct_nao_eventos)
+
+    woeDF = pd.DataFrame({
+        'Variavel': np.array(variaveis, dtype=object)[var_idx],
+        'Corte': pd.Series(rotulos, dtype=object),
+        'N': N,
+        'Eventos': eventos,
+        '% de Eventos': pct_eventos,
+        'Nao-Eventos': nao_eventos,
+        '% de Nao-Eventos': pct_nao_eventos,
+        'WoE': woe,
+        'IV': iv,
+    }, index=np.arange(len(rotulos)) - inicio)
+    newDF = pd.DataFrame({
+        'Variavel': variaveis,
+        # como o `sum` do pandas, faixas com IV indefinido (NaN) não entram na soma
+        'IV': np.bincount(var_idx, weights=np.where(np.isnan(iv), 0.0, iv), minlength=len(variaveis)),
+    }, index=np.zeros(len(variaveis), dtype=np.int64))
+
+    if show_iv or show_woe:
+        for ivars, iv_value in zip(newDF['Variavel'], newDF['IV']):
+            if show_iv == True:
+                print(f'\033[mInformation Value de \033[1m{ivars} \033[mé \033[1;34m{round(iv_value, 6)}')
+            # Show WOE Table
+            if show_woe == True:
+                print(woeDF[woeDF['Variavel'] == ivars])
+
+    return newDF, woeDF
+
+
 def iv_woe(
         data: pd.DataFrame, 
         target: str, 
         bins: int=10, 
-        show_woe: bool = True,
-        show_iv: bool = True
+        show_woe: bool = False,
+        show_iv: bool = False
 ):
     """
     Parameters
@@ -104,45 +195,398 @@ def iv_woe(
     bins: int
         Total of bins or intervals, 10 by default.
     show_woe: bool
-        If the WOE values are shown in the table, True by default
+        If the WOE values are shown in the table, False by default
     show_iv: bool
-        if the IV values are shown in the table, True by default
+        if the IV values are shown in the table, False by default
     """   
-    
-    newDF, woeDF = pd.DataFrame(), pd.DataFrame()
     cols = data.columns
+    variaveis = list(cols[~cols.isin([target])])
+    y = data[target].to_numpy()
+
+    # variáveis numéricas com mais de 10 valores distintos são cortadas em quantis,
+    # todas de uma vez
+    continuas = [
+        ivars for ivars in variaveis
+        if data[ivars].dtype.kind in 'bifc' and data[ivars].nunique(dropna=False) > 10
+    ]
+    cortes = {}
+    if continuas:
+        quantis = np.nanquantile(
+            data[continuas].to_numpy(dtype=np.float64), np.linspace(0, 1, bins + 1), axis=0
+        )
+        cortes = {ivars: np.unique(quantis[:, j]) for j, ivars in enumerate(continuas)}
+
+    # códigos de todas as variáveis deslocados para uma numeração única de faixas, para
+    # contar N e eventos de todas as variáveis numa única redução
+    codigos, rotulos, tamanhos = [], [], []
+    deslocamento = 0
+    for ivars in variaveis:
+        c, r = _codigos_iv(data[ivars], cortes.get(ivars))
+        codigos.append(np.where(c >= 0, c + deslocamento, -1))
+        rotulos.extend(r)
+        tamanhos.append(len(r))
+        deslocamento += len(r)
+
+    C = np.stack(codigos, axis=1) if codigos else np.empty((len(data), 0), dtype=np.int64)
+    validos = C >= 0
+    faixas = C[validos]
+    N = np.bincount(faixas, minlength=deslocamento)
+    eventos = np.bincount(faixas, weights=np.broadcast_to(y[:, None], C.shape)[validos], minlength=deslocamento)
+    if y.dtype.kind in 'biu':
+        eventos = eventos.astype(np.int64)
+
+    return _tabelas_iv(variaveis, tamanhos, rotulos, N, eventos, show_woe, show_iv)
+
+
+#################################################
+#            IV / WOE EM STREAMING              #
+#################################################
+class SketchQuantis:
+    """
+    Resumo de quantis de tamanho limitado e combinável (compactadores em níveis, no
+    estilo KLL, com descarte determinístico).
+
+    Enquanto o total de valores não passa de `k`, os quantis são exatos (mesma
+    interpolação linear de `np.quantile`). Depois disso, cada nível h guarda valores de
+    peso 2^h e o erro de posto fica abaixo de log2(n/k)/k do total (com k=2048 e 100
+    milhões de linhas, menos de 0,8%).
+
+    Parâmetros:
+    -----------
+    k : int, opcional (default=2048)
+        Capacidade de cada nível.
+    """
+
+    def __init__(self, k: int = 2048):
+        self.k = k
+        self.niveis: List[np.ndarray] = [np.empty(0)]
+        self.n = 0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+        self._paridade = 0
+
+    def atualizar(self, valores: np.ndarray) -> "SketchQuantis":
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return self
+
+        self.n += len(valores)
+        self.minimo = min(self.minimo, valores.min())
+        self.maximo = max(self.maximo, valores.max())
+        self.niveis[0] = np.concatenate([self.niveis[0], valores])
+        self._compactar()
+        return self
+
+    def combinar(self, outro: "SketchQuantis") -> "SketchQuantis":
+        for h, nivel in enumerate(outro.niveis):
+            if h == len(self.niveis):
+                self.niveis.append(np.empty(0))
+            self.niveis[h] = np.concatenate([self.niveis[h], nivel])
+        self.n += outro.n
+        self.minimo = min(self.minimo, outro.minimo)
+        self.maximo = max(self.maximo, outro.maximo)
+        self._compactar()
+        return self
+
+    def _compactar(self) -> None:
+        h = 0
+        while h < len(self.niveis):
+            nivel = self.niveis[h]
+            if len(nivel) > self.k:
+                nivel = np.sort(nivel)
+                # com tamanho ímpar, o maior valor fica no nível; dos pares sobe um de cada,
+                # alternando o lado para não enviesar os quantis
+                resto, nivel = nivel[len(nivel) - len(nivel) % 2:], nivel[:len(nivel) - len(nivel) % 2]
+                promovidos = nivel[self._paridade::2]
+                self._paridade ^= 1
+                self.niveis[h] = resto
+                if h + 1 == len(self.niveis):
+                    self.niveis.append(np.empty(0))
+                self.niveis[h + 1] = np.concatenate([self.niveis[h + 1], promovidos])
+            h += 1
+
+    def quantis(self, q: np.ndarray) -> np.ndarray:
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(len(q), np.nan)
+        if len(self.niveis) == 1:
+            return np.quantile(self.niveis[0], q)
+
+        valores = np.concatenate(self.niveis)
+        pesos = np.concatenate([np.full(len(nivel), 2.0 ** h) for h, nivel in enumerate(self.niveis)])
+        ordem = np.argsort(valores, kind="stable")
+        valores, acumulado = valores[ordem], np.cumsum(pesos[ordem])
+
+        posicao = np.searchsorted(acumulado, q * acumulado[-1], side="left")
+        resultado = valores[np.minimum(posicao, len(valores) - 1)]
+        # extremos exatos, como em np.quantile
+        resultado[q <= 0] = self.minimo
+        resultado[q >= 1] = self.maximo
+        return resultado
+
+
+class AcumuladorIV:
+    """
+    IV / WoE calculados bloco a bloco, para bases que não cabem na memória, com o mesmo
+    formato de saída de `iv_woe`.
+
+    São duas passadas pelos blocos:
+
+    1. `observar`: atualiza um SketchQuantis por variável numérica e conta até 11 valores
+       distintos, para decidir (como `iv_woe`) quais variáveis são cortadas em quantis.
+    2. `contar`: com os cortes fixados (`fixar_cortes`), acumula N e eventos por faixa.
 
-    #Run IV and WOE on all independent variables
-    for ivars in cols[~cols.isin([target])]:
-        if (data[ivars].dtype.kind in 'bifc') and (len(np.unique(data[ivars]))>10):
-            binned_x = pd.qcut(data[ivars], bins, duplicates='drop')
-            d0 = pd.DataFrame({'x': binned_x, 'y': data[target]})
+    Acumuladores de blocos ou processos diferentes são somados com `combinar`: as
+    contagens combinam de forma exata; os cortes vêm do sketch combinado e, por isso, são
+    exatos enquanto a variável tiver até `k` valores e, acima disso, ficam dentro do erro
+    de posto de SketchQuantis (uma faixa pode ganhar ou perder essa fração das linhas).
+    Faixas de variáveis discretas saem ordenadas pelo valor.
+
+    Parâmetros:
+    -----------
+    target : str
+        Variável alvo binária (0/1).
+    bins : int, opcional (default=10)
+        Quantidade de faixas das variáveis contínuas.
+    k : int, opcional (default=2048)
+        Capacidade dos sketches de quantis.
+    """
+
+    def __init__(self, target: str, bins: int = 10, k: int = 2048):
+        self.target = target
+        self.bins = bins
+        self.k = k
+        self.variaveis: List[str] = []
+        self.sketches: dict = {}
+        self.distintos: dict = {}
+        self.cortes: Optional[dict] = None
+        self.contagens: dict = {}
+
+    def _registrar(self, df: pd.DataFrame) -> None:
+        for ivars in df.columns:
+            if ivars != self.target and ivars not in self.variaveis:
+                self.variaveis.append(ivars)
+                self.distintos[ivars] = set()
+
+    def observar(self, df: pd.DataFrame) -> "AcumuladorIV":
+        """
+        1ª passada: atualiza sketches e contagem de valores distintos com um bloco.
+        """
+        self._registrar(df)
+        for ivars in self.variaveis:
+            if ivars not in df.columns or df[ivars].dtype.kind not in 'bifc':
+                continue
+            if self.distintos[ivars] is not None:
+                valores = set(df[ivars].dropna().unique().tolist())
+                if df[ivars].isna().any():
+                    valores.add("NaN")
+                self.distintos[ivars] |= valores
+                if len(self.distintos[ivars]) > 10:
+                    self.distintos[ivars] = None
+            self.sketches.setdefault(ivars, SketchQuantis(self.k)).atualizar(df[ivars].to_numpy())
+        return self
+
+    def fixar_cortes(self) -> dict:
+        """
+        Fixa os cortes das variáveis contínuas a partir dos sketches.
+        """
+        q = np.linspace(0, 1, self.bins + 1)
+        self.cortes = {
+            ivars: np.unique(sketch.quantis(q))
+            for ivars, sketch in self.sketches.items()
+            if self.distintos[ivars] is None
+        }
+        return self.cortes
+
+    def contar(self, df: pd.DataFrame) -> "AcumuladorIV":
+        """
+        2ª passada: acumula N e eventos por faixa com um bloco.
+        """
+        if self.cortes is None:
+            raise ValueError("Cortes não fixados: rode `observar` em todos os blocos e depois `fixar_cortes`.")
+        self._registrar(df)
+        y = df[self.target].to_numpy()
+
+        for ivars in self.variaveis:
+            if ivars not in df.columns:
+                continue
+            if ivars in self.cortes:
+                codigos, _ = _codigos_iv(df[ivars], self.cortes[ivars])
+                validos = codigos >= 0
+                tamanho = len(self.cortes[ivars]) - 1
+                parcial = {
+                    'N': np.bincount(codigos[validos], minlength=tamanho),
+                    'Eventos': np.bincount(codigos[validos], weights=y[validos], minlength=tamanho),
+                }
+            else:
+                grupos = pd.DataFrame({'x': df[ivars], 'y': y}).groupby('x', observed=False)['y'].agg(['count', 'sum'])
+                parcial = {valor: np.array([n, ev]) for valor, n, ev in zip(grupos.index, grupos['count'], grupos['sum'])}
+            self._somar(ivars, parcial)
+        return self
+
+    def _somar(self, ivars: str, parcial: dict) -> None:
+        atual = self.contagens.setdefault(ivars, {})
+        for chave, valor in parcial.items():
+            atual[chave] = atual[chave] + valor if chave in atual else valor
+
+    def combinar(self, outro: "AcumuladorIV") -> "AcumuladorIV":
+        """
+        Soma a este acumulador os sketches e as contagens de outro (blocos ou processos
+        diferentes, com os mesmos cortes na 2ª passada).
+        """
+        for ivars in outro.variaveis:
+            if ivars not in self.variaveis:
+                self.variaveis.append(ivars)
+                self.distintos[ivars] = set()
+            # None = já passou de 10 valores distintos em algum dos dois
+            meus, deles = self.distintos[ivars], outro.distintos.get(ivars, set())
+            juntos = None if meus is None or deles is None else meus | deles
+            self.distintos[ivars] = None if juntos is None or len(juntos) > 10 else juntos
+            if ivars in outro.sketches:
+                self.sketches.setdefault(ivars, SketchQuantis(self.k)).combinar(outro.sketches[ivars])
+            for chave, valor in outro.contagens.get(ivars, {}).items():
+                self._somar(ivars, {chave: valor})
+        return self
+
+    def resultado(self, show_woe: bool = False, show_iv: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Tabelas de IV e WoE no formato de `iv_woe`.
+        """
+        if self.cortes is None:
+            self.fixar_cortes()
+
+        rotulos, tamanhos, N, eventos = [], [], [], []
+        for ivars in self.variaveis:
+            contagem = self.contagens.get(ivars, {})
+            if ivars in self.cortes:
+                _, r = _codigos_iv(pd.Series([], dtype=np.float64), self.cortes[ivars])
+                rotulos.extend(r)
+                N.append(contagem.get('N', np.zeros(len(r))))
+                eventos.append(contagem.get('Eventos', np.zeros(len(r))))
+                tamanhos.append(len(r))
+            else:
+                chaves = sorted(contagem)
+                rotulos.extend(chaves)
+                N.append(np.array([contagem[c][0] for c in chaves]))
+                eventos.append(np.array([contagem[c][1] for c in chaves]))
+                tamanhos.append(len(chaves))
+
+        N = np.concatenate(N).astype(np.int64) if N else np.empty(0, dtype=np.int64)
+        eventos = np.concatenate(eventos) if eventos else np.empty(0)
+        if np.all(eventos == np.round(eventos)):
+            eventos = eventos.astype(np.int64)
+        return _tabelas_iv(self.variaveis, tamanhos, rotulos, N, eventos, show_woe, show_iv)
+
+
+def iv_woe_streaming(
+    blocos,
+    target: str,
+    bins: int = 10,
+    k: int = 2048,
+    show_woe: bool = False,
+    show_iv: bool = False
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    IV / WoE sobre uma base lida em blocos, sem carregá-la inteira (ver AcumuladorIV).
+
+    Parâmetros:
+    -----------
+    blocos : Callable[[], Iterable[pd.DataFrame]]
+        Função que devolve um iterador novo de blocos a cada chamada (a base é percorrida
+        duas vezes), por exemplo `lambda: carregar_dataset(colunas=..., chunksize=200_000)`.
+    target : str
+        Variável alvo binária (0/1).
+    bins : int, opcional (default=10)
+        Quantidade de faixas das variáveis contínuas.
+    k : int, opcional (default=2048)
+        Capacidade dos sketches de quantis.
+    show_woe, show_iv : bool, opcional (default=False)
+        Exibem as tabelas, como em `iv_woe`.
+
+    Retorno:
+    --------
+    Tuple[pd.DataFrame, pd.DataFrame]
+        newDF (IV por variável) e woeDF (WoE por faixa), no formato de `iv_woe`.
+    """
+    acumulador = AcumuladorIV(target, bins, k)
+    for bloco in blocos():
+        acumulador.observar(bloco)
+    acumulador.fixar_cortes()
+    for bloco in blocos():
+        acumulador.contar(bloco)
+    return acumulador.resultado(show_woe, show_iv)
+
+
+#################################################
+#        CUBO DA DISTRIBUIÇÃO BIVARIADA         #
+#################################################
+def cubo_bivariado(
+    df: pd.DataFrame,
+    target: str,
+    variaveis: Optional[List[str]] = None,
+    bins: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Pré-calcula, para várias variáveis de uma vez, a quantidade de linhas e de eventos em
+    cada categoria: um cubo compacto (variável, categoria) que `plot_distribuicao_bivariada`
+    usa no lugar de um `groupby` sobre a base inteira por gráfico.
+
+    As categorias de todas as variáveis recebem uma numeração única e as contagens saem de
+    uma única redução (`np.bincount`). Nulos formam uma categoria própria, como no
+    `groupby` do gráfico depois de `astype(str)`.
+
+    Parâmetros:
+    -----------
+    df : pd.DataFrame
+        Base com as variáveis e o alvo.
+    target : str
+        Variável alvo binária (0/1).
+    variaveis : List[str], opcional (default=None)
+        Variáveis do cubo. Se None, todas as colunas exceto o alvo.
+    bins : int, opcional (default=None)
+        Se informado, variáveis numéricas com mais de `bins` valores distintos são cortadas
+        em `bins` faixas de quantis (mesmos cortes de `iv_woe`).
+
+    Retorno:
+    --------
+    pd.DataFrame
+        Colunas "variavel", "categoria", "quantidade" e `target` (quantidade de eventos).
+    """
+    variaveis = variaveis or [col for col in df.columns if col != target]
+    y = df[target].to_numpy()
+
+    codigos, rotulos, nomes = [], [], []
+    deslocamento = 0
+    for var in variaveis:
+        serie = df[var]
+        if bins and serie.dtype.kind in 'bifc' and serie.nunique() > bins:
+            cortes = np.unique(np.nanquantile(serie.to_numpy(dtype=np.float64), np.linspace(0, 1, bins + 1)))
+            c, r = _codigos_iv(serie, cortes)
+            if (c < 0).any():
+                c = np.where(c < 0, len(r), c)
+                r = r + [np.nan]
         else:
-            d0 = pd.DataFrame({'x': data[ivars], 'y': data[target]})
-        
-        d = d0.groupby('x', as_index=False).agg({'y': ['count', 'sum']})
-        d.columns = ['Corte', 'N', 'Eventos']
-        d['% de Eventos'] = np.maximum(d['Eventos'], 0.5) / d['Eventos'].sum()
-        d['Nao-Eventos'] = d['N'] - d['Eventos']
-        d['% de Nao-Eventos'] = np.maximum(d['Nao-Eventos'], 0.5) / d['Nao-Eventos'].sum()
-        d['WoE'] = np.log(d['% de Eventos'] / d['% de Nao-Eventos'])
-        d['IV'] = d['WoE'] * (d['% de Eventos'] - d['% de Nao-Eventos'])
-        d.insert(loc=0, column='Variavel', value=ivars)
-
-        if show_iv == True:
-            iv_value = round(d["IV"].sum(), 6)
-            print(f'\033[mInformation Value de \033[1m{ivars} \033[mé \033[1;34m{iv_value}')
-
-            #print(f'\033[mInformation Value de \033[1m{ivars} \033[mé \033[1;34m{str(round(d['IV'].sum(),6))}')
-        
-        temp = pd.DataFrame({'Variavel' : [ivars], "IV": [d["IV"].sum()]}, columns = ['Variavel', 'IV'])
-        newDF = pd.concat([newDF, temp], axis=0)
-        woeDF = pd.concat([woeDF, d], axis=0)
-
-        # Show WOE Table
-        if show_woe == True:
-            print(d)
-    return newDF, woeDF
+            c, uniques = pd.factorize(serie, sort=True, use_na_sentinel=False)
+            r = list(uniques)
+
+        codigos.append(c + deslocamento)
+        rotulos.extend(r)
+        nomes.extend([var] * len(r))
+        deslocamento += len(r)
+
+    faixas = np.stack(codigos, axis=1).ravel() if codigos else np.empty(0, dtype=np.int64)
+    quantidade = np.bincount(faixas, minlength=deslocamento)
+    eventos = np.bincount(faixas, weights=np.repeat(y, len(variaveis)), minlength=deslocamento)
+    if y.dtype.kind in 'biu':
+        eventos = eventos.astype(np.int64)
+
+    return pd.DataFrame({
+        'variavel': nomes,
+        'categoria': pd.Series(rotulos, dtype=object),
+        'quantidade': quantidade,
+        target: eventos,
+    })
 
 
 #################################################
@@ -180,16 +624,126 @@ print(importancias)
 """
 
 def get_feature_importances(database, target_variable, features, discrete_features = 'auto'):
+    # mesma chamada de sempre, agora passando pelo cache de `ranking_mi`
+    return ranking_mi(database, target_variable, features, discrete_features)['mi'].reindex(features)
+
+
+# resultados de `ranking_mi` já calculados, por impressão digital dos dados e parâmetros
+_CACHE_MI: dict = {}
+
+
+def _chave_mi(database: pd.DataFrame, colunas: List[str], *parametros) -> str:
+    import hashlib
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(database[colunas], index=False).to_numpy().tobytes())
+    h.update(repr((colunas, parametros)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _subamostra_estratificada(y: np.ndarray, tamanho: int, rng: np.random.Generator) -> np.ndarray:
+    # sorteia sem reposição mantendo a proporção de cada classe
+    indices = []
+    for classe in np.unique(y):
+        linhas = np.flatnonzero(y == classe)
+        k = max(1, int(round(tamanho * len(linhas) / len(y))))
+        indices.append(rng.choice(linhas, size=min(k, len(linhas)), replace=False))
+    return np.sort(np.concatenate(indices))
+
+
+def ranking_mi(
+    database: pd.DataFrame,
+    target_variable: str,
+    features: List[str],
+    discrete_features: Union[str, List[str]] = 'auto',
+    amostra: Optional[Union[int, float]] = None,
+    n_bootstrap: int = 0,
+    n_jobs: Optional[int] = -1,
+    random_state: int = 42,
+    usar_cache: bool = True
+) -> pd.DataFrame:
+    """
+    Ranking de Informação Mútua das variáveis com a variável alvo, com o cálculo por
+    variável distribuído entre processos (`n_jobs` do `mutual_info_classif`), estimativa
+    opcional numa subamostra estratificada e intervalos de confiança.
+
+    Os resultados ficam em cache na sessão, pela impressão digital dos dados (conteúdo das
+    colunas usadas) e dos parâmetros; chamar de novo com os mesmos dados, como ao refazer
+    um gráfico, não recalcula nada.
+
+    Parâmetros:
+    -----------
+    database : pd.DataFrame
+        DataFrame contendo as variáveis preditoras e a variável alvo.
+    target_variable : str
+        Nome da variável alvo.
+    features : List[str]
+        Variáveis preditoras a serem analisadas.
+    discrete_features : str ou List[str], opcional (default='auto')
+        Como em `get_feature_importances`.
+    amostra : int ou float, opcional (default=None)
+        Tamanho (linhas) ou fração da subamostra estratificada. Se None, usa todas as linhas.
+    n_bootstrap : int, opcional (default=0)
+        Quantidade de reamostragens para o intervalo de 95%. Cada uma usa m = n/2 linhas,
+        sorteadas sem reposição por classe: com reposição, as linhas repetidas viram vizinhas
+        a distância zero no estimador por k vizinhos e inflam a MI. É a correção "m de n"
+        da subamostragem: os desvios de cada reamostra em relação à média das reamostras
+        (o que tira o viés do estimador com menos linhas) são multiplicados por sqrt(m/n),
+        pois a dispersão numa amostra de m linhas é maior que na de n, e somados a `mi`.
+    n_jobs : int, opcional (default=-1)
+        Processos usados por `mutual_info_classif` (-1 = todos os núcleos).
+    random_state : int, opcional (default=42)
+        Semente da subamostra, das reamostragens e do estimador.
+    usar_cache : bool, opcional (default=True)
+        Se True, reaproveita resultados já calculados para os mesmos dados e parâmetros.
+
+    Retorno:
+    --------
+    pd.DataFrame
+        Índice = variáveis, em ordem decrescente de MI; coluna "mi" e, com `n_bootstrap`,
+        "ic_inf" e "ic_sup".
+    """
+    colunas = list(features) + [target_variable]
+    chave = _chave_mi(database, colunas, discrete_features, amostra, n_bootstrap, random_state) if usar_cache else None
+    if chave in _CACHE_MI:
+        return _CACHE_MI[chave].copy()
+
     if discrete_features != 'auto':
         discrete_features = [x in discrete_features for x in features]
 
-    importances = mutual_info_classif(
-        database[features],
-        database[target_variable],
-        discrete_features = discrete_features
-    )
+    X = database[features]
+    y = database[target_variable].to_numpy()
+    rng = np.random.default_rng(random_state)
+
+    if amostra is not None:
+        tamanho = int(amostra * len(y)) if isinstance(amostra, float) else int(amostra)
+        linhas = _subamostra_estratificada(y, min(tamanho, len(y)), rng)
+        X, y = X.iloc[linhas], y[linhas]
+
+    from sklearn.feature_selection import mutual_info_classif
+
+    def calcular(X_, y_):
+        return mutual_info_classif(
+            X_, y_, discrete_features=discrete_features, n_jobs=n_jobs, random_state=random_state
+        )
+
+    resultado = pd.DataFrame({'mi': calcular(X, y)}, index=features)
+
+    if n_bootstrap:
+        m = len(y) // 2
+        reamostras = np.array([
+            calcular(X.iloc[linhas], y[linhas])
+            for linhas in (_subamostra_estratificada(y, m, rng) for _ in range(n_bootstrap))
+        ])
+        # desvios em torno da média das reamostras, reescalados de m para n linhas
+        desvios = (reamostras - reamostras.mean(axis=0)) * np.sqrt(m / len(y))
+        resultado['ic_inf'] = np.maximum(resultado['mi'] + np.percentile(desvios, 2.5, axis=0), 0)
+        resultado['ic_sup'] = resultado['mi'] + np.percentile(desvios, 97.5, axis=0)
 
-    return pd.Series(importances, features)
+    resultado = resultado.sort_values('mi', ascending=False)
+    if chave is not None:
+        _CACHE_MI[chave] = resultado.copy()
+    return resultado
 
 
 
@@ -198,7 +752,7 @@ def get_feature_importances(database, target_variable, features, discrete_featur
 #######################################
 import pandas as pd
 
-def agrupar_prazo(df: pd.DataFrame, forma_pgto: str) -> pd.DataFrame:
+def agrupar_prazo(df: pd.DataFrame, forma_pgto: str, usar_memo: bool = True) -> pd.Series:
     """
     Agrupa as formas de pagamento por prazo médio e retorna um DataFrame com os valores agrupados.
 
@@ -208,11 +762,13 @@ def agrupar_prazo(df: pd.DataFrame, forma_pgto: str) -> pd.DataFrame:
         DataFrame contendo os dados a serem processados.
     forma_pgto : str
         Nome da coluna que contém as formas de pagamento.
+    usar_memo : bool, opcional (default=True)
+        Se True, reaproveita as classificações já feitas em chamadas anteriores.
 
     Retorno:
     --------
-    pd.DataFrame
-        O DataFrame original com uma nova coluna "prazo_pagamento" contendo os valores agrupados.
+    pd.Series
+        Série categórica (pd.Categorical) com os valores agrupados, no mesmo índice de `df`.
     
     Agrupamentos:
     -------------
@@ -225,38 +781,8 @@ def agrupar_prazo(df: pd.DataFrame, forma_pgto: str) -> pd.DataFrame:
     - "Outros" → Casos em que não foi possível identificar o prazo.
     """
 
-    def classificar_prazo(fp):
-        # Verificar se o valor está ausente (nan, "", "none")
-        if pd.isna(fp) or str(fp).strip().lower() in ["nan", "", "none"]:
-            return "Desconhecido"
-        
-        # Verificar se o pagamento é explicitamente ausente
-        if str(fp).strip().lower() in ["nenhum", "sem pagamento"]:
-            return "Sem pagamento"
-
-        # Converter para string e substituir "x" por "/" para padronizar
-        prazos = [int(x) for x in str(fp).replace("x", "/").split("/") if x.isdigit()]
-
-        # Se não houver prazos identificáveis, classificar como "Outros"
-        if not prazos:
-            return "Outros"
-
-        # Calcular o prazo médio
-        prazo_medio = sum(prazos) / len(prazos)
-
-        # Definir categorias de prazo
-        if len(prazos) == 1 and prazo_medio <= 15:
-            return "À vista (até 15 dias)"
-        elif prazo_medio <= 30:
-            return "Curto prazo (16-30 dias)"
-        elif prazo_medio <= 90:
-            return "Médio prazo (31-90 dias)"
-        else:
-            return "Longo prazo (+90 dias)"
-    
-    # Criar e retornar nova coluna no DataFrame com os valores agrupados
-    
-    return df[forma_pgto].apply(classificar_prazo)
+    # cada valor distinto é classificado uma única vez e o rótulo volta para as linhas
+    return agrupar_valores(df[forma_pgto], classificar_prazo, CATEGORIAS_PRAZO, usar_memo)
 
 
 
@@ -267,8 +793,9 @@ def agrupar_prazo(df: pd.DataFrame, forma_pgto: str) -> pd.DataFrame:
 import pandas as pd
 
 def agrupar_tipo_sociedade(df: pd.DataFrame, 
-                           tipo_sociedade: str
-) -> pd.DataFrame:
+                           tipo_sociedade: str,
+                           usar_memo: bool = True
+) -> pd.Series:
     """
     Agrupa os tipos de sociedade em categorias mais amplas e retorna um DataFrame com os valores agrupados.
 
@@ -278,11 +805,13 @@ def agrupar_tipo_sociedade(df: pd.DataFrame,
         DataFrame contendo os dados a serem processados.
     tipo_sociedade : str
         Nome da coluna que contém os tipos de sociedade.
+    usar_memo : bool, opcional (default=True)
+        Se True, reaproveita as classificações já feitas em chamadas anteriores.
 
     Retorno:
     --------
-    pd.DataFrame
-        O DataFrame original com uma nova coluna "{tipo_sociedade}_agrup" contendo os valores agrupados.
+    pd.Series
+        Série categórica (pd.Categorical) com os valores agrupados, no mesmo índice de `df`.
 
     Agrupamentos:
     -------------
@@ -296,32 +825,8 @@ def agrupar_tipo_sociedade(df: pd.DataFrame,
     - "Desconhecido" → Valores ausentes (nan, "", "none").
     """
 
-    def classificar_sociedade(tipo):
-        # Verificar se o valor está ausente (nan, "", "none")
-        if pd.isna(tipo) or str(tipo).strip().lower() in ["nan", "", "none"]:
-            return "Desconhecido"
-
-        # Normalizar para minúsculo
-        tipo = str(tipo).strip().lower()
-
-        # Classificar os tipos de sociedade
-        if "limitada" in tipo:
-            return "Sociedade Limitada"
-        elif "individual" in tipo:
-            return "Empresa Individual"
-        elif "mei" in tipo:
-            return "Microempreendedor (MEI)"
-        elif "anonima" in tipo:
-            return "Sociedade Anônima"
-        elif "cooperativa" in tipo or "associacao" in tipo or "sindical" in tipo:
-            return "Cooperativas & Associações"
-        elif "municipio" in tipo or "fundacao" in tipo or "mista" in tipo or "religiosa" in tipo:
-            return "Organizações Públicas & Fundações"
-        else:
-            return "Outros"
-
-      # Criar nova coluna no DataFrame com os valores agrupados
-    return df[tipo_sociedade].apply(classificar_sociedade)
+    # cada valor distinto é classificado uma única vez e o rótulo volta para as linhas
+    return agrupar_valores(df[tipo_sociedade], classificar_sociedade, CATEGORIAS_SOCIEDADE, usar_memo)
 
 
 
@@ -333,8 +838,9 @@ def agrupar_tipo_sociedade(df: pd.DataFrame,
 import pandas as pd
 
 def agrupar_atividade_principal(df: pd.DataFrame, 
-                                atividade_col: str
-) -> pd.DataFrame:
+                                atividade_col: str,
+                                usar_memo: bool = True
+) -> pd.Series:
     """
     Agrupa as atividades principais em categorias mais amplas e retorna um DataFrame com os valores agrupados.
 
@@ -344,11 +850,13 @@ def agrupar_atividade_principal(df: pd.DataFrame,
         DataFrame contendo os dados a serem processados.
     atividade_col : str
         Nome da coluna que contém as atividades principais.
+    usar_memo : bool, opcional (default=True)
+        Se True, reaproveita as classificações já feitas em chamadas anteriores.
 
     Retorno:
     --------
-    pd.DataFrame
-        O DataFrame original com uma nova coluna "{atividade_col}_agrup" contendo os valores agrupados.
+    pd.Series
+        Série categórica (pd.Categorical) com os valores agrupados, no mesmo índice de `df`.
 
     Agrupamentos:
     -------------
@@ -363,46 +871,14 @@ def agrupar_atividade_principal(df: pd.DataFrame,
     - "Desconhecido" → Valores ausentes (nan, "", "none").
     """
 
-    def classificar_atividade(atividade):
-        # Verificar se o valor está ausente (nan, "", "none")
-        if pd.isna(atividade) or str(atividade).strip().lower() in ["nan", "", "none"]:
-            return "Desconhecido"
-
-        # Normalizar para minúsculo
-        atividade = str(atividade).strip().lower()
-
-        # Classificar as atividades em grandes grupos
-        if "comércio" in atividade or "varejo" in atividade or "atacado" in atividade or "distribuição" in atividade or 'com de' in atividade:
-            return "Comércio"
-        elif "indústria" in atividade or "fábrica" in atividade or "produção" in atividade or 'ind de' in atividade:
-            return "Indústria"
-        elif "serviço" in atividade or "consultoria" in atividade or "tecnologia" in atividade or "transporte" in atividade or "advocacia" in atividade:
-            return "Serviços"
-        elif "construção" in atividade or "engenharia" in atividade or "arquitetura" in atividade:
-            return "Construção Civil"
-        elif "agricultura" in atividade or "pecuária" in atividade or "rural" in atividade:
-            return "Agronegócio"
-        elif "educação" in atividade or "escola" in atividade or "curso" in atividade or "treinamento" in atividade:
-            return "Educação"
-        elif "saúde" in atividade or "hospital" in atividade or "clínica" in atividade or "farmácia" in atividade:
-            return "Saúde"
-        elif 'entidades sem fins lucrativos' in atividade:
-            return 'OSC'
-        elif 'transporte' in atividade:
-            return "Transporte"
-        elif 'serv de selecao e administracao de pessoal' in atividade:
-            return 'RH'
-        else:
-            return "Outros"
-
-    # retornar nova coluna no DataFrame com os valores agrupados
-    return df[atividade_col].apply(classificar_atividade)
+    # cada valor distinto é classificado uma única vez e o rótulo volta para as linhas
+    return agrupar_valores(df[atividade_col], classificar_atividade, CATEGORIAS_ATIVIDADE, usar_memo)
 
 #############################################
 #     AGRUPAR TIPOS DE COMÉRCIO             #
 #############################################
 
-def agrupar_tipo_comercio(df: pd.DataFrame, coluna: str) -> pd.DataFrame:
+def agrupar_tipo_comercio(df: pd.DataFrame, coluna: str, usar_memo: bool = True) -> pd.Series:
     """
     Agrupa os tipos de comércio por categorias similares e retorna um DataFrame atualizado.
 
@@ -412,11 +888,13 @@ def agrupar_tipo_comercio(df: pd.DataFrame, coluna: str) -> pd.DataFrame:
         DataFrame contendo os dados a serem processados.
     coluna : str
         Nome da coluna que contém as descrições do comércio.
+    usar_memo : bool, opcional (default=True)
+        Se True, reaproveita as classificações já feitas em chamadas anteriores.
 
     Retorno:
     --------
-    pd.DataFrame
-        O DataFrame original com uma nova coluna "{coluna}_agrup" contendo os valores agrupados.
+    pd.Series
+        Série categórica (pd.Categorical) com os valores agrupados, no mesmo índice de `df`.
 
     Agrupamentos:
     -------------
@@ -432,38 +910,8 @@ def agrupar_tipo_comercio(df: pd.DataFrame, coluna: str) -> pd.DataFrame:
     - "Outros" → Tipos não categorizados.
     """
 
-    def classificar_comercio(comercio):
-        # Verificar se o valor está ausente
-        if pd.isna(comercio) or str(comercio).strip().lower() in ["nan", "", "none"]:
-            return "Desconhecido"
-
-        # Normalizar para minúsculo
-        comercio = str(comercio).strip().lower()
-
-        # Classificação por similaridade
-        if "informatica" in comercio or "eletron" in comercio or "telefones" in comercio:
-            return "Tecnologia & Eletrônicos"
-        elif "livros" in comercio or "revistas" in comercio or "jornais" in comercio:
-            return "Livros & Papelaria"
-        elif "moveis" in comercio or "decoracao" in comercio or "estofados" in comercio:
-            return "Móveis & Decoração"
-        elif "confeccoes" in comercio or "calcados" in comercio or "tecidos" in comercio:
-            return "Moda & Vestuário"
-        elif "auto pecas" in comercio or "pneus" in comercio or "motocicletas" in comercio or "tratores" in comercio or "veiculos" in comercio:
-            return "Automotivo"
-        elif "medico" in comercio or "hospitalar" in comercio or "ortopedicos" in comercio or "odontologicos" in comercio:
-            return "Saúde & Ortopedia"
-        elif "construcao" in comercio or "ferragens" in comercio or "tintas" in comercio:
-            return "Construção & Ferragens"
-        elif "alimentos" in comercio or "bebidas" in comercio or "paes" in comercio or "doces" in comercio:
-            return "Alimentação & Bebidas"
-        elif "esportivos" in comercio or "brinquedos" in comercio or "bicicletas" in comercio:
-            return "Esportes & Lazer"
-        else:
-            return "Outros"
-
-    # Retornar df com os valores novos
-    return df[coluna].apply(classificar_comercio)
+    # cada valor distinto é classificado uma única vez e o rótulo volta para as linhas
+    return agrupar_valores(df[coluna], classificar_comercio, CATEGORIAS_COMERCIO, usar_memo)
 
 
 
@@ -471,8 +919,9 @@ def agrupar_tipo_comercio(df: pd.DataFrame, coluna: str) -> pd.DataFrame:
 #       AGRUPAR OPÇÃO TRIBUTÁRIA      #
 #######################################
 def agrupar_opcao_tributaria(df: pd.DataFrame, 
-                             opcao_tributaria: str
-) -> pd.DataFrame:
+                             opcao_tributaria: str,
+                             usar_memo: bool = True
+) -> pd.Series:
     """
     Agrupa as opções tributárias em categorias mais amplas e retorna um DataFrame com os valores agrupados.
 
@@ -482,11 +931,13 @@ def agrupar_opcao_tributaria(df: pd.DataFrame,
         DataFrame contendo os dados a serem processados.
     opcao_tributaria : str
         Nome da coluna que contém as opções tributárias.
+    usar_memo : bool, opcional (default=True)
+        Se True, reaproveita as classificações já feitas em chamadas anteriores.
 
     Retorno:
     --------
-    pd.DataFrame
-        O DataFrame original com uma nova coluna "{opcao_tributaria}_agrup" contendo os valores agrupados.
+    pd.Series
+        Série categórica (pd.Categorical) com os valores agrupados, no mesmo índice de `df`.
 
     Agrupamentos:
     -------------
@@ -498,26 +949,6 @@ def agrupar_opcao_tributaria(df: pd.DataFrame,
     - "Desconhecido" → Valores ausentes (nan, "", "none").
     """
 
-    def classificar_opcao_tributaria(opcao):
-        # Verificar se o valor está ausente (nan, "", "none")
-        if pd.isna(opcao) or str(opcao).strip().lower() in ["nan", "", "none"]:
-            return "Desconhecido"
-
-        # Normalizar para minúsculo
-        opcao = str(opcao).strip().lower()
-
-        # Classificar as opções tributárias
-        if "simples" in opcao:
-            return "Simples Nacional"
-        elif "presumido" in opcao:
-            return "Lucro Presumido"
-        elif "real" in opcao:
-            return "Lucro Real"
-        elif "mei" in opcao:
-            return "MEI"
-        else:
-            return "Outros"
-
-    # Retorna o DataFrame com os valores agrupados
-    return df[opcao_tributaria].apply(classificar_opcao_tributaria)
+    # cada valor distinto é classificado uma única vez e o rótulo volta para as linhas
+    return agrupar_valores(df[opcao_tributaria], classificar_opcao_tributaria, CATEGORIAS_OPCAO_TRIBUTARIA, usar_memo)
     
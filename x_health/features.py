@@ -1,29 +1,448 @@
+from functools import lru_cache
+import json
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 
+import numpy as np
+import pandas as pd
 import typer
 from loguru import logger
-from tqdm import tqdm
 
-from x_health.config import PROCESSED_DATA_DIR
+from x_health.agrupamentos import COLUNAS_PRAZO, classificar_prazo, extrair_prazos, prazos_pagamento
+from x_health.config import MODELS_DIR, PROCESSED_DATA_DIR, configurar
+from x_health.dataset import DATASET_PATH, carregar_dataset
 
 app = typer.Typer()
 
 
+# colunas utilizadas pelo modelo, na ordem em que foi treinado
+COLUNAS_MODELO = [
+    'flag_valor_vencido',
+    'quant_protestos',
+    'default_3months',
+    'opcao_tributaria',
+    'razao_valor_vencido',
+    'forma_pagamento_agrup',
+    'periodo_fiscal',
+    'ioi_3months',
+    'historico_pagamento',
+]
+
+# colunas categóricas codificadas por `tratar_categoricas` no treino
+COLUNAS_CATEGORICAS = ['opcao_tributaria', 'forma_pagamento_agrup', 'periodo_fiscal']
+
+# código atribuído a categorias que não existiam no treino: valor ausente, para que o
+# XGBoost as mande pela direção padrão (default_left) de cada split, em vez de tratá-las
+# como um código menor que todos os conhecidos (o que as pontuaria como a 1ª categoria)
+CODIGO_DESCONHECIDO = np.nan
+
+# colunas derivadas e as colunas brutas necessárias para calculá-las
+DERIVACOES = {
+    'flag_valor_vencido': ['valor_vencido'],
+    'periodo_fiscal': ['month'],
+    'razao_valor_vencido': ['valor_vencido', 'valor_quitado'],
+    'historico_pagamento': ['valor_vencido', 'valor_quitado'],
+    'forma_pagamento_agrup': ['forma_pagamento'],
+    **{col: ['forma_pagamento'] for col in COLUNAS_PRAZO},
+}
+
+# atributo do Booster em que o pipeline é gravado junto com o modelo
+ATRIBUTO_PIPELINE = 'pipeline_features'
+
+
+#######################################
+#     VOCABULÁRIOS DAS CATEGÓRICAS    #
+#######################################
+def ajustar_vocabularios(
+    df: pd.DataFrame,
+    colunas: List[str] = COLUNAS_CATEGORICAS
+) -> Dict[str, List[str]]:
+    """
+    Extrai o vocabulário de cada coluna categórica, na mesma ordem usada pelo LabelEncoder
+    em `tratar_categoricas` (valores ordenados, nulos preenchidos com "Desconhecido").
+
+    Parâmetros:
+    -----------
+    df : pd.DataFrame
+        DataFrame de treino, com as colunas categóricas ainda em texto.
+    colunas : List[str], opcional (default=COLUNAS_CATEGORICAS)
+        Colunas categóricas cujos vocabulários serão extraídos.
+
+    Retorno:
+    --------
+    Dict[str, List[str]]
+        Dicionário {coluna: categorias}, em que a posição de cada categoria é o seu código.
+    """
+    return {
+        col: sorted(df[col].astype(object).fillna("Desconhecido").astype(str).unique().tolist())
+        for col in colunas
+    }
+
+
+def _codificar(serie: pd.Series, categorias: List[str]) -> np.ndarray:
+    # Categorical faz a busca de todos os valores de uma vez; fora do vocabulário vira -1,
+    # trocado em seguida por CODIGO_DESCONHECIDO
+    valores = serie.astype(object).fillna("Desconhecido").astype(str)
+    codigos = pd.Categorical(valores, categories=categorias).codes
+    return np.where(codigos >= 0, codigos, CODIGO_DESCONHECIDO).astype(np.float32)
+
+
+def _nulo(valor: object) -> bool:
+    return valor is None or valor is pd.NA or (isinstance(valor, float) and valor != valor)
+
+
+def _numero(valor: object) -> np.float64:
+    # nulos viram NaN, que o XGBoost trata como valor ausente; np.float64 mantém a
+    # aritmética dos arrays de `_valores` (divisão por zero dá inf em vez de exceção)
+    return np.float64(np.nan if _nulo(valor) else valor)
+
+
+def codificar_categoricas(
+    df: pd.DataFrame,
+    vocabularios: Dict[str, List[str]]
+) -> pd.DataFrame:
+    """
+    Codifica as colunas categóricas com vocabulários já ajustados, coluna a coluna e sem
+    ajustar nenhum encoder. Categorias ausentes do vocabulário recebem CODIGO_DESCONHECIDO.
+
+    Parâmetros:
+    -----------
+    df : pd.DataFrame
+        DataFrame com as colunas categóricas em texto. É alterado no próprio objeto.
+    vocabularios : Dict[str, List[str]]
+        Vocabulários gerados por `ajustar_vocabularios`.
+
+    Retorno:
+    --------
+    pd.DataFrame
+        O mesmo DataFrame, com as colunas categóricas convertidas em códigos (float32, para
+        comportar CODIGO_DESCONHECIDO).
+    """
+    for col, categorias in vocabularios.items():
+        df[col] = _codificar(df[col], categorias)
+
+    return df
+
+
+def salvar_vocabularios(vocabularios: Dict[str, List[str]], caminho: Path) -> None:
+    """
+    Salva os vocabulários em JSON, ao lado do modelo treinado.
+    """
+    with open(caminho, "w", encoding="utf-8") as file:
+        json.dump(vocabularios, file, indent=4, ensure_ascii=False)
+
+    logger.info(f"Vocabulários salvos em: {caminho}")
+
+
+@lru_cache(maxsize=None)
+def _ler_vocabularios(caminho: str) -> Dict[str, List[str]]:
+    with open(caminho, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def carregar_vocabularios(caminho: Path = MODELS_DIR / "vocabularios.json") -> Dict[str, List[str]]:
+    """
+    Carrega os vocabulários salvos no treino. A leitura do arquivo acontece uma única vez
+    por processo; chamadas seguintes reaproveitam o conteúdo em memória.
+    """
+    return _ler_vocabularios(str(caminho))
+
+
+#######################################
+#         PIPELINE DE FEATURES        #
+#######################################
+class FeaturePipeline:
+    """
+    Pipeline único de criação de features, usado tanto no treino quanto na predição.
+
+    `fit` aprende apenas os vocabulários das categóricas; `transform` calcula todas as
+    features de uma vez, direto sobre os arrays numpy das colunas, e devolve a matriz
+    float32 na ordem de `colunas`. Cada feature é lida pronta quando já vem na entrada
+    (caso do JSON de predição) ou derivada das colunas brutas (caso da base de treino):
+
+    - flag_valor_vencido ← valor_vencido > 0
+    - periodo_fiscal ← trimestre de `month` ("1T" a "4T")
+    - razao_valor_vencido ← valor_vencido / (valor_quitado + 1)
+    - historico_pagamento ← valor_quitado / (valor_quitado + valor_vencido + 1)
+    - forma_pagamento_agrup e prazos numéricos ← `extrair_prazos(forma_pagamento)`
+
+    O pipeline é serializado em JSON e gravado como atributo do Booster, de modo que o
+    artefato do modelo carrega consigo as features com que foi treinado.
+
+    Parâmetros:
+    -----------
+    colunas : List[str], opcional (default=COLUNAS_MODELO)
+        Colunas do modelo, na ordem da matriz de saída.
+    vocabularios : Dict[str, List[str]], opcional (default=None)
+        Vocabulários das categóricas; preenchidos por `fit` quando não informados.
+    """
+
+    def __init__(
+        self,
+        colunas: Optional[List[str]] = None,
+        vocabularios: Optional[Dict[str, List[str]]] = None
+    ):
+        self.colunas = list(colunas or COLUNAS_MODELO)
+        self.vocabularios = vocabularios or {}
+
+    def _valores(self, df: pd.DataFrame) -> Dict[str, object]:
+        """
+        Devolve {coluna: valores} para cada coluna do modelo, ainda sem codificar as categóricas.
+        """
+        valores: Dict[str, object] = {}
+        prazos = None
+
+        for col in self.colunas:
+            if col in df.columns:
+                valores[col] = df[col]
+
+            elif col in ['forma_pagamento_agrup'] + COLUNAS_PRAZO:
+                if prazos is None:
+                    prazos = extrair_prazos(df['forma_pagamento'])
+                valores[col] = prazos[col]
+
+            elif col == 'flag_valor_vencido':
+                valores[col] = df['valor_vencido'].to_numpy(dtype=np.float64) > 0
+
+            elif col == 'razao_valor_vencido':
+                vencido = df['valor_vencido'].to_numpy(dtype=np.float64)
+                quitado = df['valor_quitado'].to_numpy(dtype=np.float64)
+                valores[col] = vencido / (quitado + 1)
+
+            elif col == 'historico_pagamento':
+                vencido = df['valor_vencido'].to_numpy(dtype=np.float64)
+                quitado = df['valor_quitado'].to_numpy(dtype=np.float64)
+                valores[col] = quitado / (quitado + vencido + 1)
+
+            elif col == 'periodo_fiscal':
+                # meses fora de 1-12 (inclusive nulos) caem no 4T, como no agrupamento original
+                mes = df['month'].to_numpy(dtype=np.float64)
+                trimestre = np.select([mes <= 3, mes <= 6, mes <= 9], [0, 1, 2], default=3)
+                trimestre[~(mes >= 1)] = 3
+                valores[col] = np.array(["1T", "2T", "3T", "4T"], dtype=object)[trimestre]
+
+            else:
+                raise KeyError(f"Coluna '{col}' ausente e sem regra de derivação")
+
+        return valores
+
+    def colunas_faltantes(self, disponiveis: Iterable[str]) -> List[str]:
+        """
+        Lista as colunas do modelo que não estão disponíveis nem podem ser derivadas.
+        """
+        disponiveis = set(disponiveis)
+        return [
+            col for col in self.colunas
+            if col not in disponiveis
+            and not (col in DERIVACOES and set(DERIVACOES[col]) <= disponiveis)
+        ]
+
+    def colunas_brutas(self) -> List[str]:
+        """
+        Colunas da base bruta necessárias para calcular as features, na ordem em que aparecem.
+        """
+        brutas: List[str] = []
+        for col in self.colunas:
+            for bruta in DERIVACOES.get(col, [col]):
+                if bruta not in brutas:
+                    brutas.append(bruta)
+        return brutas
+
+    def fit(self, df: pd.DataFrame) -> "FeaturePipeline":
+        """
+        Aprende os vocabulários das colunas categóricas a partir da base de treino.
+        """
+        valores = self._valores(df)
+        categoricas = [col for col in COLUNAS_CATEGORICAS if col in valores]
+        self.vocabularios = ajustar_vocabularios(
+            pd.DataFrame({col: np.asarray(valores[col], dtype=object) for col in categoricas}),
+            categoricas,
+        )
+        return self
+
+    def partial_fit(self, df: pd.DataFrame) -> "FeaturePipeline":
+        """
+        Acrescenta aos vocabulários as categorias de mais um bloco da base. Depois de todos
+        os blocos, o resultado é o mesmo de `fit` na base inteira.
+        """
+        anteriores = self.vocabularios
+        self.fit(df)
+        self.vocabularios = {
+            col: sorted(set(categorias) | set(anteriores.get(col, [])))
+            for col, categorias in self.vocabularios.items()
+        }
+        return self
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Calcula as features e devolve a matriz float32 (linhas x colunas) pronta para a DMatrix.
+        Categorias desconhecidas recebem CODIGO_DESCONHECIDO; a entrada não é alterada.
+        """
+        valores = self._valores(df)
+        X = np.empty((len(df), len(self.colunas)), dtype=np.float32)
+
+        for j, col in enumerate(self.colunas):
+            if col in self.vocabularios:
+                X[:, j] = _codificar(pd.Series(np.asarray(valores[col], dtype=object)), self.vocabularios[col])
+            else:
+                X[:, j] = np.asarray(valores[col], dtype=np.float32)
+
+        return X
+
+    def _indices(self) -> Dict[str, Dict[str, int]]:
+        # {coluna: {categoria: código}}, refeito só quando `vocabularios` é substituído
+        if getattr(self, "_indices_de", None) is not self.vocabularios:
+            self._indices_cache = {
+                col: {categoria: codigo for codigo, categoria in enumerate(categorias)}
+                for col, categorias in self.vocabularios.items()
+            }
+            self._indices_de = self.vocabularios
+        return self._indices_cache
+
+    def _valor_registro(self, registro: dict, col: str) -> object:
+        """
+        Valor de uma feature para um único registro, com as mesmas regras de `_valores`.
+        """
+        if col in registro:
+            return registro[col]
+
+        if col == 'forma_pagamento_agrup':
+            return classificar_prazo(registro['forma_pagamento'])
+
+        if col in COLUNAS_PRAZO:
+            return prazos_pagamento(registro['forma_pagamento'])[COLUNAS_PRAZO.index(col)]
+
+        if col == 'periodo_fiscal':
+            # meses fora de 1-12 (inclusive nulos) caem no 4T, como em `_valores`
+            mes = _numero(registro['month'])
+            if not mes >= 1:
+                return "4T"
+            return "1T" if mes <= 3 else "2T" if mes <= 6 else "3T" if mes <= 9 else "4T"
+
+        if col in ['flag_valor_vencido', 'razao_valor_vencido', 'historico_pagamento']:
+            vencido = _numero(registro['valor_vencido'])
+            if col == 'flag_valor_vencido':
+                return vencido > 0
+            quitado = _numero(registro['valor_quitado'])
+            if col == 'razao_valor_vencido':
+                return vencido / (quitado + 1)
+            return quitado / (quitado + vencido + 1)
+
+        raise KeyError(f"Coluna '{col}' ausente e sem regra de derivação")
+
+    def codificar_registro(self, registro: dict, saida: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Versão de `transform` para um único registro (dict), sem criar objetos do pandas:
+        escreve as features direto em `saida`, uma linha float32 na ordem de `colunas`.
+
+        Parâmetros:
+        -----------
+        registro : dict
+            Pedido com as features prontas ou as colunas brutas para derivá-las.
+        saida : np.ndarray, opcional (default=None)
+            Buffer (1 x len(colunas)) float32 reaproveitado entre chamadas; alocado se None.
+
+        Retorno:
+        --------
+        np.ndarray
+            O próprio `saida`, preenchido.
+        """
+        if saida is None:
+            saida = np.empty((1, len(self.colunas)), dtype=np.float32)
+
+        indices = self._indices()
+        linha = saida[0]
+        for j, col in enumerate(self.colunas):
+            valor = self._valor_registro(registro, col)
+            if col in indices:
+                categoria = "Desconhecido" if _nulo(valor) else str(valor)
+                linha[j] = indices[col].get(categoria, CODIGO_DESCONHECIDO)
+            else:
+                linha[j] = _numero(valor)
+
+        return saida
+
+    def fit_transform(self, df: pd.DataFrame) -> np.ndarray:
+        return self.fit(df).transform(df)
+
+    def para_json(self) -> str:
+        return json.dumps({"colunas": self.colunas, "vocabularios": self.vocabularios}, ensure_ascii=False)
+
+    @classmethod
+    def de_json(cls, texto: str) -> "FeaturePipeline":
+        dados = json.loads(texto)
+        return cls(dados["colunas"], dados["vocabularios"])
+
+    def salvar(self, caminho: Path) -> None:
+        with open(caminho, "w", encoding="utf-8") as file:
+            file.write(self.para_json())
+        logger.info(f"Pipeline de features salvo em: {caminho}")
+
+    @classmethod
+    def carregar(cls, caminho: Path) -> "FeaturePipeline":
+        with open(caminho, "r", encoding="utf-8") as file:
+            return cls.de_json(file.read())
+
+    def gravar_no_modelo(self, modelo) -> None:
+        """
+        Grava o pipeline como atributo do Booster; o atributo vai junto tanto no pickle
+        quanto no formato nativo (.ubj).
+        """
+        modelo.set_attr(**{ATRIBUTO_PIPELINE: self.para_json()})
+
+
+@lru_cache(maxsize=8)
+def _pipeline_de_json(texto: str) -> FeaturePipeline:
+    return FeaturePipeline.de_json(texto)
+
+
+def pipeline_do_modelo(
+    modelo,
+    vocabularios_path: Path = MODELS_DIR / "vocabularios.json"
+) -> FeaturePipeline:
+    """
+    Recupera o pipeline de features gravado no Booster. Para modelos treinados antes do
+    pipeline, monta um equivalente a partir de `feature_names` e do JSON de vocabulários.
+    """
+    texto = modelo.attr(ATRIBUTO_PIPELINE)
+    if texto is not None:
+        return _pipeline_de_json(texto)
+
+    if not Path(vocabularios_path).exists():
+        raise FileNotFoundError(
+            f"O modelo não tem o pipeline de features gravado e {vocabularios_path} não existe; "
+            "treine o modelo de novo (python x_health/modeling/train.py) ou informe os vocabulários do treino."
+        )
+    return FeaturePipeline(modelo.feature_names, carregar_vocabularios(vocabularios_path))
+
+
 @app.command()
 def main(
     # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    input_path: Path = PROCESSED_DATA_DIR / "dataset.csv",
+    input_path: Path = DATASET_PATH,
     output_path: Path = PROCESSED_DATA_DIR / "features.csv",
+    pipeline_path: Path = MODELS_DIR / "pipeline_features.json",
+    var_alvo: str = "default",
     # -----------------------------------------
 ):
-    # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    logger.info("Generating features from dataset...")
-    for i in tqdm(range(10), total=10):
-        if i == 5:
-            logger.info("Something happened for iteration 5.")
-    logger.success("Features generation complete.")
-    # -----------------------------------------
+    """
+    Ajusta o pipeline de features na base bruta e salva a matriz de features (com a
+    variável alvo) e o pipeline serializado.
+    """
+    logger.info("Gerando features a partir da base...")
+    pipeline = FeaturePipeline()
+    df = carregar_dataset(input_path, colunas=pipeline.colunas_brutas() + [var_alvo])
+
+    X = pipeline.fit_transform(df)
+
+    features = pd.DataFrame(X, columns=pipeline.colunas)
+    features[var_alvo] = df[var_alvo].to_numpy()
+    features.to_csv(output_path, index=False)
+
+    pipeline.salvar(pipeline_path)
+    logger.success(f"Features salvas em: {output_path}")
 
 
 if __name__ == "__main__":
+    configurar()
     app()
@@ -0,0 +1,428 @@
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import typer
+from loguru import logger
+
+# informação de diretórios
+from x_health.config import MODELS_DIR, RAW_DATA_DIR, configurar
+from x_health.dataset import DATASET_PATH
+from x_health.modeling.predict import carregar_modelo, limpar_cache_modelos
+
+app = typer.Typer()
+
+
+def _medir(funcao: Callable[[], object], repeticoes: int) -> Dict[str, float]:
+    """
+    Executa `funcao` várias vezes e devolve mediana, p99 e mínimo do tempo, em milissegundos.
+    """
+    tempos: List[float] = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    tempos.sort()
+    return {
+        "mediana_ms": statistics.median(tempos),
+        "p99_ms": tempos[min(len(tempos) - 1, int(0.99 * len(tempos)))],
+        "min_ms": tempos[0],
+    }
+
+
+def _registrar(nome: str, medidas: Dict[str, float]) -> None:
+    logger.info(
+        f"{nome:<28} mediana {medidas['mediana_ms']:9.3f} ms | "
+        f"p99 {medidas['p99_ms']:9.3f} ms | min {medidas['min_ms']:9.3f} ms"
+    )
+
+
+#######################################
+#     CARGA DO MODELO (FRIO x QUENTE) #
+#######################################
+@app.command()
+def carga_modelo(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.pkl",
+    repeticoes: int = 20,
+):
+    """
+    Compara a carga a frio do modelo em pickle e em formato nativo (UBJSON) com a carga
+    a quente, servida pelo cache de `carregar_modelo`.
+    """
+    pickle_path = model_path.with_suffix(".pkl")
+    nativo_path = model_path.with_suffix(".ubj")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # gera o artefato nativo a partir do pickle quando o treino ainda não o produziu
+        if not nativo_path.exists():
+            nativo_path = Path(tmp) / "modelo_xgboost.ubj"
+            carregar_modelo(pickle_path).save_model(nativo_path)
+
+        def frio(caminho: Path) -> Callable[[], object]:
+            def carregar():
+                limpar_cache_modelos()
+                return carregar_modelo(caminho)
+            return carregar
+
+        resultados = {
+            "frio (pickle)": _medir(frio(pickle_path), repeticoes),
+            "frio (ubj)": _medir(frio(nativo_path), repeticoes),
+        }
+
+        carregar_modelo(nativo_path)
+        resultados["quente (cache)"] = _medir(lambda: carregar_modelo(nativo_path), repeticoes)
+
+    for nome, medidas in resultados.items():
+        _registrar(nome, medidas)
+
+    return resultados
+
+
+#######################################
+#   OTIMIZAÇÃO COM E SEM PODA (OPTUNA) #
+#######################################
+@app.command()
+def tuning_poda(
+    features_path: Path = DATASET_PATH,
+    n_trials: int = 30,
+    pruners: str = "nenhum,mediana,hyperband",
+    n_threads: int = 0,
+    seed: int = 42,
+):
+    """
+    Compara o tempo total da busca de hiperparâmetros sem poda (cada trial roda a validação
+    cruzada completa) com os pruners do Optuna, usando o mesmo sampler e a mesma semente, e a
+    melhor AUC alcançada em cada caso.
+    """
+    import os
+
+    import numpy as np
+    import optuna
+
+    from x_health.modeling.train import criar_pruner, preparar_treino
+    from x_health.xgboost_utils import criar_folds, criar_objetivo
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    n_threads = n_threads or (os.cpu_count() or 1)
+
+    _, X, y, idx_train, _ = preparar_treino(features_path, False, "default")
+    y_train = y[idx_train]
+    folds = criar_folds(X[idx_train], y_train, nthread=n_threads)
+    contagem_classes = np.bincount(y_train)
+    scale_pos_weight = contagem_classes[0] / contagem_classes[1]
+
+    resultados = {}
+    for nome in pruners.split(","):
+        study = optuna.create_study(
+            direction="maximize",
+            sampler=optuna.samplers.TPESampler(seed=seed),
+            pruner=criar_pruner(nome),
+        )
+        objetivo = criar_objetivo(folds, scale_pos_weight, n_threads=n_threads, podar=nome != "nenhum")
+
+        inicio = time.perf_counter()
+        study.optimize(objetivo, n_trials=n_trials)
+        duracao = time.perf_counter() - inicio
+
+        podados = sum(t.state == optuna.trial.TrialState.PRUNED for t in study.trials)
+        resultados[nome] = {"tempo_s": duracao, "melhor_auc": study.best_value, "podados": podados}
+
+    base = resultados.get("nenhum")
+    for nome, r in resultados.items():
+        ganho = f" | {base['tempo_s'] / r['tempo_s']:5.2f}x" if base else ""
+        logger.info(
+            f"{nome:<10} {r['tempo_s']:8.1f} s | melhor AUC {r['melhor_auc']:.4f} | "
+            f"{r['podados']:3d}/{n_trials} podados{ganho}"
+        )
+
+    return resultados
+
+
+#######################################
+#   ÁRVORES EM NUMPY x BOOSTER.PREDICT #
+#######################################
+@app.command()
+def floresta(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    features_path: Path = DATASET_PATH,
+    tamanhos: str = "1,10,100,1000,10000,100000",
+    repeticoes: int = 20,
+):
+    """
+    Compara `Booster.predict` (com a montagem da DMatrix) com a `FlorestaNumpy` para lotes
+    de vários tamanhos, usando linhas reais da base, e confere a maior diferença absoluta
+    entre as probabilidades dos dois.
+    """
+    import numpy as np
+    import xgboost as xgb
+
+    from x_health.dataset import carregar_dataset
+    from x_health.features import pipeline_do_modelo
+    from x_health.modeling.floresta import FlorestaNumpy
+
+    modelo = carregar_modelo(model_path)
+    pipeline = pipeline_do_modelo(modelo)
+    arvores = FlorestaNumpy.de_booster(modelo)
+
+    maior = max(int(t) for t in tamanhos.split(","))
+    X = pipeline.transform(carregar_dataset(features_path, colunas=pipeline.colunas_brutas()))
+    # repete linhas quando a base é menor que o maior lote
+    X = np.ascontiguousarray(X[np.arange(maior) % len(X)], dtype=np.float32)
+
+    diferenca = float(np.abs(
+        modelo.predict(xgb.DMatrix(X, feature_names=pipeline.colunas)) - arvores.prever(X)
+    ).max())
+    logger.info(f"Maior diferença absoluta entre as probabilidades: {diferenca:.2e}")
+
+    resultados = {}
+    for tamanho in (int(t) for t in tamanhos.split(",")):
+        lote = X[:tamanho]
+        resultados[tamanho] = {
+            "xgboost": _medir(lambda: modelo.predict(xgb.DMatrix(lote, feature_names=pipeline.colunas)), repeticoes),
+            "numpy": _medir(lambda: arvores.prever(lote), repeticoes),
+        }
+        for motor, medidas in resultados[tamanho].items():
+            _registrar(f"{tamanho:>7} linhas ({motor})", medidas)
+
+    return resultados, diferenca
+
+
+#######################################
+#   TABELA DE ESCORES x BOOSTER        #
+#######################################
+@app.command()
+def tabela(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    features_path: Path = DATASET_PATH,
+    tamanhos: str = "1,100,10000",
+    bits: int = 16,
+    celulas_max: int = 10_000_000,
+    repeticoes: int = 20,
+):
+    """
+    Compila a `TabelaEscores` do modelo (domínio escolhido na própria base), registra
+    células, memória, cobertura e erro certificado, e compara a pontuação por tabela com
+    `inplace_predict` em lotes de linhas reais da base, conferindo a maior diferença
+    observada contra o limite certificado.
+    """
+    import numpy as np
+
+    from x_health.dataset import carregar_dataset
+    from x_health.features import pipeline_do_modelo
+    from x_health.modeling.floresta import FlorestaNumpy
+    from x_health.modeling.tabela import TabelaEscores
+
+    modelo = carregar_modelo(model_path)
+    pipeline = pipeline_do_modelo(modelo)
+
+    base = pipeline.transform(carregar_dataset(features_path, colunas=pipeline.colunas_brutas()))
+
+    inicio = time.perf_counter()
+    escores = TabelaEscores.compilar(FlorestaNumpy.de_booster(modelo), base, bits=bits, celulas_max=celulas_max)
+    escores.vincular_reserva(modelo)
+    logger.info(
+        f"Tabela: {escores.codigos.size:,} células, {escores.tamanho_bytes / 2**20:.1f} MiB, "
+        f"compilada em {time.perf_counter() - inicio:.1f}s, cobre {escores.cobertura(base):.1%} da base, "
+        f"erro certificado {escores.erro_max_probabilidade:.2e}"
+    )
+
+    maior = max(int(t) for t in tamanhos.split(","))
+    X = np.ascontiguousarray(base[np.arange(maior) % len(base)], dtype=np.float32)
+
+    diferenca = float(np.abs(modelo.inplace_predict(X) - escores.prever(X)).max())
+    logger.info(f"Maior diferença absoluta entre as probabilidades: {diferenca:.2e}")
+
+    resultados = {}
+    for tamanho in (int(t) for t in tamanhos.split(",")):
+        lote = X[:tamanho]
+        resultados[tamanho] = {
+            "inplace_predict": _medir(lambda: modelo.inplace_predict(lote), repeticoes),
+            "tabela": _medir(lambda: escores.prever(lote), repeticoes),
+        }
+        for motor, medidas in resultados[tamanho].items():
+            _registrar(f"{tamanho:>7} linhas ({motor})", medidas)
+
+    return resultados, diferenca
+
+
+#######################################
+#   UM REGISTRO (INPLACE x DATAFRAME)  #
+#######################################
+@app.command()
+def registro(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    registro_path: Path = RAW_DATA_DIR / "input_dados_random.json",
+    repeticoes: int = 10_000,
+    orcamento_p99_ms: float = 1.0,
+):
+    """
+    Compara a latência de um pedido pelo caminho antigo (DataFrame, `transform`, DMatrix e
+    `predict`) com o `PreditorRegistro` (linha float32 pré-alocada e `inplace_predict`), e
+    falha (código de saída 1) se o p99 do caminho rápido passar de `orcamento_p99_ms`.
+    """
+    import pandas as pd
+    import xgboost as xgb
+
+    from x_health.features import pipeline_do_modelo
+    from x_health.modeling.predict import PreditorRegistro
+
+    modelo = carregar_modelo(model_path)
+    pipeline = pipeline_do_modelo(modelo)
+    preditor = PreditorRegistro(modelo, pipeline)
+    with open(registro_path) as file:
+        pedido = json.load(file)
+
+    def dataframe():
+        X = pipeline.transform(pd.DataFrame([pedido]))
+        return modelo.predict(xgb.DMatrix(X, feature_names=pipeline.colunas))[0]
+
+    # aquece os dois caminhos antes de medir
+    diferenca = abs(float(dataframe()) - preditor.prever(pedido)[0])
+    resultados = {
+        "DataFrame + DMatrix": _medir(dataframe, repeticoes),
+        "inplace_predict": _medir(lambda: preditor.prever(pedido), repeticoes),
+    }
+    for nome, medidas in resultados.items():
+        _registrar(nome, medidas)
+    logger.info(f"Diferença entre as probabilidades: {diferenca:.2e}")
+
+    p99 = resultados["inplace_predict"]["p99_ms"]
+    if p99 > orcamento_p99_ms:
+        logger.error(f"p99 de um registro acima do orçamento: {p99:.3f} ms > {orcamento_p99_ms:.3f} ms")
+        raise typer.Exit(code=1)
+
+    logger.success(f"p99 de um registro dentro do orçamento ({p99:.3f} ms)")
+    return resultados
+
+
+#######################################
+#   CACHE DE PREDIÇÕES (DIMENSIONAMENTO) #
+#######################################
+@app.command()
+def cache(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    features_path: Path = DATASET_PATH,
+    tamanhos: str = "0,1000,10000,100000",
+    n_pedidos: int = 50_000,
+    casas_decimais: Optional[int] = None,
+):
+    """
+    Repassa `n_pedidos` linhas da base, na ordem do arquivo, pelo `PreditorRegistro` com
+    caches de vários tamanhos (0 = sem cache) e registra taxa de acerto e tempo por pedido,
+    para escolher o `--cache-tamanho` do serviço.
+    """
+    from x_health.dataset import carregar_dataset
+    from x_health.features import pipeline_do_modelo
+    from x_health.modeling.cache import CachePredicoes
+    from x_health.modeling.predict import PreditorRegistro
+
+    modelo = carregar_modelo(model_path)
+    pipeline = pipeline_do_modelo(modelo)
+    df = carregar_dataset(features_path, colunas=pipeline.colunas_brutas())
+    pedidos = df.head(n_pedidos).to_dict(orient="records")
+
+    resultados = {}
+    for tamanho in (int(t) for t in tamanhos.split(",")):
+        memoria = CachePredicoes(tamanho, casas_decimais=casas_decimais) if tamanho > 0 else None
+        preditor = PreditorRegistro(modelo, pipeline, cache=memoria)
+
+        inicio = time.perf_counter()
+        for pedido in pedidos:
+            preditor.prever(pedido)
+        por_pedido_us = (time.perf_counter() - inicio) / len(pedidos) * 1e6
+
+        taxa = memoria.estatisticas()["taxa_acerto"] if memoria is not None else 0.0
+        resultados[tamanho] = {"taxa_acerto": taxa, "por_pedido_us": por_pedido_us}
+        logger.info(f"cache {tamanho:>7} | acerto {taxa:6.1%} | {por_pedido_us:8.1f} µs/pedido")
+
+    return resultados
+
+
+#######################################
+#   ARRANQUE A FRIO (1ª PREDIÇÃO)      #
+#######################################
+# executado num interpretador novo: mede cada etapa até a primeira predição
+_SCRIPT_ARRANQUE = """
+import json, sys, time
+inicio = time.perf_counter()
+
+from x_health.modeling.predict import PreditorRegistro, carregar_modelo
+from x_health.features import pipeline_do_modelo
+importacao = time.perf_counter()
+
+modelo = carregar_modelo(__import__("pathlib").Path(sys.argv[1]))
+preditor = PreditorRegistro(modelo, pipeline_do_modelo(modelo))
+carga = time.perf_counter()
+
+# mesmo caminho de `prever_default`: codificar_registro + inplace_predict
+with open(sys.argv[2]) as file:
+    registro = json.load(file)
+preditor.prever(registro)
+fim = time.perf_counter()
+
+print(json.dumps({
+    "importacao_ms": (importacao - inicio) * 1000,
+    "carga_modelo_ms": (carga - importacao) * 1000,
+    "predicao_ms": (fim - carga) * 1000,
+    "modulos": sorted(m for m in sys.modules if m.split(".")[0] in sys.argv[3].split(",")),
+}))
+"""
+
+# bibliotecas que o caminho de predição não deve carregar (o sklearn fica de fora porque
+# o próprio xgboost o importa quando instalado)
+MODULOS_PROIBIDOS = "matplotlib,seaborn,optuna,dotenv"
+
+
+@app.command()
+def arranque(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    registro_path: Path = RAW_DATA_DIR / "input_dados_random.json",
+    repeticoes: int = 5,
+    orcamento_ms: float = 2000.0,
+    proibidos: str = MODULOS_PROIBIDOS,
+):
+    """
+    Mede o tempo até a primeira predição num processo novo (interpretador, importações,
+    carga do modelo e predição de um registro) e falha (código de saída 1) se a mediana
+    passar de `orcamento_ms` ou se o caminho de predição importar alguma biblioteca de
+    `proibidos` (gráficos, Optuna, .env).
+    """
+    totais, etapas, carregados = [], [], set()
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = subprocess.run(
+            [sys.executable, "-c", _SCRIPT_ARRANQUE, str(model_path), str(registro_path), proibidos],
+            capture_output=True, text=True, check=True,
+        )
+        totais.append((time.perf_counter() - inicio) * 1000)
+        etapas.append(json.loads(saida.stdout.strip().splitlines()[-1]))
+        carregados.update(etapas[-1]["modulos"])
+
+    mediana = statistics.median(totais)
+    for etapa in ("importacao_ms", "carga_modelo_ms", "predicao_ms"):
+        logger.info(f"{etapa:<28} mediana {statistics.median(e[etapa] for e in etapas):9.3f} ms")
+    logger.info(f"{'total (processo novo)':<28} mediana {mediana:9.3f} ms | orçamento {orcamento_ms:.0f} ms")
+
+    falhou = False
+    if carregados:
+        logger.error(f"Bibliotecas fora do caminho de predição foram importadas: {sorted(carregados)}")
+        falhou = True
+    if mediana > orcamento_ms:
+        logger.error(f"Arranque a frio acima do orçamento: {mediana:.0f} ms > {orcamento_ms:.0f} ms")
+        falhou = True
+    if falhou:
+        raise typer.Exit(code=1)
+
+    logger.success("Arranque a frio dentro do orçamento")
+    return mediana
+
+
+if __name__ == "__main__":
+    configurar()
+    app()
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+#######################################
+#        CACHE DE PREDIÇÕES           #
+#######################################
+class CachePredicoes:
+    """
+    Cache LRU (com validade opcional) de probabilidades, indexado pelo vetor de features
+    já codificado.
+
+    Como a maioria das features tem poucos valores possíveis (flags, contagens pequenas,
+    regimes tributários, grupos de pagamento, trimestres), vetores idênticos se repetem
+    muito em produção. Com `casas_decimais`, as features são arredondadas antes de virar
+    chave *e* antes de ir ao modelo, de modo que o valor em cache é sempre o do vetor
+    arredondado, e não o do primeiro pedido que caiu naquela chave.
+
+    O cache fica vinculado a um modelo (`vincular`): quando o modelo muda (outro artefato
+    ou o mesmo arquivo regravado), todas as entradas são descartadas.
+
+    Parâmetros:
+    -----------
+    tamanho_max : int, opcional (default=100000)
+        Quantidade máxima de vetores guardados; o menos usado recentemente sai primeiro.
+    ttl_s : float, opcional (default=None)
+        Validade de cada entrada, em segundos. Se None, as entradas não expiram.
+    casas_decimais : int, opcional (default=None)
+        Casas decimais do arredondamento das features. Se None, usa o vetor exato.
+    """
+
+    def __init__(
+        self,
+        tamanho_max: int = 100_000,
+        ttl_s: Optional[float] = None,
+        casas_decimais: Optional[int] = None,
+    ):
+        self.tamanho_max = tamanho_max
+        self.ttl_s = ttl_s
+        self.casas_decimais = casas_decimais
+        self._entradas: "OrderedDict[bytes, Tuple[float, float]]" = OrderedDict()
+        self._trava = threading.Lock()
+        self._modelo = None
+        self.acertos = self.falhas = self.expirados = self.invalidacoes = 0
+
+    def vincular(self, modelo) -> None:
+        """
+        Associa o cache ao modelo em uso, esvaziando-o se for outro modelo.
+        """
+        with self._trava:
+            if modelo is not self._modelo:
+                if self._modelo is not None:
+                    self.invalidacoes += 1
+                self._entradas.clear()
+                self._modelo = modelo
+
+    def chave(self, x: np.ndarray) -> bytes:
+        """
+        Arredonda a linha `x` no próprio array (se configurado) e devolve seus bytes.
+        """
+        if self.casas_decimais is not None:
+            np.round(x, self.casas_decimais, out=x)
+        return x.tobytes()
+
+    def obter(self, chave: bytes) -> Optional[float]:
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+
+            valor, instante = entrada
+            if self.ttl_s is not None and time.monotonic() - instante > self.ttl_s:
+                del self._entradas[chave]
+                self.expirados += 1
+                self.falhas += 1
+                return None
+
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(self, chave: bytes, valor: float) -> None:
+        with self._trava:
+            self._entradas[chave] = (valor, time.monotonic())
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.tamanho_max:
+                self._entradas.popitem(last=False)
+
+    def estatisticas(self) -> Dict[str, float]:
+        """
+        Contadores para dimensionar o cache: acertos, falhas, taxa de acerto, entradas
+        expiradas, invalidações por troca de modelo e ocupação.
+        """
+        with self._trava:
+            consultas = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+                "expirados": self.expirados,
+                "invalidacoes": self.invalidacoes,
+                "entradas": len(self._entradas),
+                "tamanho_max": self.tamanho_max,
+            }
@@ -0,0 +1,193 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from x_health.features import ATRIBUTO_PIPELINE, FeaturePipeline
+
+
+#######################################
+#     ÁRVORES EM TABELAS NUMPY        #
+#######################################
+class FlorestaNumpy:
+    """
+    Conjunto de árvores do XGBoost em tabelas planas de NumPy, avaliado sem o xgboost.
+
+    Os nós de todas as árvores ficam em sequência, em arrays paralelos: atributo, limiar,
+    filhos esquerdo e direito, direção padrão para valores ausentes e valor da folha. As
+    folhas apontam para si mesmas, de modo que a avaliação desce todas as árvores de todas
+    as linhas ao mesmo tempo, um nível por iteração, durante `profundidade` iterações.
+
+    Como no XGBoost, a linha vai para a esquerda quando `x < limiar` e segue a direção
+    padrão quando `x` é nulo. A margem é `margem_base` mais a soma das folhas e a
+    probabilidade é a sigmoide da margem (objetivo binary:logistic).
+
+    Parâmetros:
+    -----------
+    atributo, limiar, esquerda, direita, padrao_esquerda, valor : np.ndarray
+        Tabelas dos nós (um elemento por nó de todas as árvores).
+    raizes : np.ndarray
+        Posição da raiz de cada árvore nas tabelas.
+    profundidade : int
+        Maior profundidade entre as árvores.
+    margem_base : float
+        Margem inicial (logit do base_score).
+    colunas : List[str]
+        Colunas esperadas, na ordem da matriz de entrada.
+    pipeline : FeaturePipeline, opcional (default=None)
+        Pipeline de features gravado no modelo de origem.
+    """
+
+    def __init__(
+        self,
+        atributo: np.ndarray,
+        limiar: np.ndarray,
+        esquerda: np.ndarray,
+        direita: np.ndarray,
+        padrao_esquerda: np.ndarray,
+        valor: np.ndarray,
+        raizes: np.ndarray,
+        profundidade: int,
+        margem_base: float,
+        colunas: List[str],
+        pipeline: Optional[FeaturePipeline] = None,
+    ):
+        self.atributo = atributo
+        self.limiar = limiar
+        self.esquerda = esquerda
+        self.direita = direita
+        self.padrao_esquerda = padrao_esquerda
+        self.valor = valor
+        self.raizes = raizes
+        self.profundidade = profundidade
+        self.margem_base = margem_base
+        self.colunas = list(colunas)
+        self.pipeline = pipeline
+
+    @classmethod
+    def de_booster(cls, modelo) -> "FlorestaNumpy":
+        """
+        Exporta um Booster (gbtree, binary:logistic, splits numéricos) para tabelas planas.
+        """
+        learner = json.loads(modelo.save_raw(raw_format="json"))["learner"]
+        objetivo = learner["objective"]["name"]
+        booster = learner["gradient_booster"]
+        if booster["name"] != "gbtree" or objetivo != "binary:logistic":
+            raise NotImplementedError(f"Só gbtree com binary:logistic (modelo: {booster['name']}, {objetivo}).")
+
+        tabelas = {nome: [] for nome in ("atributo", "limiar", "esquerda", "direita", "padrao_esquerda", "valor")}
+        raizes, profundidade, deslocamento = [], 0, 0
+        for arvore in booster["model"]["trees"]:
+            if arvore.get("categories_nodes"):
+                raise NotImplementedError("Splits categóricos não são suportados.")
+
+            esquerda = np.asarray(arvore["left_children"], dtype=np.int64)
+            direita = np.asarray(arvore["right_children"], dtype=np.int64)
+            folha = esquerda == -1
+            nos = np.arange(len(esquerda))
+
+            # folhas apontam para si mesmas; o valor da folha vem em split_conditions
+            tabelas["esquerda"].append(np.where(folha, nos, esquerda) + deslocamento)
+            tabelas["direita"].append(np.where(folha, nos, direita) + deslocamento)
+            tabelas["atributo"].append(np.where(folha, 0, arvore["split_indices"]))
+            condicoes = np.asarray(arvore["split_conditions"], dtype=np.float32)
+            tabelas["limiar"].append(np.where(folha, np.float32(np.inf), condicoes))
+            tabelas["valor"].append(np.where(folha, condicoes, np.float32(0)))
+            tabelas["padrao_esquerda"].append(np.asarray(arvore["default_left"], dtype=bool))
+
+            # profundidade: cada filho fica um nível abaixo do pai
+            nivel = np.zeros(len(esquerda), dtype=np.int64)
+            pendentes = [0]
+            while pendentes:
+                no = pendentes.pop()
+                if not folha[no]:
+                    nivel[esquerda[no]] = nivel[direita[no]] = nivel[no] + 1
+                    pendentes += [esquerda[no], direita[no]]
+            profundidade = max(profundidade, int(nivel.max()))
+
+            raizes.append(deslocamento)
+            deslocamento += len(esquerda)
+
+        base_score = float(learner["learner_model_param"]["base_score"])
+        texto = modelo.attr(ATRIBUTO_PIPELINE)
+        return cls(
+            atributo=np.concatenate(tabelas["atributo"]).astype(np.int32),
+            limiar=np.concatenate(tabelas["limiar"]).astype(np.float32),
+            esquerda=np.concatenate(tabelas["esquerda"]).astype(np.int32),
+            direita=np.concatenate(tabelas["direita"]).astype(np.int32),
+            padrao_esquerda=np.concatenate(tabelas["padrao_esquerda"]),
+            valor=np.concatenate(tabelas["valor"]).astype(np.float32),
+            raizes=np.asarray(raizes, dtype=np.int32),
+            profundidade=profundidade,
+            margem_base=float(np.log(base_score / (1 - base_score))),
+            colunas=learner.get("feature_names") or modelo.feature_names or [],
+            pipeline=FeaturePipeline.de_json(texto) if texto is not None else None,
+        )
+
+    def impressao(self) -> str:
+        """
+        Hash (BLAKE2b) das tabelas dos nós e da margem base. Depende só das árvores, e não
+        dos atributos do Booster (pipeline, período do último update), que mudam sem mudar
+        os escores.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for tabela in (self.atributo, self.limiar, self.esquerda, self.direita, self.padrao_esquerda, self.valor):
+            h.update(np.ascontiguousarray(tabela).tobytes())
+        h.update(np.float64(self.margem_base).tobytes())
+        return h.hexdigest()
+
+    def margem(self, X: np.ndarray, tamanho_bloco: int = 8192) -> np.ndarray:
+        """
+        Margem (log-odds) de cada linha, em blocos de `tamanho_bloco` linhas para limitar
+        a matriz de posições (linhas x árvores).
+        """
+        X = np.asarray(X, dtype=np.float32)
+        saida = np.empty(len(X), dtype=np.float64)
+
+        for inicio in range(0, len(X), tamanho_bloco):
+            bloco = X[inicio:inicio + tamanho_bloco]
+            linhas = np.arange(len(bloco))[:, None]
+            no = np.broadcast_to(self.raizes, (len(bloco), len(self.raizes))).copy()
+
+            for _ in range(self.profundidade):
+                x = bloco[linhas, self.atributo[no]]
+                esquerda = np.where(np.isnan(x), self.padrao_esquerda[no], x < self.limiar[no])
+                no = np.where(esquerda, self.esquerda[no], self.direita[no])
+
+            saida[inicio:inicio + len(bloco)] = self.margem_base + self.valor[no].sum(axis=1, dtype=np.float64)
+
+        return saida
+
+    def prever(self, X: np.ndarray) -> np.ndarray:
+        """
+        Probabilidade da classe 1 (equivalente a `Booster.predict`), em float32.
+        """
+        return (1.0 / (1.0 + np.exp(-self.margem(X)))).astype(np.float32)
+
+    def salvar(self, caminho: Path) -> None:
+        np.savez(
+            caminho,
+            atributo=self.atributo, limiar=self.limiar,
+            esquerda=self.esquerda, direita=self.direita,
+            padrao_esquerda=self.padrao_esquerda, valor=self.valor,
+            raizes=self.raizes,
+            profundidade=self.profundidade, margem_base=self.margem_base,
+            colunas=json.dumps(self.colunas),
+            pipeline=self.pipeline.para_json() if self.pipeline is not None else "",
+        )
+
+    @classmethod
+    def carregar(cls, caminho: Path) -> "FlorestaNumpy":
+        with np.load(caminho) as dados:
+            texto = str(dados["pipeline"])
+            return cls(
+                atributo=dados["atributo"], limiar=dados["limiar"],
+                esquerda=dados["esquerda"], direita=dados["direita"],
+                padrao_esquerda=dados["padrao_esquerda"], valor=dados["valor"],
+                raizes=dados["raizes"],
+                profundidade=int(dados["profundidade"]), margem_base=float(dados["margem_base"]),
+                colunas=json.loads(str(dados["colunas"])),
+                pipeline=FeaturePipeline.de_json(texto) if texto else None,
+            )
@@ -1,40 +1,183 @@
 from pathlib import Path
 import json
 import pickle
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 import typer
 from loguru import logger
 
 import xgboost as xgb
-from sklearn.preprocessing import LabelEncoder
 
 #informação de diretórios
 from x_health.config import *
+from x_health.features import FeaturePipeline, pipeline_do_modelo
+from x_health.modeling.cache import CachePredicoes
 
 app = typer.Typer()
 
-features_path: Path = RAW_DATA_DIR / "input_dados_random.json",
-model_path: Path = MODELS_DIR / "modelo_xgboost.pkl",
-predictions_path: Path = PROCESSED_DATA_DIR / "default_predicao_2.csv",
+
+#######################################
+#         CARREGAMENTO DO MODELO      #
+#######################################
+_MODELOS_CARREGADOS: Dict[str, Tuple[int, xgb.Booster]] = {}
+_TRAVA_MODELOS = threading.Lock()
+
+
+def _ler_modelo(caminho: Path) -> xgb.Booster:
+    if caminho.suffix.lower() == ".pkl":
+        with open(caminho, "rb") as file:
+            return pickle.load(file)
+
+    return xgb.Booster(model_file=str(caminho))
+
+
+def carregar_modelo(model_path: Path = MODELS_DIR / "modelo_xgboost.ubj") -> xgb.Booster:
+    """
+    Carrega o Booster treinado, reaproveitando a instância já carregada no processo.
+
+    O cache é indexado pelo caminho e pela data de modificação do arquivo: enquanto o
+    artefato não mudar, chamadas seguintes não desserializam nada. Arquivos .pkl são lidos
+    com pickle; os demais (.ubj, .json, .bin) no formato nativo do XGBoost. Se o arquivo
+    nativo ainda não existir, usa o pickle de mesmo nome gerado pelos treinos antigos.
+
+    Parâmetros:
+    -----------
+    model_path : Path
+        Caminho do modelo treinado.
+
+    Retorno:
+    --------
+    xgboost.Booster
+        Modelo pronto para predição.
+    """
+    caminho = Path(model_path)
+    if not caminho.exists() and caminho.with_suffix(".pkl").exists():
+        caminho = caminho.with_suffix(".pkl")
+
+    chave = str(caminho.resolve())
+    mtime = caminho.stat().st_mtime_ns
+
+    with _TRAVA_MODELOS:
+        em_cache = _MODELOS_CARREGADOS.get(chave)
+        if em_cache is not None and em_cache[0] == mtime:
+            return em_cache[1]
+
+        logger.info(f"Carregando modelo de {caminho}...")
+        modelo = _ler_modelo(caminho)
+        _MODELOS_CARREGADOS[chave] = (mtime, modelo)
+
+    return modelo
+
+
+def limpar_cache_modelos() -> None:
+    """
+    Descarta os modelos em cache (usado para medir a carga a frio).
+    """
+    with _TRAVA_MODELOS:
+        _MODELOS_CARREGADOS.clear()
+
+
+#######################################
+#     PREDIÇÃO DE UM ÚNICO REGISTRO   #
+#######################################
+class PreditorRegistro:
+    """
+    Caminho rápido para pontuar um pedido por vez, sem pandas nem DMatrix.
+
+    O registro validado é escrito por `FeaturePipeline.codificar_registro` numa linha
+    float32 pré-alocada (uma por thread, na ordem das colunas do treino) e pontuado com
+    `Booster.inplace_predict`, que lê o array diretamente.
+
+    Parâmetros:
+    -----------
+    modelo : xgboost.Booster
+        Modelo treinado, carregado uma única vez.
+    pipeline : FeaturePipeline
+        Pipeline de features gravado no modelo.
+    limiar : float, opcional (default=0.5)
+        Probabilidade a partir da qual o pedido é classificado como default.
+    cache : CachePredicoes, opcional (default=None)
+        Cache consultado antes do modelo.
+    model_path : Path, opcional (default=None)
+        Se informado, a cada pedido confere (pelo cache de `carregar_modelo`) se o artefato
+        mudou; nesse caso troca o modelo e o pipeline e esvazia o cache.
+    """
+
+    def __init__(
+        self,
+        modelo: xgb.Booster,
+        pipeline: FeaturePipeline,
+        limiar: float = 0.5,
+        cache: Optional[CachePredicoes] = None,
+        model_path: Optional[Path] = None,
+    ):
+        self.modelo = modelo
+        self.pipeline = pipeline
+        self.limiar = limiar
+        self.cache = cache
+        self.model_path = model_path
+        self._local = threading.local()
+        if cache is not None:
+            cache.vincular(modelo)
+
+    def _buffer(self) -> np.ndarray:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[1] != len(self.pipeline.colunas):
+            buffer = self._local.buffer = np.empty((1, len(self.pipeline.colunas)), dtype=np.float32)
+        return buffer
+
+    def _atualizar_modelo(self) -> None:
+        modelo = carregar_modelo(self.model_path)
+        if modelo is not self.modelo:
+            logger.info("Artefato do modelo mudou; trocando modelo e esvaziando o cache")
+            self.modelo, self.pipeline = modelo, pipeline_do_modelo(modelo)
+            if self.cache is not None:
+                self.cache.vincular(modelo)
+
+    def prever(self, registro: dict) -> Tuple[float, int]:
+        """
+        Devolve (probabilidade, classe) do pedido. Colunas ausentes geram KeyError.
+        """
+        if self.model_path is not None:
+            self._atualizar_modelo()
+
+        X = self.pipeline.codificar_registro(registro, self._buffer())
+        if self.cache is None:
+            probabilidade = float(self.modelo.inplace_predict(X)[0])
+        else:
+            chave = self.cache.chave(X[0])
+            probabilidade = self.cache.obter(chave)
+            if probabilidade is None:
+                probabilidade = float(self.modelo.inplace_predict(X)[0])
+                self.cache.guardar(chave, probabilidade)
+
+        return probabilidade, int(probabilidade > self.limiar)
+
 
 @app.command()
 def main(
     # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    features_path: features_path,
-    model_path: model_path / "modelo_xgboost.pkl",
-    predictions_path: predictions_path / "default_predicao_2.csv",
+    features_path: Path = RAW_DATA_DIR / "input_dados_random.json",
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    predictions_path: Path = PROCESSED_DATA_DIR / "default_predicao.json",
+    vocabularios_path: Path = MODELS_DIR / "vocabularios.json",
     # -----------------------------------------
 ):
     # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    prever_default()
+    prever_default(features_path, model_path, predictions_path, vocabularios_path)
 
     # -----------------------------------------
 
 def prever_default(
     # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    features_path: features_path,
-    model_path: model_path / "modelo_xgboost.pkl",
-    predictions_path: predictions_path / "default_predicao_2.csv",
+    features_path: Path = RAW_DATA_DIR / "input_dados_random.json",
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    predictions_path: Path = PROCESSED_DATA_DIR / "default_predicao.json",
+    vocabularios_path: Path = MODELS_DIR / "vocabularios.json",
     # -----------------------------------------
 ):
     """
@@ -46,53 +189,47 @@ def prever_default(
         Caminho para o arquivo JSON contendo os dados de entrada para a predição.
 
     model_path : Path
-        Caminho para o arquivo pickle (.pkl) que contém o modelo XGBoost treinado.
+        Caminho do modelo XGBoost treinado (formato nativo .ubj ou pickle .pkl).
 
     predictions_path : Path
         Caminho onde a predição será salva no formato JSON.
 
+    vocabularios_path : Path
+        JSON de vocabulários, usado apenas por modelos treinados antes do pipeline de features.
+
     Funcionamento:
     --------------
-    1. Carrega o modelo treinado do caminho especificado.
+    1. Carrega o modelo treinado do caminho especificado (uma única vez por processo).
     2. Lê os dados de entrada a partir do JSON em `features_path`.
-    3. Converte variáveis categóricas em numéricas para compatibilidade com o modelo.
-    4. Cria uma matriz `DMatrix` para o XGBoost.
-    5. Faz a predição com o modelo carregado.
+    3. Calcula as features com o `FeaturePipeline` gravado no modelo; variáveis categóricas
+       usam os vocabulários do treino (categorias desconhecidas viram valor ausente).
+    4. Escreve as features numa linha float32, sem DataFrame nem `DMatrix`.
+    5. Faz a predição com `inplace_predict` (ver `PreditorRegistro`).
     6. Determina se a previsão indica default (inadimplência) ou não.
     7. Salva a predição em um arquivo JSON no caminho especificado.
 
     Retorno:
     --------
-    Nenhum retorno explícito, mas exibe o resultado da predição no console e salva em JSON.
+    dict
+        Dicionário com a predição, também exibido no console e salvo em JSON.
 
     Exemplo de saída no arquivo JSON:
     {
         "default": 1
     }
     """
-    logger.info("Carregando modelo...")
-    with open(model_path, "rb") as file:
-        modelo = pickle.load(file)
+    modelo = carregar_modelo(model_path)
     
     logger.info("Carregando dados de entrada...")
     with open(features_path, "r") as file:
         input_data = json.load(file)
     
-    df = pd.DataFrame([input_data])
-    
-    
-    # Converte variáveis categóricas para numéricas
-    label_encoders = {}
-    for col in df.select_dtypes(include=['object']).columns:
-        le = LabelEncoder()
-        df[col] = le.fit_transform(df[col])
-        label_encoders[col] = le  # Salva os encoders para referência futura, se necessário
-    
-    dmatrix = xgb.DMatrix(df)
+    # Calcula as features com o mesmo pipeline do treino (gravado no modelo): categorias
+    # codificadas com os vocabulários do treino e colunas na ordem do treino
+    pipeline = pipeline_do_modelo(modelo, vocabularios_path)
     
     logger.info("Realizando predição...")
-    predicao = modelo.predict(dmatrix)
-    resultado = int(predicao[0] > 0.5)
+    _, resultado = PreditorRegistro(modelo, pipeline).prever(input_data)
     
     output = {"default": resultado}
     
@@ -103,9 +240,175 @@ def prever_default(
     logger.success(f"Predição salva com sucesso em {predictions_path}")
     print(output)
 
+    return output
+
     # -----------------------------------------
 
 
 
+#######################################
+#        PREDIÇÃO EM LOTE (BATCH)     #
+#######################################
+def _ler_lotes(caminho: Path, tamanho_lote: int) -> Iterator[pd.DataFrame]:
+    """
+    Lê o arquivo de entrada em blocos de até `tamanho_lote` linhas, conforme a extensão:
+    JSON Lines (.jsonl/.ndjson), CSV (.csv) ou Parquet (.parquet).
+    """
+    sufixo = caminho.suffix.lower()
+
+    if sufixo in [".jsonl", ".ndjson"]:
+        yield from pd.read_json(caminho, lines=True, chunksize=tamanho_lote)
+    elif sufixo == ".csv":
+        yield from pd.read_csv(caminho, chunksize=tamanho_lote)
+    elif sufixo == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ModuleNotFoundError as erro:
+            raise ModuleNotFoundError("Leitura de Parquet requer o pacote 'pyarrow'.") from erro
+
+        for lote in pq.ParquetFile(caminho).iter_batches(batch_size=tamanho_lote):
+            yield lote.to_pandas()
+    else:
+        raise ValueError(f"Formato de entrada não suportado: '{sufixo}'. Use .jsonl, .csv ou .parquet.")
+
+
+SUFIXOS_SAIDA = [".csv", ".jsonl", ".ndjson", ".parquet"]
+
+
+def _escrever_lotes(lotes: Iterator[pd.DataFrame], caminho: Path) -> None:
+    """
+    Grava os blocos de predições no arquivo de saída à medida que ficam prontos, conforme a
+    extensão: CSV (.csv), JSON Lines (.jsonl/.ndjson) ou Parquet (.parquet, um row group
+    por bloco).
+    """
+    sufixo = caminho.suffix.lower()
+
+    if sufixo in [".jsonl", ".ndjson"]:
+        with open(caminho, "w", encoding="utf-8") as file:
+            for saida in lotes:
+                saida.to_json(file, orient="records", lines=True, force_ascii=False)
+    elif sufixo == ".csv":
+        for i, saida in enumerate(lotes):
+            saida.to_csv(caminho, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+    elif sufixo == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ModuleNotFoundError as erro:
+            raise ModuleNotFoundError("Escrita de Parquet requer o pacote 'pyarrow'.") from erro
+
+        escritor = None
+        try:
+            for saida in lotes:
+                tabela = pa.Table.from_pandas(saida, preserve_index=False)
+                if escritor is None:
+                    escritor = pq.ParquetWriter(caminho, tabela.schema)
+                escritor.write_table(tabela)
+        finally:
+            if escritor is not None:
+                escritor.close()
+    else:
+        raise ValueError(f"Formato de saída não suportado: '{sufixo}'. Use {', '.join(SUFIXOS_SAIDA)}.")
+
+
+def prever_default_lote(
+    features_path: Path,
+    predictions_path: Path,
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    vocabularios_path: Path = MODELS_DIR / "vocabularios.json",
+    id_col: Optional[str] = None,
+    tamanho_lote: int = 50_000,
+    limiar: float = 0.5,
+) -> int:
+    """
+    Realiza a predição de inadimplência para um arquivo com muitos pedidos, em blocos.
+
+    Cada bloco vira uma única DMatrix e uma única chamada de `predict`, e as predições são
+    gravadas no arquivo de saída assim que ficam prontas, de modo que a memória usada
+    depende do tamanho do bloco e não do tamanho do arquivo.
+
+    Parâmetros:
+    -----------
+    features_path : Path
+        Arquivo de entrada em JSON Lines, CSV ou Parquet, com as colunas do modelo.
+    predictions_path : Path
+        Arquivo de saída (.csv, .jsonl ou .parquet); outras extensões geram ValueError.
+    model_path : Path
+        Caminho do modelo XGBoost treinado (formato nativo .ubj ou pickle .pkl).
+    vocabularios_path : Path
+        JSON de vocabulários, usado apenas por modelos treinados antes do pipeline de features.
+    id_col : str, opcional (default=None)
+        Coluna identificadora repassada sem alteração para a saída.
+    tamanho_lote : int, opcional (default=50000)
+        Quantidade máxima de linhas processadas por bloco.
+    limiar : float, opcional (default=0.5)
+        Probabilidade a partir da qual o pedido é classificado como default.
+
+    Retorno:
+    --------
+    int
+        Quantidade total de linhas pontuadas.
+    """
+    # extensão de saída conferida antes de carregar o modelo e ler a entrada
+    predictions_path = Path(predictions_path)
+    if predictions_path.suffix.lower() not in SUFIXOS_SAIDA:
+        raise ValueError(
+            f"Formato de saída não suportado: '{predictions_path.suffix}'. Use {', '.join(SUFIXOS_SAIDA)}."
+        )
+
+    modelo = carregar_modelo(model_path)
+    pipeline = pipeline_do_modelo(modelo, vocabularios_path)
+
+    total = 0
+    inicio = time.perf_counter()
+
+    def pontuar() -> Iterator[pd.DataFrame]:
+        nonlocal total
+        for i, lote in enumerate(_ler_lotes(Path(features_path), tamanho_lote)):
+            ids = lote[id_col].to_numpy() if id_col else None
+
+            X = pipeline.transform(lote)
+            probabilidade = modelo.predict(xgb.DMatrix(X, feature_names=pipeline.colunas))
+
+            saida = pd.DataFrame({
+                "probabilidade": probabilidade,
+                "default": (probabilidade > limiar).astype("int8"),
+            })
+            if id_col:
+                saida.insert(0, id_col, ids)
+            yield saida
+
+            total += len(lote)
+            decorrido = time.perf_counter() - inicio
+            logger.info(f"Lote {i + 1}: {total} linhas ({total / decorrido:,.0f} linhas/s)")
+
+    _escrever_lotes(pontuar(), predictions_path)
+
+    decorrido = time.perf_counter() - inicio
+    logger.success(
+        f"{total} linhas pontuadas em {decorrido:.2f}s "
+        f"({total / max(decorrido, 1e-9):,.0f} linhas/s). Saída: {predictions_path}"
+    )
+
+    return total
+
+
+@app.command()
+def batch(
+    features_path: Path = typer.Argument(..., help="Entrada em .jsonl, .csv ou .parquet"),
+    predictions_path: Path = typer.Argument(..., help="Saída em .csv, .jsonl ou .parquet"),
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    vocabularios_path: Path = MODELS_DIR / "vocabularios.json",
+    id_col: Optional[str] = None,
+    tamanho_lote: int = 50_000,
+    limiar: float = 0.5,
+):
+    prever_default_lote(
+        features_path, predictions_path, model_path, vocabularios_path,
+        id_col=id_col, tamanho_lote=tamanho_lote, limiar=limiar,
+    )
+
+
 if __name__ == "__main__":
+    configurar()
     app()
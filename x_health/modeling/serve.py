@@ -0,0 +1,362 @@
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import typer
+from loguru import logger
+
+# informação de diretórios
+from x_health.config import MODELS_DIR, configurar
+from x_health.features import FeaturePipeline
+from x_health.modeling.cache import CachePredicoes
+from x_health.modeling.floresta import FlorestaNumpy
+from x_health.modeling.tabela import TabelaEscores, caminho_tabela
+
+app = typer.Typer()
+
+
+#######################################
+#      AGRUPADOR DE REQUISIÇÕES       #
+#######################################
+class MicroLote:
+    """
+    Agrupa pedidos concorrentes em micro-lotes e pontua cada lote com uma única chamada
+    de `predict`.
+
+    Cada requisição é validada e codificada (`FeaturePipeline.codificar_registro`) na thread
+    que a recebeu, de modo que um pedido inválido só afeta a própria resposta, e sua linha
+    de features entra numa fila com um Future. Uma thread dedicada retira da fila
+    até `tamanho_max` pedidos, esperando no máximo `espera_max_ms` milissegundos depois do
+    primeiro, pontua a matriz do lote de uma vez e distribui os resultados.
+
+    Parâmetros:
+    -----------
+    modelo : xgboost.Booster, FlorestaNumpy ou TabelaEscores
+        Modelo treinado, carregado uma única vez.
+    pipeline : FeaturePipeline
+        Pipeline de features gravado no modelo.
+    tamanho_max : int, opcional (default=256)
+        Quantidade máxima de pedidos por lote.
+    espera_max_ms : float, opcional (default=5.0)
+        Tempo máximo que o primeiro pedido de um lote aguarda por companhia.
+    limiar : float, opcional (default=0.5)
+        Probabilidade a partir da qual o pedido é classificado como default.
+    cache : CachePredicoes, opcional (default=None)
+        Cache consultado antes do modelo; só as linhas sem acerto vão para `predict`.
+    recarregar : Callable[[], Tuple[object, FeaturePipeline]], opcional (default=None)
+        Função que carrega de novo (modelo, pipeline) dos artefatos em disco.
+    artefatos : List[Path], opcional (default=None)
+        Arquivos lidos por `recarregar`. Antes de cada lote, a data de modificação
+        (mtime_ns) deles é comparada com a da última carga, como em `carregar_modelo`; se
+        mudou, o modelo é trocado e o cache esvaziado (`CachePredicoes.vincular`). Pedidos
+        já codificados com o pipeline anterior são codificados de novo.
+    """
+
+    def __init__(
+        self,
+        modelo,
+        pipeline: FeaturePipeline,
+        tamanho_max: int = 256,
+        espera_max_ms: float = 5.0,
+        limiar: float = 0.5,
+        cache: Optional[CachePredicoes] = None,
+        recarregar: Optional[Callable[[], Tuple[object, FeaturePipeline]]] = None,
+        artefatos: Optional[List[Path]] = None,
+    ):
+        self.modelo = modelo
+        self.pipeline = pipeline
+        self.tamanho_max = tamanho_max
+        self.espera_max = espera_max_ms / 1000
+        self.limiar = limiar
+        self.cache = cache
+        self.recarregar = recarregar
+        self.artefatos = list(artefatos or [])
+        self._versao = self._versao_artefatos()
+        if cache is not None:
+            cache.vincular(modelo)
+        self._fila: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def prever(self, registro: dict) -> Future:
+        """
+        Valida e codifica o pedido e enfileira sua linha de features, devolvendo o Future que
+        receberá {"default", "probabilidade"}. Pedidos incompletos (KeyError) ou com valores
+        inválidos (ValueError) são recusados aqui, para não derrubar o lote dos demais.
+        """
+        if not isinstance(registro, dict):
+            raise KeyError("o pedido deve ser um objeto JSON")
+        faltantes = self.pipeline.colunas_faltantes(registro)
+        if faltantes:
+            raise KeyError(", ".join(faltantes))
+        try:
+            linha = self.pipeline.codificar_registro(registro)
+        except (TypeError, ValueError) as erro:
+            raise ValueError(f"valor inválido ({erro})") from erro
+
+        futuro: Future = Future()
+        self._fila.put((registro, self.pipeline, linha, futuro))
+        return futuro
+
+    def _versao_artefatos(self) -> tuple:
+        versao = []
+        for caminho in self.artefatos:
+            try:
+                versao.append(caminho.stat().st_mtime_ns)
+            except FileNotFoundError:
+                versao.append(None)
+        return tuple(versao)
+
+    def _atualizar_modelo(self) -> None:
+        # chamado só pela thread dos lotes, antes de pontuar cada lote
+        if self.recarregar is None:
+            return
+        versao = self._versao_artefatos()
+        if versao == self._versao:
+            return
+
+        # a versão é registrada mesmo se a carga falhar, para não tentar de novo a cada lote
+        self._versao = versao
+        try:
+            modelo, pipeline = self.recarregar()
+        except Exception as erro:
+            logger.error(f"Artefato do modelo mudou, mas não pôde ser carregado; mantendo o modelo anterior: {erro}")
+            return
+
+        logger.info("Artefato do modelo mudou; trocando modelo e esvaziando o cache")
+        self.modelo, self.pipeline = modelo, pipeline
+        if self.cache is not None:
+            self.cache.vincular(modelo)
+
+    def _coletar(self) -> List[tuple]:
+        # bloqueia até o primeiro pedido e então espera no máximo `espera_max` pelos demais
+        lote = [self._fila.get()]
+        prazo = time.perf_counter() + self.espera_max
+
+        while len(lote) < self.tamanho_max:
+            restante = prazo - time.perf_counter()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+
+        return lote
+
+    def _pontuar(self, X: np.ndarray) -> np.ndarray:
+        if isinstance(self.modelo, (FlorestaNumpy, TabelaEscores)):
+            return self.modelo.prever(X)
+
+        import xgboost as xgb
+        return self.modelo.predict(xgb.DMatrix(X, feature_names=self.pipeline.colunas))
+
+    def _pontuar_com_cache(self, X: np.ndarray) -> np.ndarray:
+        if self.cache is None:
+            return self._pontuar(X)
+
+        chaves = [self.cache.chave(x) for x in X]
+        probabilidade = np.array([self.cache.obter(chave) for chave in chaves], dtype=np.float64)
+        faltantes = np.flatnonzero(np.isnan(probabilidade))
+        if len(faltantes):
+            probabilidade[faltantes] = self._pontuar(X[faltantes])
+            for i in faltantes:
+                self.cache.guardar(chaves[i], float(probabilidade[i]))
+
+        return probabilidade
+
+    def _executar(self) -> None:
+        while True:
+            lote = self._coletar()
+            self._atualizar_modelo()
+
+            # pedidos codificados antes de uma troca de modelo são codificados de novo
+            linhas, futuros = [], []
+            for registro, pipeline, linha, futuro in lote:
+                if pipeline is not self.pipeline:
+                    try:
+                        linha = self.pipeline.codificar_registro(registro)
+                    except Exception as erro:
+                        futuro.set_exception(erro)
+                        continue
+                linhas.append(linha)
+                futuros.append(futuro)
+            if not futuros:
+                continue
+
+            try:
+                X = np.concatenate(linhas)
+                probabilidade = self._pontuar_com_cache(X)
+            except Exception as erro:
+                for futuro in futuros:
+                    futuro.set_exception(erro)
+                continue
+
+            for futuro, p in zip(futuros, probabilidade):
+                futuro.set_result({"default": int(p > self.limiar), "probabilidade": float(p)})
+
+
+#######################################
+#            SERVIDOR HTTP            #
+#######################################
+def _criar_handler(micro_lote: MicroLote, timeout: float):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _responder(self, status: int, corpo: dict) -> None:
+            dados = json.dumps(corpo).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path == "/saude":
+                self._responder(200, {"status": "ok"})
+            elif self.path == "/cache" and micro_lote.cache is not None:
+                self._responder(200, micro_lote.cache.estatisticas())
+            else:
+                self._responder(404, {"erro": "rota não encontrada"})
+
+        def do_POST(self):
+            if self.path != "/prever":
+                self._responder(404, {"erro": "rota não encontrada"})
+                return
+
+            try:
+                tamanho = int(self.headers.get("Content-Length", 0))
+                registro = json.loads(self.rfile.read(tamanho))
+            except (ValueError, json.JSONDecodeError):
+                self._responder(400, {"erro": "corpo da requisição não é um JSON válido"})
+                return
+
+            # aceita um pedido ou uma lista de pedidos na mesma requisição
+            registros = registro if isinstance(registro, list) else [registro]
+            try:
+                futuros = [micro_lote.prever(r) for r in registros]
+                resultados = [f.result(timeout=timeout) for f in futuros]
+            except (KeyError, ValueError) as erro:
+                self._responder(422, {"erro": f"pedido inválido: {erro.args[0]}"})
+                return
+            except Exception as erro:
+                self._responder(500, {"erro": str(erro)})
+                return
+
+            self._responder(200, resultados if isinstance(registro, list) else resultados[0])
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def _caminho_booster(model_path: Path) -> Path:
+    # mesma regra de `carregar_modelo`: sem o arquivo nativo, usa o pickle de mesmo nome
+    if not model_path.exists() and model_path.with_suffix(".pkl").exists():
+        return model_path.with_suffix(".pkl")
+    return model_path
+
+
+def _artefatos_motor(motor: str, model_path: Path) -> List[Path]:
+    """
+    Arquivos lidos por `_carregar_motor`, observados pelo `MicroLote` para trocar o modelo.
+    """
+    if motor == "numpy":
+        return [model_path.with_suffix(".npz")]
+    if motor == "tabela":
+        return [_caminho_booster(model_path), caminho_tabela(model_path)]
+    return [_caminho_booster(model_path)]
+
+
+def _carregar_motor(motor: str, model_path: Path, vocabularios_path: Path) -> Tuple[object, FeaturePipeline]:
+    """
+    Carrega (modelo, pipeline) do motor escolhido a partir dos artefatos em disco.
+    """
+    if motor == "numpy":
+        modelo = FlorestaNumpy.carregar(model_path.with_suffix(".npz"))
+        if modelo.pipeline is None:
+            raise typer.BadParameter("o .npz não tem o pipeline de features; gere-o novamente pelo treino")
+        return modelo, modelo.pipeline
+
+    from x_health.features import pipeline_do_modelo
+    from x_health.modeling.predict import carregar_modelo
+
+    modelo = carregar_modelo(model_path)
+    pipeline = pipeline_do_modelo(modelo, vocabularios_path)
+    if motor == "tabela":
+        # recusa tabela compilada para outro modelo (ValueError) ou com outras colunas
+        modelo = TabelaEscores.carregar(caminho_tabela(model_path), reserva=modelo)
+        if modelo.colunas != pipeline.colunas:
+            raise typer.BadParameter(
+                f"colunas da tabela ({modelo.colunas}) diferem das do pipeline ({pipeline.colunas}); "
+                "recompile com tabela.py"
+            )
+    return modelo, pipeline
+
+
+@app.command()
+def main(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    vocabularios_path: Path = MODELS_DIR / "vocabularios.json",
+    host: str = "127.0.0.1",
+    porta: int = 8000,
+    tamanho_max: int = 256,
+    espera_max_ms: float = 5.0,
+    limiar: float = 0.5,
+    timeout: float = 30.0,
+    motor: str = typer.Option("xgboost", help="xgboost, numpy (árvores em .npz, sem o xgboost) ou tabela (.tabela.npz)"),
+    cache_tamanho: int = typer.Option(0, help="Vetores guardados no cache de predições (0 desliga)"),
+    cache_ttl_s: Optional[float] = typer.Option(None, help="Validade de cada entrada do cache, em segundos"),
+    cache_casas: Optional[int] = typer.Option(None, help="Casas decimais do arredondamento das features na chave"),
+):
+    """
+    Sobe um serviço local de pontuação: o modelo é carregado uma única vez e as
+    requisições POST /prever são agrupadas em micro-lotes.
+
+    Com `--motor numpy`, as árvores são avaliadas pela `FlorestaNumpy` gravada pelo treino
+    ao lado do modelo (.npz), e o xgboost nem chega a ser importado. Com `--motor tabela`,
+    os escores vêm da `TabelaEscores` compilada por `tabela.py` (.tabela.npz), e o Booster
+    só pontua as linhas com valores nulos.
+
+    Com `--cache-tamanho`, vetores de features repetidos são respondidos por um cache LRU
+    (`CachePredicoes`), e GET /cache devolve os contadores de acerto.
+
+    Se os artefatos do motor forem regravados (novo treino ou `update`), o modelo é
+    recarregado antes do lote seguinte e o cache é esvaziado.
+    """
+    if motor not in ["xgboost", "numpy", "tabela"]:
+        raise typer.BadParameter(f"motor desconhecido: '{motor}' (use xgboost, numpy ou tabela)")
+
+    def recarregar():
+        return _carregar_motor(motor, model_path, vocabularios_path)
+
+    modelo, pipeline = recarregar()
+    cache = CachePredicoes(cache_tamanho, cache_ttl_s, cache_casas) if cache_tamanho > 0 else None
+    micro_lote = MicroLote(
+        modelo, pipeline, tamanho_max, espera_max_ms, limiar, cache,
+        recarregar=recarregar, artefatos=_artefatos_motor(motor, model_path),
+    )
+    servidor = ThreadingHTTPServer((host, porta), _criar_handler(micro_lote, timeout))
+
+    logger.success(
+        f"Serviço de predição em http://{host}:{porta}/prever "
+        f"(motor {motor}, lote máx. {tamanho_max}, espera máx. {espera_max_ms} ms)"
+    )
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Encerrando serviço...")
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    configurar()
+    app()
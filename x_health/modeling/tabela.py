@@ -0,0 +1,329 @@
+from pathlib import Path
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+import typer
+from loguru import logger
+
+# informação de diretórios
+from x_health.config import MODELS_DIR, configurar
+from x_health.dataset import DATASET_PATH, carregar_dataset
+from x_health.modeling.floresta import FlorestaNumpy
+
+app = typer.Typer()
+
+
+#######################################
+#     TABELA DE ESCORES PRÉ-CALCULADA #
+#######################################
+class TabelaEscores:
+    """
+    Escores do modelo pré-calculados para as combinações de intervalos mais frequentes das
+    features, com o modelo reserva pontuando o restante.
+
+    Cada árvore só compara a feature j com os limiares dos seus splits, então dois valores
+    entre os mesmos limiares consecutivos (em todas as árvores) seguem exatamente os mesmos
+    caminhos. Os limiares de cada feature dividem a reta em intervalos, e a margem é
+    constante em cada combinação de intervalos. O produto dos intervalos de todas as
+    features, porém, é grande demais para virar uma tabela: no modelo atual são 2, 18, 17,
+    5, 138, 6, 4, 201 e 234 intervalos (na ordem de COLUNAS_MODELO), cerca de 4,8e11
+    células, já que ioi_3months, razao_valor_vencido e historico_pagamento são contínuas.
+
+    Por isso a tabela cobre um domínio: para cada feature, só os intervalos mais
+    frequentes numa amostra da base, escolhidos de modo que o produto caiba em
+    `celulas_max` perdendo o mínimo de cobertura. Pontuar vira `searchsorted` por
+    feature, uma soma de índices e uma leitura no array; linhas com algum valor fora do
+    domínio ou nulo (que segue a direção padrão de cada split) vão para o modelo reserva.
+
+    As margens são quantizadas em `bits` bits (8 ou 16; 32 guarda float32 sem quantizar).
+    O erro da quantização é certificado: no máximo `escala / 2` na margem e, como a
+    derivada da sigmoide não passa de 1/4, no máximo `escala / 8` na probabilidade. As
+    linhas pontuadas pela reserva não têm erro de quantização.
+
+    Parâmetros:
+    -----------
+    cortes : List[np.ndarray]
+        Limiares distintos de cada feature, em ordem crescente.
+    posicoes : List[np.ndarray]
+        Para cada feature, a posição de cada intervalo no domínio da tabela (-1 se fora).
+    codigos : np.ndarray
+        Margens quantizadas (ou float32), achatadas em ordem C sobre o domínio.
+    escala, minimo : float
+        Margem = minimo + codigo * escala.
+    colunas : List[str]
+        Colunas esperadas, na ordem da matriz de entrada.
+    impressao : str
+        `FlorestaNumpy.impressao` das árvores de que a tabela foi compilada.
+    reserva : xgboost.Booster ou FlorestaNumpy, opcional (default=None)
+        Modelo usado fora do domínio e nas linhas com nulos; precisa ter as mesmas árvores.
+    """
+
+    def __init__(
+        self,
+        cortes: List[np.ndarray],
+        posicoes: List[np.ndarray],
+        codigos: np.ndarray,
+        escala: float,
+        minimo: float,
+        colunas: List[str],
+        impressao: str,
+        reserva=None,
+    ):
+        self.cortes = cortes
+        self.posicoes = posicoes
+        self.codigos = codigos
+        self.escala = escala
+        self.minimo = minimo
+        self.colunas = list(colunas)
+        self.impressao = impressao
+        self.reserva = None
+        if reserva is not None:
+            self.vincular_reserva(reserva)
+        formato = [int(p.max()) + 1 for p in posicoes]
+        self.passos = np.array([int(np.prod(formato[j + 1:])) for j in range(len(formato))], dtype=np.int64)
+
+    def vincular_reserva(self, reserva) -> None:
+        """
+        Define o modelo reserva, recusando (ValueError) um modelo com outras árvores: depois
+        de um `train` ou `train update`, a tabela antiga daria escores de um modelo e a
+        reserva, de outro.
+        """
+        floresta = reserva if isinstance(reserva, FlorestaNumpy) else FlorestaNumpy.de_booster(reserva)
+        if floresta.impressao() != self.impressao:
+            raise ValueError("A tabela de escores foi compilada para outro modelo; recompile com tabela.py")
+        self.reserva = reserva
+
+    @property
+    def erro_max_probabilidade(self) -> float:
+        """
+        Limite do erro de quantização na probabilidade (0 quando guardada em float32).
+        """
+        return self.escala / 8 if self.codigos.dtype != np.float32 else 0.0
+
+    @property
+    def tamanho_bytes(self) -> int:
+        return self.codigos.nbytes + sum(c.nbytes + p.nbytes for c, p in zip(self.cortes, self.posicoes))
+
+    @staticmethod
+    def _escolher_dominio(frequencias: List[np.ndarray], celulas_max: int) -> List[np.ndarray]:
+        """
+        Intervalos mantidos de cada feature. Parte de todos e, enquanto o produto passar de
+        `celulas_max`, tira o intervalo menos frequente da feature em que isso custa menos
+        cobertura por redução (em log) do tamanho da tabela. Cada feature mantém ao menos
+        o seu intervalo mais frequente.
+        """
+        ordens = [np.argsort(-f, kind="stable") for f in frequencias]
+        fracoes = [f / f.sum() if f.sum() else np.zeros(len(f)) for f in frequencias]
+        mantidos = [len(f) for f in frequencias]
+
+        while np.sum(np.log(mantidos)) > np.log(celulas_max):
+            custos = [
+                fracao[ordem[k - 1]] / np.log(k / (k - 1)) if k > 1 else np.inf
+                for fracao, ordem, k in zip(fracoes, ordens, mantidos)
+            ]
+            mantidos[int(np.argmin(custos))] -= 1
+
+        return [np.sort(ordem[:k]) for ordem, k in zip(ordens, mantidos)]
+
+    @classmethod
+    def compilar(
+        cls,
+        floresta: FlorestaNumpy,
+        X: Optional[np.ndarray] = None,
+        bits: int = 16,
+        celulas_max: int = 10_000_000,
+        tamanho_bloco: int = 65_536,
+    ) -> "TabelaEscores":
+        """
+        Escolhe o domínio da tabela e calcula a margem de cada combinação de intervalos com
+        a `FlorestaNumpy`, em blocos de `tamanho_bloco` células.
+
+        Parâmetros:
+        -----------
+        floresta : FlorestaNumpy
+            Árvores do modelo (ver `FlorestaNumpy.de_booster`).
+        X : np.ndarray, opcional (default=None)
+            Amostra da base (matriz de features) usada para medir a frequência de cada
+            intervalo. Se None, a tabela cobre todos os intervalos e a compilação é
+            recusada com ValueError quando eles não cabem em `celulas_max`.
+        bits : int, opcional (default=16)
+            Bits por célula: 8, 16 ou 32 (float32, sem quantização).
+        celulas_max : int, opcional (default=10000000)
+            Limite de células da tabela.
+
+        Retorno:
+        --------
+        TabelaEscores
+            Tabela compilada, sem modelo reserva.
+        """
+        if bits not in (8, 16, 32):
+            raise ValueError(f"bits deve ser 8, 16 ou 32 (recebido: {bits})")
+
+        nos = np.arange(len(floresta.esquerda))
+        split = floresta.esquerda != nos
+        cortes = [
+            np.unique(floresta.limiar[split & (floresta.atributo == j)]).astype(np.float32)
+            for j in range(len(floresta.colunas))
+        ]
+        intervalos = [len(c) + 1 for c in cortes]
+        descricao = ", ".join(f"{col}={n}" for col, n in zip(floresta.colunas, intervalos))
+        logger.info(f"Intervalos por feature: {descricao}")
+
+        if X is None:
+            if np.sum(np.log(intervalos)) > np.log(celulas_max):
+                raise ValueError(
+                    f"Os intervalos de todas as features ({descricao}) excedem {celulas_max:,} células; "
+                    "informe uma amostra da base para restringir o domínio"
+                )
+            dominios = [np.arange(n) for n in intervalos]
+        else:
+            X = np.asarray(X, dtype=np.float32)
+            frequencias = [
+                np.bincount(np.searchsorted(c, X[~np.isnan(X[:, j]), j], side="right"), minlength=len(c) + 1)
+                for j, c in enumerate(cortes)
+            ]
+            dominios = cls._escolher_dominio(frequencias, celulas_max)
+
+        posicoes = []
+        for n, dominio in zip(intervalos, dominios):
+            posicao = np.full(n, -1, dtype=np.int32)
+            posicao[dominio] = np.arange(len(dominio))
+            posicoes.append(posicao)
+
+        # representante de cada intervalo: abaixo do primeiro limiar e então cada limiar
+        # (x < limiar vai à esquerda, então o próprio limiar já está no intervalo seguinte)
+        representantes = [
+            np.concatenate([[np.nextafter(c[0], np.float32(-np.inf)) if len(c) else 0], c]).astype(np.float32)[dominio]
+            for c, dominio in zip(cortes, dominios)
+        ]
+        formato = tuple(len(d) for d in dominios)
+        celulas = int(np.prod(formato))
+
+        margens = np.empty(celulas, dtype=np.float64)
+        for inicio in range(0, celulas, tamanho_bloco):
+            indices = np.unravel_index(np.arange(inicio, min(inicio + tamanho_bloco, celulas)), formato)
+            linhas = np.column_stack([r[i] for r, i in zip(representantes, indices)])
+            margens[inicio:inicio + len(linhas)] = floresta.margem(linhas)
+
+        minimo = float(margens.min())
+        if bits == 32:
+            return cls(cortes, posicoes, margens.astype(np.float32), 0.0, 0.0, floresta.colunas, floresta.impressao())
+
+        niveis = 2 ** bits - 1
+        escala = (float(margens.max()) - minimo) / niveis or 1.0
+        codigos = np.rint((margens - minimo) / escala).astype(np.uint8 if bits == 8 else np.uint16)
+        return cls(cortes, posicoes, codigos, escala, minimo, floresta.colunas, floresta.impressao())
+
+    def indices(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posição de cada linha na tabela e máscara das linhas fora dela (valor fora do
+        domínio ou nulo); a posição dessas linhas não tem significado.
+        """
+        indice = np.zeros(len(X), dtype=np.int64)
+        fora = np.isnan(X).any(axis=1)
+        for j, (c, posicao) in enumerate(zip(self.cortes, self.posicoes)):
+            p = posicao[np.searchsorted(c, X[:, j], side="right")]
+            fora |= p < 0
+            indice += np.maximum(p, 0) * self.passos[j]
+        return indice, fora
+
+    def cobertura(self, X: np.ndarray) -> float:
+        """
+        Fração das linhas de `X` pontuadas pela tabela (as demais vão para a reserva).
+        """
+        _, fora = self.indices(np.asarray(X, dtype=np.float32))
+        return 1.0 - float(fora.mean()) if len(fora) else 1.0
+
+    def prever(self, X: np.ndarray) -> np.ndarray:
+        """
+        Probabilidade da classe 1; linhas fora do domínio ou com nulos vão para o modelo reserva.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        indice, fora = self.indices(X)
+        codigos = self.codigos[indice[~fora]]
+        if self.codigos.dtype == np.float32:
+            margem = codigos.astype(np.float64)
+        else:
+            margem = self.minimo + codigos * self.escala
+
+        probabilidade = np.empty(len(X), dtype=np.float32)
+        probabilidade[~fora] = 1.0 / (1.0 + np.exp(-margem))
+
+        if fora.any():
+            if self.reserva is None:
+                raise ValueError("Linhas fora do domínio da tabela exigem um modelo reserva")
+            if isinstance(self.reserva, FlorestaNumpy):
+                probabilidade[fora] = self.reserva.prever(X[fora])
+            else:
+                probabilidade[fora] = self.reserva.inplace_predict(X[fora])
+
+        return probabilidade
+
+    def salvar(self, caminho: Path) -> None:
+        np.savez(
+            caminho,
+            codigos=self.codigos, escala=self.escala, minimo=self.minimo,
+            colunas=np.array(self.colunas), impressao=self.impressao,
+            **{f"cortes_{j}": c for j, c in enumerate(self.cortes)},
+            **{f"posicoes_{j}": p for j, p in enumerate(self.posicoes)},
+        )
+
+    @classmethod
+    def carregar(cls, caminho: Path, reserva=None) -> "TabelaEscores":
+        with np.load(caminho) as dados:
+            colunas = dados["colunas"].tolist()
+            return cls(
+                cortes=[dados[f"cortes_{j}"] for j in range(len(colunas))],
+                posicoes=[dados[f"posicoes_{j}"] for j in range(len(colunas))],
+                codigos=dados["codigos"],
+                escala=float(dados["escala"]),
+                minimo=float(dados["minimo"]),
+                colunas=colunas,
+                impressao=str(dados["impressao"]),
+                reserva=reserva,
+            )
+
+
+def caminho_tabela(model_path: Path) -> Path:
+    return Path(model_path).with_suffix(".tabela.npz")
+
+
+@app.command()
+def main(
+    model_path: Path = MODELS_DIR / "modelo_xgboost.ubj",
+    features_path: Path = DATASET_PATH,
+    amostra: int = 200_000,
+    bits: int = 16,
+    celulas_max: int = 10_000_000,
+    seed: int = 42,
+):
+    """
+    Compila a tabela de escores do modelo, com o domínio escolhido numa amostra de
+    `amostra` linhas da base, e a salva ao lado do modelo (.tabela.npz).
+    """
+    from x_health.features import pipeline_do_modelo
+    from x_health.modeling.predict import carregar_modelo
+
+    inicio = time.perf_counter()
+    modelo = carregar_modelo(model_path)
+    pipeline = pipeline_do_modelo(modelo)
+    X = pipeline.transform(carregar_dataset(features_path, colunas=pipeline.colunas_brutas()))
+    if len(X) > amostra:
+        X = X[np.random.default_rng(seed).choice(len(X), amostra, replace=False)]
+
+    tabela = TabelaEscores.compilar(FlorestaNumpy.de_booster(modelo), X, bits=bits, celulas_max=celulas_max)
+    tabela.salvar(caminho_tabela(model_path))
+
+    for col, c, posicao in zip(tabela.colunas, tabela.cortes, tabela.posicoes):
+        logger.info(f"{col:<24} {int(posicao.max()) + 1:6d} de {len(c) + 1:6d} intervalos na tabela")
+    logger.success(
+        f"Tabela com {tabela.codigos.size:,} células ({tabela.tamanho_bytes / 2**20:.1f} MiB, {bits} bits) "
+        f"compilada em {time.perf_counter() - inicio:.1f}s; cobre {tabela.cobertura(X):.1%} da amostra; "
+        f"erro máx. na probabilidade {tabela.erro_max_probabilidade:.2e}. Salva em: {caminho_tabela(model_path)}"
+    )
+
+
+if __name__ == "__main__":
+    configurar()
+    app()
@@ -9,112 +9,650 @@ warnings.filterwarnings('ignore')
 from x_health.config import *
 # arquivo auxiliar
 from x_health.xgboost_utils import *
+from x_health.features import COLUNAS_MODELO, FeaturePipeline, pipeline_do_modelo
+from x_health.agrupamentos import COLUNAS_PRAZO
+from x_health.dataset import DATASET_PATH, carregar_dataset
+from x_health.modeling.floresta import FlorestaNumpy
+from x_health.modeling.predict import carregar_modelo
+from x_health.modeling.tabela import caminho_tabela
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import multiprocessing
+import os
 from pathlib import Path
+import tempfile
+import time
+from typing import Optional, Tuple
 
 import typer
 from loguru import logger
 from tqdm import tqdm
         
-import pandas as pd
 import numpy as np
 import xgboost as xgb
-import optuna
 import pickle
 
 
 app = typer.Typer()
 
+# hiperparâmetros encontrados no notebook 02-xgboost, usados quando ainda não há resultado do `tune`
+PARAMETROS_PADRAO = {
+    'objective': 'binary:logistic',
+    'eval_metric': 'auc',
+    'scale_pos_weight': 4.375905217516745, 
+    'max_depth': 6, 
+    'learning_rate': 0.2727069825106735, 
+    'lambda': 8.087940526870096, 
+    'alpha': 1.3597159615097383, 
+    'min_child_weight': 8, 
+    'gamma': 0.7339255157763341
+}
+
+PARAMETROS_PATH = MODELS_DIR / "melhores_parametros.json"
+OPTUNA_STORAGE = f"sqlite:///{MODELS_DIR / 'optuna.db'}"
+
+
+#################################
+#       PREPARO DOS DADOS       #
+#################################
+def preparar_treino(features_path: Path, incluir_prazos: bool, var_alvo: str):
+    """
+    Carrega a base, calcula as features com um novo FeaturePipeline e separa treino e
+    teste por índices (estratificado, 80/20, semente 42).
+
+    Retorno:
+    --------
+    Tuple[FeaturePipeline, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        pipeline ajustado, matriz de features X, alvo y, índices de treino e de teste.
+    """
+    #################################
+    #      SELEÇÃO DE FEATURES      #
+    #################################
+    colunas = list(COLUNAS_MODELO)
+    # prazos numéricos da forma de pagamento como features adicionais
+    if incluir_prazos:
+        colunas = colunas + COLUNAS_PRAZO
+    pipeline = FeaturePipeline(colunas)
+
+    #importando a base do arquivo externo, só com as colunas usadas e tipos compactos
+    df = carregar_dataset(features_path, colunas=pipeline.colunas_brutas() + [var_alvo])
+    logger.info(f'Base importada com tamanho: {len(df)}')
+
+    ############################
+    #      TRANSFORMAÇÕES      #
+    ############################
+    # flag_valor_vencido, forma_pagamento_agrup, periodo_fiscal, razao_valor_vencido,
+    # historico_pagamento e codificação das categóricas, numa única passada (ver FeaturePipeline)
+    X = pipeline.fit_transform(df)
+    y = df[var_alvo].to_numpy()
+
+    ## separar em teste e treino por índices, sem copiar o DataFrame
+    idx_train, idx_test = indices_estratificados(y, test_size=0.2, random_state=42)
+    return pipeline, X, y, idx_train, idx_test
+
+
+def carregar_parametros(params_path: Path = PARAMETROS_PATH):
+    """
+    Lê os hiperparâmetros salvos pelo comando `tune`. Sem o arquivo, usa PARAMETROS_PADRAO.
+
+    Retorno:
+    --------
+    Tuple[dict, int]
+        Parâmetros do XGBoost e quantidade de rodadas de boosting.
+    """
+    if not Path(params_path).exists():
+        logger.warning(f"{params_path} não encontrado: usando os parâmetros padrão do notebook.")
+        return dict(PARAMETROS_PADRAO), 100
+
+    with open(params_path, "r") as file:
+        artefato = json.load(file)
+    logger.info(f"Parâmetros do estudo '{artefato['estudo']}' (AUC CV {artefato['melhor_auc']:.4f})")
+    return artefato["params"], artefato["num_boost_round"]
+
+
+#################################
+#   DIVISÃO TREINO/TESTE SALVA  #
+#################################
+def caminho_divisao(model_path: Path) -> Path:
+    return Path(model_path).with_suffix(".divisao.npz")
+
+
+def _impressao_alvo(y: np.ndarray) -> str:
+    return hashlib.blake2b(np.ascontiguousarray(y, dtype=np.int8).tobytes(), digest_size=16).hexdigest()
+
+
+def salvar_divisao(caminho: Path, teste: np.ndarray, conhecida: np.ndarray, y: np.ndarray) -> None:
+    """
+    Salva as máscaras por linha da base usada no treino: `teste` (linhas do holdout, que o
+    modelo nunca viu) e `conhecida` (linhas já usadas no treino ou no holdout), junto com
+    um hash do alvo dessas linhas para detectar uma base reordenada ou editada.
+    """
+    np.savez(caminho, teste=teste, conhecida=conhecida, alvo=_impressao_alvo(y))
+
+
+def carregar_divisao(caminho: Path, y: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Lê as máscaras de `salvar_divisao` e as estende até `len(y)`: linhas acrescentadas à
+    base depois do treino não são de teste nem conhecidas.
+
+    Retorno:
+    --------
+    Tuple[np.ndarray, np.ndarray] ou None
+        Máscaras (teste, conhecida), ou None quando o arquivo não existe.
+    """
+    if not Path(caminho).exists():
+        return None
+
+    with np.load(caminho) as dados:
+        teste, conhecida, alvo = dados["teste"], dados["conhecida"], str(dados["alvo"])
+
+    n = len(teste)
+    if len(y) < n or _impressao_alvo(y[:n]) != alvo:
+        raise ValueError(
+            f"A base não começa pelas {n} linhas usadas no treino (linhas removidas, reordenadas "
+            f"ou editadas); a divisão em {caminho} não vale mais. Treine o modelo de novo."
+        )
+
+    extra = np.zeros(len(y) - n, dtype=bool)
+    return np.concatenate([teste, extra]), np.concatenate([conhecida, extra])
+
+
+def salvar_modelo(
+    modelo,
+    pipeline: FeaturePipeline,
+    model_path: Path,
+    divisao: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+) -> None:
+    """
+    Grava o pipeline de features dentro do modelo e salva o modelo em pickle, no formato
+    nativo do XGBoost (.ubj) e em tabelas NumPy (.npz), além do pipeline em JSON ao lado.
+
+    `divisao` é a tripla (teste, conhecida, y) gravada por `salvar_divisao`, que o `update`
+    usa para avaliar só em linhas que o modelo nunca viu. Sem ela, uma divisão de um modelo
+    anterior é apagada.
+    """
+    # O pipeline de features vai gravado dentro do modelo, para a predição usar o mesmo código
+    pipeline.gravar_no_modelo(modelo)
+    
+    #################################
+    #       SALVAR PICKLE           #
+    #################################
+    with open(model_path, "wb") as file:
+        pickle.dump(modelo, file)
+
+    print(f"Modelo salvo em: {model_path}")
+
+    # Formato nativo do XGBoost (UBJSON), bem mais rápido de carregar que o pickle
+    modelo.save_model(model_path.with_suffix(".ubj"))
+    print(f"Modelo salvo em: {model_path.with_suffix('.ubj')}")
+
+    pipeline.salvar(model_path.with_name("pipeline_features.json"))
+
+    # Tabelas planas das árvores, para servir só com NumPy (ver x_health.modeling.floresta)
+    try:
+        FlorestaNumpy.de_booster(modelo).salvar(model_path.with_suffix(".npz"))
+        print(f"Modelo salvo em: {model_path.with_suffix('.npz')}")
+    except NotImplementedError as erro:
+        logger.warning(f"Modelo não exportado para NumPy: {erro}")
+
+    if divisao is not None:
+        salvar_divisao(caminho_divisao(model_path), *divisao)
+    elif caminho_divisao(model_path).exists():
+        caminho_divisao(model_path).unlink()
+        logger.info(f"{caminho_divisao(model_path)} era de outro modelo e foi removida")
+
+    # a tabela de escores depende de uma amostra da base e não é refeita aqui; o serviço
+    # recusa carregá-la enquanto não for recompilada (ver TabelaEscores.vincular_reserva)
+    if caminho_tabela(model_path).exists():
+        logger.warning(
+            f"{caminho_tabela(model_path)} foi compilada para o modelo anterior; "
+            "recompile com x_health/modeling/tabela.py"
+        )
+
 
 @app.command()
 def main(
     # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    features_path: Path = EXTERNAL_DATA_DIR / "dataset_2021-5-26-10-14.csv.csv",
-    labels_path: Path = PROCESSED_DATA_DIR / "labels.csv",
-    model_path: Path = MODELS_DIR / "modelo_xgboost.pkl"
+    features_path: Path = DATASET_PATH,
+    model_path: Path = MODELS_DIR / "modelo_xgboost.pkl",
+    params_path: Path = PARAMETROS_PATH,
+    incluir_prazos: bool = False,
+    var_alvo: str = "default"
     # -----------------------------------------
 ):
     # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    
-    #importando a base do arquivo externo
-    df = pd.read_csv(features_path, sep = '\t', encoding='utf-8', na_values="missing")
-    backup = df.copy()
-    #logger.info(f'Base importada com tamanho: {len(df)}')
+    pipeline, X, y, idx_train, idx_test = preparar_treino(features_path, incluir_prazos, var_alvo)
+    colunas = pipeline.colunas
 
-    ############################
-    #      TRANSFORMAÇÕES      #
-    ############################
-    ### criar flag_valor_vencido
-    df["flag_valor_vencido"] = (df["valor_vencido"] > 0).astype(int)
-    ## criar agrupamento da forma de pagamento
-    df['forma_pagamento_agrup'] = agrupar_prazo(df, 'forma_pagamento')
-    #Cria separação por trimestres
-    df["periodo_fiscal"] = df["month"].apply(lambda x: "1T" if x in [1, 2, 3] else 
-                                            "2T" if x in [4, 5, 6] else 
-                                            "3T" if x in [7, 8, 9] else "4T")
-    # Criar razão entre valor vencido e valor total pago(+1 para evitar divisão por 0)
-    df["razao_valor_vencido"] = df["valor_vencido"] / (df["valor_quitado"] + 1)
-    # Criar histórico de pagamento como proporção de valores pagos em relação ao vencido
-    df["historico_pagamento"] = df["valor_quitado"] / (df["valor_quitado"] + df["valor_vencido"] + 1)
-    
-    #PREENCHIMENTO DE NAN E TRATAMENTO
-    df = tratar_categoricas(df)
-    
     #################################
-    #      SELEÇÃO DE FEATURES      #
+    #           MODELO FINAL        #
     #################################
-    colunas = [ # lista de colunas a serem utilizadas    
-    'flag_valor_vencido',
-    'quant_protestos',
-    'default_3months',
-    'opcao_tributaria',
-    'razao_valor_vencido',
-    'forma_pagamento_agrup',
-    'periodo_fiscal',
-    'ioi_3months',
-    'historico_pagamento',
-]
+    y_train, y_test = y[idx_train], y[idx_test]
+    # Criando os DMatrix para XGBoost
+    dtrain = xgb.DMatrix(X[idx_train], label=y_train, feature_names=colunas)
+    dtest = xgb.DMatrix(X[idx_test], label=y_test, feature_names=colunas)
+
     # Calcular scale_pos_weight
     contagem_classes = np.bincount(y_train)  # Conta os valores 0 e 1 no y_train
     scale_pos_weight = contagem_classes[0] / contagem_classes[1]
     print(f"scale_pos_weight sugerido: {scale_pos_weight:.2f}")
-    
-    #################################
-    #           MODELO FINAL        #
-    #################################
-    ## preparar variaveis e separar em teste e treino
-    X_train, X_test, y_train, y_test = preparar_dados(df[colunas + [var_alvo]], target=var_alvo)
-    # Criando os DMatrix para XGBoost
-    dtrain = xgb.DMatrix(X_train, label=y_train)
-    dtest = xgb.DMatrix(X_test, label=y_test)
 
-    # Configuração do modelo
-    params = {
-    'scale_pos_weight': 4.375905217516745, 
-    'max_depth': 6, 
-    'learning_rate': 0.2727069825106735, 
-    'n_estimators': 120, 
-    'lambda': 8.087940526870096, 
-    'alpha': 1.3597159615097383, 
-    'min_child_weight': 8, 
-    'gamma': 0.7339255157763341
-    }
+    # Configuração do modelo: melhores parâmetros do `tune`, se houver
+    best_params, num_boost_round = carregar_parametros(params_path)
 
     # Treinando o modelo
-    xgb_optimized = xgb.train(best_params, dtrain, num_boost_round=100)
+    xgb_optimized = xgb.train(best_params, dtrain, num_boost_round=num_boost_round)
     metrica_final = avaliar_XGBoost(xgb_optimized, dtrain, y_train, dtest, y_test)
-    
-    
-    #################################
-    #       SALVAR PICKLE           #
-    #################################
-    with open(model_path, "wb") as file:
-        pickle.dump(model, file)
+    logger.info(f"\n{metrica_final.to_string(index=False)}")
 
-    print(f"Modelo salvo em: {model_path}")
+    # linhas de teste e de treino, para o `update` avaliar só no que o modelo nunca viu
+    teste = np.zeros(len(y), dtype=bool)
+    teste[idx_test] = True
+    salvar_modelo(xgb_optimized, pipeline, model_path, divisao=(teste, np.ones(len(y), dtype=bool), y))
 
     # -----------------------------------------
 
 
+#################################
+#    TREINO FORA DA MEMÓRIA     #
+#################################
+class IteradorBlocos(xgb.DataIter):
+    """
+    Entrega a base ao XGBoost em blocos de `chunksize` linhas, lidos por `carregar_dataset`
+    e transformados pelo pipeline de features um a um, sem nunca carregar a base inteira.
+
+    A separação treino/teste é feita dentro de cada bloco, com um sorteio reproduzível
+    (semente + número do bloco), de modo que "treino" e "teste" são sempre complementares.
+
+    Parâmetros:
+    -----------
+    caminho : Path
+        Base externa (ou seu cache em Parquet, via `carregar_dataset`).
+    pipeline : FeaturePipeline
+        Pipeline já ajustado (ver `FeaturePipeline.partial_fit`).
+    var_alvo : str
+        Coluna da variável alvo.
+    parte : str, opcional (default="treino")
+        "treino" ou "teste".
+    chunksize : int, opcional (default=200000)
+        Linhas por bloco.
+    fracao_teste : float, opcional (default=0.2)
+        Fração das linhas de cada bloco reservada para teste.
+    seed : int, opcional (default=42)
+        Semente do sorteio.
+    cache_prefix : str, opcional (default=None)
+        Prefixo dos arquivos em disco da memória externa do XGBoost.
+    """
+
+    def __init__(
+        self,
+        caminho: Path,
+        pipeline: FeaturePipeline,
+        var_alvo: str,
+        parte: str = "treino",
+        chunksize: int = 200_000,
+        fracao_teste: float = 0.2,
+        seed: int = 42,
+        cache_prefix: str = None
+    ):
+        self.caminho = caminho
+        self.pipeline = pipeline
+        self.var_alvo = var_alvo
+        self.parte = parte
+        self.chunksize = chunksize
+        self.fracao_teste = fracao_teste
+        self.seed = seed
+        self._blocos = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def blocos(self):
+        """
+        Gera (X, y) de cada bloco, já filtrados pela parte escolhida.
+        """
+        colunas = self.pipeline.colunas_brutas() + [self.var_alvo]
+        for i, bloco in enumerate(carregar_dataset(self.caminho, colunas=colunas, chunksize=self.chunksize)):
+            teste = np.random.default_rng([self.seed, i]).random(len(bloco)) < self.fracao_teste
+            mascara = teste if self.parte == "teste" else ~teste
+            yield self.pipeline.transform(bloco)[mascara], bloco[self.var_alvo].to_numpy()[mascara]
+
+    def reset(self):
+        self._blocos = None
+
+    def next(self, input_data) -> int:
+        if self._blocos is None:
+            self._blocos = self.blocos()
+        try:
+            X, y = next(self._blocos)
+        except StopIteration:
+            return 0
+
+        input_data(data=X, label=y, feature_names=self.pipeline.colunas)
+        return 1
+
+
+@app.command()
+def externo(
+    features_path: Path = DATASET_PATH,
+    model_path: Path = MODELS_DIR / "modelo_xgboost.pkl",
+    params_path: Path = PARAMETROS_PATH,
+    chunksize: int = 200_000,
+    cache_dir: Path = INTERIM_DATA_DIR / "xgboost_cache",
+    incluir_prazos: bool = False,
+    var_alvo: str = "default",
+):
+    """
+    Treino com memória externa: a base é lida em blocos, as features são calculadas bloco
+    a bloco e o XGBoost guarda as páginas da matriz em `cache_dir`. O pico de memória fica
+    limitado a um bloco mais as páginas em uso, independente do tamanho do histórico.
+    """
+    colunas = list(COLUNAS_MODELO) + (COLUNAS_PRAZO if incluir_prazos else [])
+    pipeline = FeaturePipeline(colunas)
+
+    # 1ª passada: vocabulários das categóricas
+    for bloco in tqdm(carregar_dataset(features_path, colunas=pipeline.colunas_brutas(), chunksize=chunksize), desc="vocabulários"):
+        pipeline.partial_fit(bloco)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    iterador = IteradorBlocos(features_path, pipeline, var_alvo, "treino", chunksize, cache_prefix=str(cache_dir / "treino"))
+    dtrain = xgb.DMatrix(iterador)
+    logger.info(f"Matriz externa de treino: {dtrain.num_row()} linhas")
+
+    params, num_boost_round = carregar_parametros(params_path)
+    modelo = xgb.train({**params, "tree_method": "hist"}, dtrain, num_boost_round=num_boost_round)
+
+    # avaliação no teste, também em blocos
+    teste = IteradorBlocos(features_path, pipeline, var_alvo, "teste", chunksize)
+    y_teste, prob_teste = [], []
+    for X, y in teste.blocos():
+        prob_teste.append(modelo.predict(xgb.DMatrix(X, feature_names=pipeline.colunas)))
+        y_teste.append(y)
+    y_teste, prob_teste = np.concatenate(y_teste), np.concatenate(prob_teste)
+    metricas, _ = metricas_binarias(y_teste, prob_teste)
+    logger.info(f"Teste: AUC {metricas['AUC-ROC']:.4f} | LogLoss {metricas['Log Loss']:.4f}")
+
+    salvar_modelo(modelo, pipeline, model_path)
+
+
+#################################
+#   ATUALIZAÇÃO COM NOVO MÊS    #
+#################################
+@app.command()
+def update(
+    ano: int,
+    mes: int,
+    features_path: Path = DATASET_PATH,
+    model_path: Path = MODELS_DIR / "modelo_xgboost.pkl",
+    params_path: Path = PARAMETROS_PATH,
+    n_rodadas: int = 20,
+    tolerancia_auc: float = 0.002,
+    comparar: bool = False,
+    var_alvo: str = "default",
+):
+    """
+    Atualiza o modelo salvo com as linhas de um novo mês (`ano`/`mes`), acrescentando
+    `n_rodadas` rodadas de boosting a partir do modelo atual (`xgb_model=`), sem refazer
+    o treino do zero.
+
+    O pipeline de features do modelo é mantido (mesmos vocabulários). A atualização só é
+    gravada se a AUC no holdout não cair mais que `tolerancia_auc`. O holdout tem só linhas
+    que o modelo nunca viu: o teste do treino original (e dos updates anteriores), lido da
+    divisão salva ao lado do modelo (`caminho_divisao`), mais 20% do novo mês. Sem essa
+    divisão (modelos antigos ou do `externo`), o holdout fica só com o novo mês.
+
+    Com `comparar`, um treino completo equivalente também é feito e cronometrado, para
+    medir o tempo economizado; fica desligado por padrão porque custa o treino inteiro.
+    """
+    modelo = carregar_modelo(model_path.with_suffix(".ubj"))
+    pipeline = pipeline_do_modelo(modelo)
+    colunas = pipeline.colunas
+
+    colunas_base = list(dict.fromkeys(pipeline.colunas_brutas() + ["year", "month", var_alvo]))
+    df = carregar_dataset(features_path, colunas=colunas_base)
+    X = pipeline.transform(df)
+    y = df[var_alvo].to_numpy()
+
+    novo = ((df["year"] == ano) & (df["month"] == mes)).to_numpy()
+    idx_novo, idx_hist = np.flatnonzero(novo), np.flatnonzero(~novo)
+    if len(np.unique(y[idx_novo])) < 2:
+        raise ValueError(f"{ano}-{mes:02d} precisa ter as duas classes de '{var_alvo}' ({len(idx_novo)} linhas encontradas).")
+    logger.info(f"{len(idx_novo)} linhas novas em {ano}-{mes:02d}, {len(idx_hist)} históricas")
+
+    # histórico: divisão salva no treino original, para o holdout não ter linhas já vistas;
+    # o novo mês é dividido à parte
+    divisao = carregar_divisao(caminho_divisao(model_path), y)
+    if divisao is None:
+        logger.warning(
+            f"{caminho_divisao(model_path)} não encontrada: não há como saber quais linhas "
+            f"históricas o modelo já viu, então o holdout usa só {ano}-{mes:02d}."
+        )
+        hist_train, hist_test = idx_hist, idx_hist[:0]
+    else:
+        teste, conhecida = divisao
+        if conhecida[idx_novo].any():
+            raise ValueError(f"{ano}-{mes:02d} já foi usado no treino ou no holdout deste modelo.")
+        hist_train = np.flatnonzero(conhecida & ~teste & ~novo)
+        hist_test = np.flatnonzero(teste & ~novo)
+    novo_train, novo_test = (idx_novo[i] for i in indices_estratificados(y[idx_novo]))
+    idx_holdout = np.concatenate([hist_test, novo_test])
+
+    dnovo = xgb.DMatrix(X[novo_train], label=y[novo_train], feature_names=colunas)
+    dholdout = xgb.DMatrix(X[idx_holdout], label=y[idx_holdout], feature_names=colunas)
+    dholdout_novo = xgb.DMatrix(X[novo_test], label=y[novo_test], feature_names=colunas)
+
+    params, num_boost_round = carregar_parametros(params_path)
+
+    inicio = time.perf_counter()
+    atualizado = xgb.train(params, dnovo, num_boost_round=n_rodadas, xgb_model=modelo)
+    tempo_atualizacao = time.perf_counter() - inicio
+
+    def auc(booster, dados):
+        return metricas_binarias(dados.get_label(), booster.predict(dados))[0]["AUC-ROC"]
+
+    auc_atual, auc_atualizado = auc(modelo, dholdout), auc(atualizado, dholdout)
+    logger.info(
+        f"AUC holdout: atual {auc_atual:.4f} -> atualizado {auc_atualizado:.4f} | "
+        f"só {ano}-{mes:02d}: {auc(modelo, dholdout_novo):.4f} -> {auc(atualizado, dholdout_novo):.4f}"
+    )
+
+    if comparar:
+        idx_completo = np.concatenate([hist_train, novo_train])
+        dcompleto = xgb.DMatrix(X[idx_completo], label=y[idx_completo], feature_names=colunas)
+        inicio = time.perf_counter()
+        completo = xgb.train(params, dcompleto, num_boost_round=num_boost_round)
+        tempo_completo = time.perf_counter() - inicio
+        logger.info(
+            f"Atualização {tempo_atualizacao:.2f} s x treino completo {tempo_completo:.2f} s "
+            f"({tempo_completo - tempo_atualizacao:.2f} s economizados); "
+            f"AUC holdout do treino completo: {auc(completo, dholdout):.4f}"
+        )
+    else:
+        logger.info(f"Atualização em {tempo_atualizacao:.2f} s")
+
+    if auc_atualizado < auc_atual - tolerancia_auc:
+        logger.warning(f"AUC caiu mais que {tolerancia_auc}: atualização descartada, modelo atual mantido.")
+        return False
+
+    atualizado.set_attr(ultimo_periodo=f"{ano}-{mes:02d}")
+    if divisao is not None:
+        # o novo mês passa a ser conhecido, e a parte dele no holdout continua fora do treino
+        teste[novo_test] = True
+        conhecida[idx_novo] = True
+        divisao = (teste, conhecida, y)
+    salvar_modelo(atualizado, pipeline, model_path, divisao=divisao)
+    logger.success(f"Modelo atualizado com {ano}-{mes:02d}")
+    return True
+
+
+#################################
+#   OTIMIZAÇÃO (OPTUNA) EM LOTE  #
+#################################
+def criar_pruner(nome: str, num_boost_round: int = 100):
+    """
+    Pruner do Optuna aplicado às rodadas de boosting de cada trial.
+
+    Parâmetros:
+    -----------
+    nome : str
+        "hyperband", "mediana" ou "nenhum".
+    num_boost_round : int, opcional (default=100)
+        Máximo de rodadas de um trial (recurso máximo do Hyperband).
+
+    Retorno:
+    --------
+    optuna.pruners.BasePruner
+    """
+    import optuna
+
+    if nome == "hyperband":
+        return optuna.pruners.HyperbandPruner(min_resource=10, max_resource=num_boost_round, reduction_factor=3)
+    if nome == "mediana":
+        return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=10)
+    if nome == "nenhum":
+        return optuna.pruners.NopPruner()
+    raise ValueError(f"Pruner '{nome}' desconhecido: use hyperband, mediana ou nenhum.")
+
+
+def _executar_trials(
+    storage: str,
+    estudo: str,
+    n_trials: int,
+    caminho_dados: str,
+    n_threads: int,
+    scale_pos_weight: float,
+    pruner: str = "hyperband"
+) -> int:
+    """
+    Executa `n_trials` trials do estudo num processo separado. Os dados de treino são
+    abertos com memory-map a partir dos .npy salvos pelo processo principal, os folds são
+    construídos uma única vez para todos os trials do processo, e o XGBoost usa apenas
+    `n_threads` threads.
+    """
+    import optuna
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    X = np.load(Path(caminho_dados) / "X.npy", mmap_mode="r")
+    y = np.load(Path(caminho_dados) / "y.npy", mmap_mode="r")
+    folds = criar_folds(X, y, nfold=5, seed=42, nthread=n_threads)
+
+    study = optuna.load_study(
+        study_name=estudo, storage=_criar_storage(storage), pruner=criar_pruner(pruner)
+    )
+    objetivo = criar_objetivo(folds, scale_pos_weight, n_threads=n_threads, podar=pruner != "nenhum")
+    study.optimize(objetivo, n_trials=n_trials)
+    return n_trials
+
+
+def _criar_storage(url: str):
+    import optuna
+
+    # timeout maior para os vários processos escreverem no mesmo SQLite sem erro de lock
+    return optuna.storages.RDBStorage(url, engine_kwargs={"connect_args": {"timeout": 60}})
+
+
+@app.command()
+def tune(
+    features_path: Path = DATASET_PATH,
+    params_path: Path = PARAMETROS_PATH,
+    storage: str = OPTUNA_STORAGE,
+    estudo: str = "xgboost_default",
+    n_trials: int = 40,
+    n_workers: int = 0,
+    threads_por_worker: int = 0,
+    pruner: str = "hyperband",
+    incluir_prazos: bool = False,
+    var_alvo: str = "default",
+):
+    """
+    Busca de hiperparâmetros com Optuna em vários processos.
+
+    Cada processo roda sua parte dos trials com `threads_por_worker` threads do XGBoost, de
+    modo que workers x threads não passe do total de núcleos (`n_workers` acima da
+    quantidade de núcleos é limitado a ela; um `threads_por_worker` explícito que passe do
+    total só gera um aviso). Os trials ficam gravados no
+    SQLite de `storage`: rodar de novo com o mesmo `estudo` retoma a busca e acrescenta
+    `n_trials` trials. Ao final, os melhores parâmetros vão para `params_path`, lido pelo
+    comando de treino.
+
+    Com `pruner` ("hyperband" ou "mediana"), cada trial reporta a AUC por rodada e os
+    trials sem chance são interrompidos cedo; "nenhum" roda todos até o fim.
+    """
+    import optuna
+
+    n_nucleos = os.cpu_count() or 1
+    if n_workers > n_nucleos:
+        logger.warning(f"{n_workers} processos para {n_nucleos} núcleos: limitando a {n_nucleos}")
+        n_workers = n_nucleos
+    n_workers = n_workers or max(1, min(n_trials, n_nucleos // 2))
+    threads_por_worker = threads_por_worker or max(1, n_nucleos // n_workers)
+    logger.info(f"{n_workers} processos x {threads_por_worker} threads ({n_nucleos} núcleos)")
+    if n_workers * threads_por_worker > n_nucleos:
+        logger.warning(f"{n_workers * threads_por_worker} threads para {n_nucleos} núcleos: a CPU ficará sobrecarregada")
+
+    pipeline, X, y, idx_train, _ = preparar_treino(features_path, incluir_prazos, var_alvo)
+    y_train = y[idx_train]
+    contagem_classes = np.bincount(y_train)
+    scale_pos_weight = contagem_classes[0] / contagem_classes[1]
+
+    study = optuna.create_study(
+        study_name=estudo,
+        storage=_criar_storage(storage),
+        direction="maximize",
+        sampler=optuna.samplers.TPESampler(),
+        pruner=criar_pruner(pruner),
+        load_if_exists=True,
+    )
+    logger.info(f"Estudo '{estudo}' com {len(study.trials)} trials anteriores")
+
+    # divide os trials entre os processos
+    por_worker = [n_trials // n_workers + (1 if i < n_trials % n_workers else 0) for i in range(n_workers)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # os workers abrem os dados de treino por memory-map, sem refazer as features
+        caminho_dados = tmp
+        np.save(Path(tmp) / "X.npy", X[idx_train])
+        np.save(Path(tmp) / "y.npy", y_train)
+
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=contexto) as executor:
+            futuros = [
+                executor.submit(
+                    _executar_trials, storage, estudo, k, caminho_dados,
+                    threads_por_worker, scale_pos_weight, pruner
+                )
+                for k in por_worker if k > 0
+            ]
+            for futuro in tqdm(as_completed(futuros), total=len(futuros), desc="workers"):
+                futuro.result()
+
+    study = optuna.load_study(study_name=estudo, storage=_criar_storage(storage))
+    podados = sum(t.state == optuna.trial.TrialState.PRUNED for t in study.trials)
+    logger.info(f"{len(study.trials)} trials no estudo, {podados} podados")
+    melhor = study.best_trial
+
+    params = {
+        "objective": "binary:logistic",
+        "eval_metric": "auc",
+        "subsample": 0.80,
+        "colsample_bytree": 0.80,
+        **melhor.params,
+    }
+    artefato = {
+        "estudo": estudo,
+        "trial": melhor.number,
+        "melhor_auc": melhor.value,
+        "num_boost_round": melhor.user_attrs.get("num_boost_round", 100),
+        "colunas": pipeline.colunas,
+        "params": params,
+    }
+    with open(params_path, "w") as file:
+        json.dump(artefato, file, indent=4)
+
+    logger.success(f"Melhor AUC {melhor.value:.4f} (trial {melhor.number}); parâmetros salvos em {params_path}")
+
+
 if __name__ == "__main__":
+    configurar()
     app()
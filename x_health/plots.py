@@ -1,3 +1,8 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import multiprocessing
+import os
 from pathlib import Path
 
 import pandas as pd
@@ -12,11 +17,14 @@ from typing import List, Union, Any, Optional, Tuple
 
 from loguru import logger
 from tqdm import tqdm
+import typer
 
-from x_health.eda_utils import get_feature_importances
+from x_health.eda_utils import cubo_bivariado, ranking_mi
 
 #from x_health.config import FIGURES_DIR, PROCESSED_DATA_DIR
 
+app = typer.Typer()
+
 
 # cores personalizadas 
 COR_1 = "#b11a6c" #rosa
@@ -35,7 +43,11 @@ def plot_mi(
     figsize: tuple = (10,6),
     n: int = 15,
     discrete_features = 'auto',
-    color: str = COR_1  # Cor padrão: rosa
+    color: str = COR_1,  # Cor padrão: rosa
+    amostra = None,
+    n_bootstrap: int = 0,
+    n_jobs: int = -1,
+    save_path: Optional[str] = None
 ):
      
      """
@@ -57,13 +69,37 @@ def plot_mi(
         Define se as variáveis devem ser tratadas como discretas ou contínuas.
     color: str
         Define a cor da barra no gráfico. Padrão: COR_1 (rosa).
+    amostra: int ou float
+        Tamanho ou fração da subamostra estratificada (ver `ranking_mi`). Padrão: todas as linhas.
+    n_bootstrap: int
+        Reamostragens para as barras de erro (intervalo de 95%). Padrão: 0, sem barras.
+    n_jobs: int
+        Processos usados no cálculo. Padrão: -1 (todos os núcleos).
+    save_path: str
+        Caminho para salvar a imagem gerada. Se None, a imagem não será salva.
     """
      fig, ax = plt.subplots(figsize = figsize)
-     get_feature_importances(database, target_variable, features, discrete_features)\
-        .sort_values(ascending=False).head(n).sort_values()\
-        .plot.barh(ax=ax, color = color, title = f'Informação mútua para conceito: {target_variable}')
+     # o ranking fica em cache: refazer o gráfico com os mesmos dados não recalcula a MI
+     ranking = ranking_mi(
+         database, target_variable, features, discrete_features,
+         amostra=amostra, n_bootstrap=n_bootstrap, n_jobs=n_jobs
+     ).head(n).iloc[::-1]
+
+     erro = None
+     if 'ic_inf' in ranking:
+         erro = [
+             (ranking['mi'] - ranking['ic_inf']).clip(lower=0),
+             (ranking['ic_sup'] - ranking['mi']).clip(lower=0),
+         ]
+     ranking['mi'].plot.barh(
+         ax=ax, color = color, xerr = erro, title = f'Informação mútua para conceito: {target_variable}'
+     )
 
      plt.tight_layout()
+
+     # Salvar figura, se necessário
+     if save_path:
+         plt.savefig(save_path, dpi=300, bbox_inches='tight')
     
     
     
@@ -78,7 +114,8 @@ def correlation_heatmap(
     figsize: Tuple[int,int] = (10,10),
     title: str = "Mapa de Calor de Correlação",
         
-    cores: List[str] = ["#ff69b4", "#e31c79", "#800040"]
+    cores: List[str] = ["#ff69b4", "#e31c79", "#800040"],
+    save_path: Optional[str] = None
 ) -> None:
         
     """
@@ -94,6 +131,8 @@ def correlation_heatmap(
         Whether to include only numeric columns in the correlation computation, True by default.
     figsize: Optional, Tuple [int,int]
         Size of the figure(width, height) in inches, (10,10) by default.
+    save_path: Optional, str
+        Path where the figure is saved, None (not saved) by default.
 
     Returns
     -------
@@ -124,7 +163,10 @@ def correlation_heatmap(
         annot_kws={'fontsize': 8, "fontweight": 'demibold'}
     )
     plt.title(title)
-    plt.show
+
+    if save_path:
+        plt.savefig(save_path, dpi=300, bbox_inches='tight')
+    plt.show()
     
     
     
@@ -194,6 +236,11 @@ label1 : str, opcional (default="Inadimplências")
     Rótulo para eventos positivos.
 label2 : str, opcional (default="Não Inadimplências")
     Rótulo para eventos negativos.
+cubo : pd.DataFrame, opcional (default=None)
+    Contagens pré-calculadas por `eda_utils.cubo_bivariado`. Se informado, o gráfico sai
+    do cubo, sem percorrer `df` (que pode ser None).
+save_path : str, opcional (default=None)
+    Caminho para salvar a imagem gerada. Se None, a imagem não será salva.
 
 Retorno
 -------
@@ -236,19 +283,30 @@ def plot_distribuicao_bivariada(
     xticks_labelsize: Optional[int] = 10,
     title: str = None,
     label1: str="Inadimplentes",
-    label2: str= 'Adimplentes'
+    label2: str= 'Adimplentes',
+    cubo: Optional[pd.DataFrame] = None,
+    save_path: Optional[str] = None
 
 ) -> None:
 
     if not title:
-        title:f'Variação da taxa de inadimplência para a variavel: {variavel_analise}'
-        df_tmp = df[[variavel_analise, nom_variavel_conceito]]
+        title = f'Variação da taxa de inadimplência para a variavel: {variavel_analise}'
+
+    if cubo is not None:
+        # contagens já agregadas: só seleciona as linhas da variável
+        df_tmp = cubo.loc[cubo['variavel'] == variavel_analise, ['categoria', 'quantidade', nom_variavel_conceito]]
+        df_tmp = df_tmp.rename(columns={'categoria': variavel_analise})
+        if convert_str:
+            df_tmp[variavel_analise] = df_tmp[variavel_analise].astype(str)
+            df_tmp = df_tmp.groupby(variavel_analise)[['quantidade', nom_variavel_conceito]].sum().reset_index()
+    else:
+        df_tmp = df[[variavel_analise, nom_variavel_conceito]].copy()
         df_tmp['quantidade'] = 1
 
-    if convert_str:
-        df_tmp[variavel_analise] = df_tmp[variavel_analise].astype(str)
+        if convert_str:
+            df_tmp[variavel_analise] = df_tmp[variavel_analise].astype(str)
 
-    df_tmp = pd.DataFrame(df_tmp.groupby(variavel_analise)[['quantidade', nom_variavel_conceito]].sum()).reset_index()
+        df_tmp = pd.DataFrame(df_tmp.groupby(variavel_analise)[['quantidade', nom_variavel_conceito]].sum()).reset_index()
 
     if sort_values:
         df_tmp.sort_values(by=['quantidade'], ascending=False, inplace=True)
@@ -357,4 +415,199 @@ def plot_distribuicao_bivariada(
     )
 
     sns.despine(right=False)
+
+    if save_path:
+        plt.savefig(save_path, dpi=300, bbox_inches='tight')
     plt.show() 
+
+
+
+
+
+
+#################################################
+#          RELATÓRIO DE FIGURAS (CLI)           #
+#################################################
+def _fingerprint_figura(funcao, args: tuple, kwargs: dict) -> str:
+    """
+    Impressão digital (BLAKE2b) dos dados e parâmetros de uma figura.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{funcao.__module__}.{funcao.__name__}".encode("utf-8"))
+    for nome, valor in [(None, arg) for arg in args] + sorted(kwargs.items()):
+        h.update(repr(nome).encode("utf-8"))
+        if isinstance(valor, (pd.DataFrame, pd.Series)):
+            h.update(pd.util.hash_pandas_object(valor, index=False).to_numpy().tobytes())
+            h.update(repr(list(getattr(valor, "columns", [valor.name]))).encode("utf-8"))
+        elif isinstance(valor, np.ndarray):
+            h.update(np.ascontiguousarray(valor).tobytes())
+        else:
+            h.update(repr(valor).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _renderizar(caminho: str, funcao, args: tuple, kwargs: dict) -> str:
+    # executado em outro processo: sem janela, a figura vai direto para o arquivo
+    plt.switch_backend("Agg")
+    try:
+        funcao(*args, save_path=caminho, **kwargs)
+    finally:
+        plt.close("all")
+    return caminho
+
+
+def tarefas_relatorio(df: pd.DataFrame, target: str = "default", modelo=None) -> dict:
+    """
+    Monta as figuras do relatório (as mesmas do notebook de análise exploratória), cada
+    uma com apenas as colunas de que precisa.
+
+    Retorno:
+    --------
+    dict
+        {nome do arquivo: (função, args, kwargs)}
+    """
+    from x_health.eda_utils import (
+        agrupar_atividade_principal,
+        agrupar_opcao_tributaria,
+        agrupar_prazo,
+        agrupar_tipo_sociedade,
+    )
+
+    taxa = df[target].mean()
+    df = df.copy()
+    df['forma_pagamento_agrup'] = agrupar_prazo(df, 'forma_pagamento')
+    df['tipo_sociedade_agrup'] = agrupar_tipo_sociedade(df, 'tipo_sociedade')
+    df['atividade_principal_agrup'] = agrupar_atividade_principal(df, 'atividade_principal')
+    df['opcao_tributaria_agrup'] = agrupar_opcao_tributaria(df, 'opcao_tributaria')
+    mes = df['month'].to_numpy(dtype=np.float64)
+    df['periodo_fiscal'] = np.array(["1T", "2T", "3T", "4T"])[
+        np.select([mes <= 3, mes <= 6, mes <= 9], [0, 1, 2], default=3)
+    ]
+    df['month'] = df['month'].astype(str).str.zfill(2)
+    df['flag_valor_vencido'] = (df['valor_vencido'] > 0).astype(int)
+
+    numericas = df.select_dtypes('number')
+    tarefas = {
+        "corr_heatmap_pink.png": (correlation_heatmap, (numericas,), {"cores": ["#FFC0CB", "#e31c79", "#4B0023"]}),
+    }
+
+    categoricas = ['forma_pagamento', 'opcao_tributaria', 'tipo_sociedade']
+    features = categoricas + ['valor_vencido', 'valor_quitado']
+    codificado = df[features + [target]].copy()
+    for col in categoricas:
+        codificado[col] = pd.factorize(codificado[col].astype(str), sort=True)[0]
+    # n_jobs=1: cada figura já roda num processo do pool, sem paralelismo aninhado do sklearn
+    tarefas["mutual_information.png"] = (
+        plot_mi, (codificado, features),
+        {"target_variable": target, "n": 10, "figsize": (5, 3), "n_jobs": 1},
+    )
+
+    # {variável: (arquivo já publicado em reports/figures, argumentos extras)}
+    bivariadas = {
+        'forma_pagamento_agrup': ("bivariada_prazoPagamento.png", {"sort_values": True}),
+        'tipo_sociedade_agrup': ("bivariada_tipo_sociedade_agrup.png", {"sort_values": True}),
+        'atividade_principal_agrup': ("bivariada_atividade_principal.png", {"sort_values": True}),
+        'opcao_tributaria_agrup': ("bivariada_opcao_tributaria_agrup.png", {"sort_values": True}),
+        'year': ("bivariada_anual.png", {}),
+        'month': ("bivariada_mensal.png", {}),
+        'periodo_fiscal': ("bivariada_trimestral.png", {}),
+        'flag_valor_vencido': ("bivariada_flag_valor_vencido.png", {}),
+    }
+    # uma única passada pela base para todos os gráficos bivariados
+    cubo = cubo_bivariado(df, target, list(bivariadas))
+    for variavel, (arquivo, extra) in bivariadas.items():
+        tarefas[arquivo] = (
+            plot_distribuicao_bivariada, (None, variavel, target, taxa),
+            {"rotation": 90, "ha": 'center', "figsize": (9, 3),
+             "cubo": cubo[cubo['variavel'] == variavel].reset_index(drop=True), **extra},
+        )
+
+    if modelo is not None:
+        import xgboost as xgb
+        from x_health.features import pipeline_do_modelo
+        from x_health.xgboost_utils import indices_estratificados, plot_matriz_confusao
+
+        # mesma separação do treino (estratificada, 80/20, semente 42)
+        pipeline = pipeline_do_modelo(modelo)
+        y = df[target].to_numpy()
+        previsto = (modelo.predict(xgb.DMatrix(pipeline.transform(df), feature_names=pipeline.colunas)) > 0.5).astype(int)
+        idx_train, idx_test = indices_estratificados(y)
+        tarefas["matriz_confusao_XGBoost_final.png"] = (
+            plot_matriz_confusao, (y[idx_train], previsto[idx_train], y[idx_test], previsto[idx_test]), {},
+        )
+
+    return tarefas
+
+
+@app.command()
+def report(
+    input_path: Optional[Path] = None,
+    figures_dir: Optional[Path] = None,
+    model_path: Optional[Path] = None,
+    n_workers: int = 0,
+    forcar: bool = False,
+):
+    """
+    Gera todas as figuras do relatório em `figures_dir` (padrão: FIGURES_DIR), sem sessão
+    interativa: backend Agg e uma figura por processo.
+
+    A impressão digital dos dados e parâmetros de cada figura fica em
+    `figures_dir/.fingerprints.json`; figuras cujo arquivo existe e cuja impressão digital
+    não mudou não são refeitas (a menos que `forcar`).
+    """
+    from x_health.config import FIGURES_DIR, MODELS_DIR
+    from x_health.dataset import DATASET_PATH, carregar_dataset
+
+    input_path = input_path or DATASET_PATH
+    figures_dir = figures_dir or FIGURES_DIR
+    model_path = model_path or MODELS_DIR / "modelo_xgboost.ubj"
+    figures_dir.mkdir(parents=True, exist_ok=True)
+
+    modelo = None
+    if model_path.exists() or model_path.with_suffix(".pkl").exists():
+        from x_health.modeling.predict import carregar_modelo
+        modelo = carregar_modelo(model_path)
+
+    df = carregar_dataset(input_path)
+    tarefas = tarefas_relatorio(df, modelo=modelo)
+
+    registro_path = figures_dir / ".fingerprints.json"
+    registro = json.loads(registro_path.read_text()) if registro_path.exists() else {}
+
+    pendentes = {}
+    for nome, (funcao, args, kwargs) in tarefas.items():
+        fingerprint = _fingerprint_figura(funcao, args, kwargs)
+        if not forcar and registro.get(nome) == fingerprint and (figures_dir / nome).exists():
+            continue
+        pendentes[nome] = fingerprint
+    logger.info(f"{len(pendentes)} de {len(tarefas)} figuras a gerar")
+
+    if pendentes:
+        # os processos filhos herdam o backend sem janela
+        os.environ["MPLBACKEND"] = "Agg"
+        n_workers = n_workers or min(len(pendentes), os.cpu_count() or 1)
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=contexto) as executor:
+            futuros = {
+                executor.submit(_renderizar, str(figures_dir / nome), *tarefas[nome]): nome
+                for nome in pendentes
+            }
+            for futuro in tqdm(as_completed(futuros), total=len(futuros), desc="figuras"):
+                nome = futuros[futuro]
+                try:
+                    futuro.result()
+                except Exception as erro:
+                    logger.error(f"{nome}: {erro}")
+                    continue
+                registro[nome] = pendentes[nome]
+                # grava a cada figura, para uma interrupção não perder o que já foi feito
+                registro_path.write_text(json.dumps(registro, indent=4, sort_keys=True))
+
+    logger.success(f"Figuras em: {figures_dir}")
+
+
+if __name__ == "__main__":
+    from x_health.config import configurar
+
+    configurar()
+    app()
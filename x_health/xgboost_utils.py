@@ -1,14 +1,12 @@
 import pandas as pd
 import numpy as np
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-
 from typing import Tuple, Optional
 
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import roc_auc_score, accuracy_score, precision_score, recall_score, f1_score, log_loss, confusion_matrix
+# matplotlib, seaborn e sklearn são importados dentro das funções que os usam, para que
+# o treino e a predição não paguem a carga das bibliotecas de gráficos
+
+from x_health.agrupamentos import CATEGORIAS_PRAZO, agrupar_valores, classificar_prazo
 
 
 ##############################################
@@ -31,9 +29,12 @@ def tratar_categoricas(df: pd.DataFrame) -> pd.DataFrame:
     """
     df = df.copy()
 
-    # Preenche valores nulos com "Desconhecido"
-    for col in df.select_dtypes(include=['object']).columns:
-        df[col] = df[col].fillna("Desconhecido")
+    # Preenche valores nulos com "Desconhecido" (colunas categóricas, como as geradas
+    # pelas funções agrupar_*, voltam para texto antes de codificar)
+    for col in df.select_dtypes(include=['object', 'category']).columns:
+        df[col] = df[col].astype(object).fillna("Desconhecido")
+
+    from sklearn.preprocessing import LabelEncoder
 
     # Converte variáveis categóricas para numéricas
     label_encoders = {}
@@ -52,7 +53,7 @@ def tratar_categoricas(df: pd.DataFrame) -> pd.DataFrame:
 #######################################
 import pandas as pd
 
-def agrupar_prazo(df: pd.DataFrame, forma_pgto: str) -> pd.DataFrame:
+def agrupar_prazo(df: pd.DataFrame, forma_pgto: str, usar_memo: bool = True) -> pd.Series:
     """
     Agrupa as formas de pagamento por prazo médio e retorna um DataFrame com os valores agrupados.
 
@@ -62,11 +63,13 @@ def agrupar_prazo(df: pd.DataFrame, forma_pgto: str) -> pd.DataFrame:
         DataFrame contendo os dados a serem processados.
     forma_pgto : str
         Nome da coluna que contém as formas de pagamento.
+    usar_memo : bool, opcional (default=True)
+        Se True, reaproveita as classificações já feitas em chamadas anteriores.
 
     Retorno:
     --------
-    pd.DataFrame
-        O DataFrame original com uma nova coluna "prazo_pagamento" contendo os valores agrupados.
+    pd.Series
+        Série categórica (pd.Categorical) com os valores agrupados, no mesmo índice de `df`.
     
     Agrupamentos:
     -------------
@@ -79,38 +82,8 @@ def agrupar_prazo(df: pd.DataFrame, forma_pgto: str) -> pd.DataFrame:
     - "Outros" → Casos em que não foi possível identificar o prazo.
     """
 
-    def classificar_prazo(fp):
-        # Verificar se o valor está ausente (nan, "", "none")
-        if pd.isna(fp) or str(fp).strip().lower() in ["nan", "", "none"]:
-            return "Desconhecido"
-        
-        # Verificar se o pagamento é explicitamente ausente
-        if str(fp).strip().lower() in ["nenhum", "sem pagamento"]:
-            return "Sem pagamento"
-
-        # Converter para string e substituir "x" por "/" para padronizar
-        prazos = [int(x) for x in str(fp).replace("x", "/").split("/") if x.isdigit()]
-
-        # Se não houver prazos identificáveis, classificar como "Outros"
-        if not prazos:
-            return "Outros"
-
-        # Calcular o prazo médio
-        prazo_medio = sum(prazos) / len(prazos)
-
-        # Definir categorias de prazo
-        if len(prazos) == 1 and prazo_medio <= 15:
-            return "À vista (até 15 dias)"
-        elif prazo_medio <= 30:
-            return "Curto prazo (16-30 dias)"
-        elif prazo_medio <= 90:
-            return "Médio prazo (31-90 dias)"
-        else:
-            return "Longo prazo (+90 dias)"
-    
-    # Criar e retornar nova coluna no DataFrame com os valores agrupados
-    
-    return df[forma_pgto].apply(classificar_prazo)
+    # cada valor distinto é classificado uma única vez e o rótulo volta para as linhas
+    return agrupar_valores(df[forma_pgto], classificar_prazo, CATEGORIAS_PRAZO, usar_memo)
 
 
 
@@ -143,29 +116,400 @@ def preparar_dados(df: pd.DataFrame, target: str, test_size: float = 0.2, random
         - y_train : Series contendo a variável alvo do conjunto de treino.
         - y_test : Series contendo a variável alvo do conjunto de teste.
     """
-    df = df.copy()
+    # divide só os índices e monta cada subconjunto com um único `iloc`, sem copiar o
+    # DataFrame inteiro para X antes de separar
+    idx_train, idx_test = indices_estratificados(df[target].to_numpy(), test_size, random_state)
+    colunas_X = [i for i, c in enumerate(df.columns) if c != target]
+    posicao_alvo = df.columns.get_loc(target)
+
+    return (
+        df.iloc[idx_train, colunas_X], df.iloc[idx_test, colunas_X],
+        df.iloc[idx_train, posicao_alvo], df.iloc[idx_test, posicao_alvo],
+    )
+
+
+def indices_estratificados(y: np.ndarray, test_size: float = 0.2, random_state: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Separa treino e teste estratificados pelo alvo, devolvendo apenas os índices das linhas
+    (mesma divisão de `train_test_split` com a mesma semente).
+
+    Retorno:
+    --------
+    Tuple[np.ndarray, np.ndarray]
+        Índices de treino e de teste.
+    """
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(np.arange(len(y)), test_size=test_size, random_state=random_state, stratify=y)
+
+
+
+
+
+
+#######################################
+#   Folds da validação cruzada        #
+#######################################
+def criar_folds(X: np.ndarray, y: np.ndarray, nfold: int = 5, seed: int = 42, max_bin: int = 256, nthread: int = -1) -> list:
+    """
+    Calcula uma única vez os folds estratificados e as QuantileDMatrix de cada um, para
+    serem reaproveitados por todos os trials da otimização (o `xgb.cv` refaz a divisão e
+    os sketches de quantis a cada chamada).
+
+    Parâmetros:
+    -----------
+    X : np.ndarray
+        Matriz de features (float32) do conjunto de treino.
+    y : np.ndarray
+        Variável alvo.
+    nfold : int, opcional (default=5)
+        Quantidade de folds.
+    seed : int, opcional (default=42)
+        Semente da divisão dos folds.
+    max_bin : int, opcional (default=256)
+        Quantidade de bins do histograma; os parâmetros do treino devem usar o mesmo valor.
+    nthread : int, opcional (default=-1)
+        Threads usadas na construção das matrizes.
+
+    Retorno:
+    --------
+    list[Tuple[xgboost.QuantileDMatrix, xgboost.QuantileDMatrix]]
+        Pares (treino, validação) de cada fold; a validação usa os quantis do treino.
+    """
+    import xgboost as xgb
+    from sklearn.model_selection import StratifiedKFold
+
+    folds = []
+    divisao = StratifiedKFold(n_splits=nfold, shuffle=True, random_state=seed)
+    for idx_treino, idx_valid in divisao.split(np.zeros(len(y)), y):
+        dtreino = xgb.QuantileDMatrix(X[idx_treino], label=y[idx_treino], max_bin=max_bin, nthread=nthread)
+        dvalid = xgb.QuantileDMatrix(X[idx_valid], label=y[idx_valid], ref=dtreino, max_bin=max_bin, nthread=nthread)
+        folds.append((dtreino, dvalid))
+
+    return folds
+
+
+def validacao_cruzada(
+    params: dict,
+    folds: list,
+    num_boost_round: int = 100,
+    early_stopping_rounds: Optional[int] = 10,
+    callbacks: Optional[list] = None
+) -> pd.DataFrame:
+    """
+    Validação cruzada sobre folds já construídos (ver `criar_folds`), com o mesmo
+    resultado de `xgb.cv`: os modelos dos folds avançam juntos, rodada a rodada, e a
+    média da métrica de validação decide o early stopping.
+
+    Parâmetros:
+    -----------
+    params : dict
+        Parâmetros do XGBoost (`tree_method` é fixado em "hist").
+    folds : list
+        Pares (treino, validação) de `criar_folds`.
+    num_boost_round : int, opcional (default=100)
+        Máximo de rodadas.
+    early_stopping_rounds : int, opcional (default=10)
+        Rodadas sem melhora na média antes de parar; None desliga.
+    callbacks : list, opcional
+        Callbacks no formato `xgboost.callback.TrainingCallback`; apenas `after_iteration`
+        é chamado, com o histórico no formato de `xgb.cv` ({"test": {métrica: [(média, desvio)]}}).
+
+    Retorno:
+    --------
+    pd.DataFrame
+        Colunas "test-<métrica>-mean" e "test-<métrica>-std", uma linha por rodada até a
+        melhor (sem as métricas de treino, que o `xgb.cv` também calcula).
+    """
+    import xgboost as xgb
+
+    params = {**params, "tree_method": "hist"}
+    modelos = [xgb.Booster(params, [dtreino, dvalid]) for dtreino, dvalid in folds]
+    historico = {"test": {}}
+    melhor_rodada, melhor_valor = 0, None
+    metrica_parada = None
+
+    for rodada in range(num_boost_round):
+        valores = {}
+        for modelo, (dtreino, dvalid) in zip(modelos, folds):
+            modelo.update(dtreino, rodada)
+            # formato "[0]\ttest-auc:0.812345"
+            for item in modelo.eval_set([(dvalid, "test")], rodada).split("\t")[1:]:
+                nome, valor = item.split(":")
+                valores.setdefault(nome.removeprefix("test-"), []).append(float(valor))
+
+        for nome, lista in valores.items():
+            historico["test"].setdefault(nome, []).append((float(np.mean(lista)), float(np.std(lista))))
+
+        # um callback que devolve True encerra o treino, como no xgb.cv
+        parar = any([callback.after_iteration(modelos, rodada, historico) for callback in callbacks or []])
+
+        # como no xgb.cv, o early stopping usa a última métrica da lista
+        metrica_parada = metrica_parada or list(valores)[-1]
+        atual = historico["test"][metrica_parada][-1][0]
+        maximizar = metrica_parada.startswith(("auc", "aucpr", "map", "ndcg", "pre"))
+        if melhor_valor is None or (atual > melhor_valor if maximizar else atual < melhor_valor):
+            melhor_rodada, melhor_valor = rodada, atual
+        elif early_stopping_rounds and rodada - melhor_rodada >= early_stopping_rounds:
+            break
+
+        if parar:
+            break
+
+    resultados = {}
+    for nome, lista in historico["test"].items():
+        resultados[f"test-{nome}-mean"] = [m for m, _ in lista[:melhor_rodada + 1]]
+        resultados[f"test-{nome}-std"] = [d for _, d in lista[:melhor_rodada + 1]]
+    return pd.DataFrame(resultados)
+
 
-    # Separa variáveis preditoras (X) e variável alvo (y)
-    X = df.drop(columns=[target])
-    X = df.drop(columns=["default"])
-    y = df[target]  # Remove a coluna 'default'
 
-    # Divide os dados em treino e teste com estratificação
-    return train_test_split(X, y, test_size=test_size, random_state=random_state, stratify=y)
 
 
 
+#######################################
+#   Objetivo da otimização (Optuna)   #
+#######################################
+def criar_callback_poda(trial, metrica: str = "test-auc-mean"):
+    """
+    Cria o callback do XGBoost que reporta ao Optuna, a cada rodada de boosting, o valor
+    médio de `metrica` nos folds e interrompe o trial (optuna.TrialPruned) quando o pruner
+    do estudo decide que ele não vai superar os demais.
+
+    Parâmetros:
+    -----------
+    trial : optuna.Trial
+        Trial em execução.
+    metrica : str, opcional (default="test-auc-mean")
+        Coluna da validação cruzada no formato "<conjunto>-<métrica>-mean".
+
+    Retorno:
+    --------
+    xgboost.callback.TrainingCallback
+    """
+    import optuna
+    import xgboost as xgb
+
+    conjunto, nome = metrica.removesuffix("-mean").split("-", 1)
+
+    class PodaOptuna(xgb.callback.TrainingCallback):
+
+        def after_iteration(self, model, epoch, evals_log):
+            # na validação cruzada cada entrada do histórico é (média, desvio) nos folds
+            valor = evals_log[conjunto][nome][-1]
+            if isinstance(valor, tuple):
+                valor = valor[0]
+
+            trial.report(float(valor), step=epoch)
+            if trial.should_prune():
+                raise optuna.TrialPruned(f"podado na rodada {epoch} ({metrica}={valor:.4f})")
+            return False
+
+    return PodaOptuna()
+
+
+def criar_objetivo(
+    folds: list,
+    scale_pos_weight: float,
+    n_threads: int = 1,
+    num_boost_round: int = 100,
+    metrica: str = "test-auc-mean",
+    podar: bool = True
+):
+    """
+    Cria a função objetivo do Optuna usada no notebook 02-xgboost: validação cruzada
+    estratificada, maximizando a AUC média de teste. Os folds são construídos uma vez
+    (`criar_folds`) e compartilhados por todos os trials.
+
+    Parâmetros:
+    -----------
+    folds : list
+        Pares (treino, validação) de `criar_folds`.
+    scale_pos_weight : float
+        Razão entre negativos e positivos no treino; a busca fica em ±20% desse valor,
+        limitada a no mínimo 1.
+    n_threads : int, opcional (default=1)
+        Threads do XGBoost em cada trial. Com vários trials em paralelo, cada um deve
+        receber apenas a sua parte dos núcleos.
+    num_boost_round : int, opcional (default=100)
+        Máximo de rodadas de boosting (com early stopping de 10 rodadas).
+    metrica : str, opcional (default="test-auc-mean")
+        Coluna de `validacao_cruzada` a ser maximizada.
+    podar : bool, opcional (default=True)
+        Se True, a métrica de cada rodada é reportada ao Optuna e o trial é interrompido
+        quando o pruner do estudo o julga sem chance (ver `criar_callback_poda`).
+
+    Retorno:
+    --------
+    Callable[[optuna.Trial], float]
+        Função objetivo. A quantidade de rodadas escolhida pelo early stopping fica em
+        `trial.user_attrs["num_boost_round"]`.
+    """
+    # ±20% em torno da razão entre as classes, sem descer de 1 (que já seria sem peso);
+    # a faixa antiga (spw-0.8, spw-0.4) ficava invertida quando a razão era menor que 1.4
+    faixa_spw = (max(1.0, scale_pos_weight * 0.8), max(1.0, scale_pos_weight * 1.2))
+
+    def objective(trial):
+        params = {
+            "objective": "binary:logistic",
+            "eval_metric": "auc",
+            "scale_pos_weight": trial.suggest_float("scale_pos_weight", *faixa_spw),
+            "max_depth": trial.suggest_int("max_depth", 3, 6),
+            "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.3),
+            "subsample": 0.80,  # Mantendo fixo
+            "colsample_bytree": 0.80,  # Mantendo fixo
+            "lambda": trial.suggest_float("lambda", 1e-3, 10.0),  # Regularização L2
+            "alpha": trial.suggest_float("alpha", 1e-3, 10.0),  # Regularização L1
+            "min_child_weight": trial.suggest_int("min_child_weight", 5, 15),
+            "gamma": trial.suggest_float("gamma", 0.0, 5.0),
+            "nthread": n_threads,  # parte dos núcleos reservada a este trial
+        }
+
+        # reporta a AUC de cada rodada ao Optuna, que pode interromper o trial no meio
+        callbacks = [criar_callback_poda(trial, metrica)] if podar else None
+
+        # Executa cross-validation estratificada sobre os folds pré-calculados
+        cv_results = validacao_cruzada(
+            params, folds, num_boost_round=num_boost_round,
+            early_stopping_rounds=10, callbacks=callbacks
+        )
+
+        if metrica not in cv_results.columns:
+            raise ValueError(f"Métrica '{metrica}' não encontrada! Colunas disponíveis: {cv_results.columns}")
+
+        # com early stopping, a última linha é a melhor rodada
+        trial.set_user_attr("num_boost_round", len(cv_results))
+        return float(cv_results[metrica].max())
+
+    return objective
+
 
 
 
 #######################################
 #       Avaliação das métricas        #
 #######################################
-import numpy as np
-import pandas as pd
-from sklearn.metrics import roc_auc_score, accuracy_score, precision_score, recall_score, f1_score, log_loss
 
-def avaliar_XGBoost(model, dtrain, y_train, dtest, y_test) -> pd.DataFrame:
+def _contagens(k: np.ndarray, tp_acumulado: np.ndarray, positivos: int, n: int) -> pd.DataFrame:
+    """
+    Matriz de confusão (e métricas derivadas) quando os `k` maiores scores são previstos
+    como positivos, para vários valores de `k` de uma vez.
+    """
+    k = np.asarray(k, dtype=np.int64)
+    tp = np.where(k > 0, tp_acumulado[np.maximum(k - 1, 0)], 0)
+    fp = k - tp
+    fn = positivos - tp
+    tn = (n - positivos) - fp
+
+    # mesmas convenções do sklearn: divisão por zero vira 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precisao = np.where(k > 0, tp / k, 0.0)
+        recall = tp / positivos if positivos else np.zeros(len(k))
+        f1 = np.where(k + positivos > 0, 2 * tp / (k + positivos), 0.0)
+
+    return pd.DataFrame({
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "acuracia": (tp + tn) / n,
+        "precisao": precisao,
+        "recall": recall,
+        "f1": f1,
+    })
+
+
+def metricas_binarias(
+    y_true: np.ndarray,
+    y_prob: np.ndarray,
+    limiar: float = 0.5,
+    varredura: bool = False,
+    limiares: Optional[np.ndarray] = None
+) -> Tuple[dict, Optional[pd.DataFrame]]:
+    """
+    Calcula AUC-ROC, acurácia, precisão, recall, F1 e log loss com uma única ordenação dos
+    scores (O(n log n)), em vez de uma chamada do sklearn por métrica. Os valores coincidem
+    com os do sklearn.
+
+    Parâmetros:
+    -----------
+    y_true : np.ndarray
+        Valores reais (0 ou 1).
+    y_prob : np.ndarray
+        Probabilidades previstas para a classe 1.
+    limiar : float, opcional (default=0.5)
+        Classifica como 1 os scores estritamente maiores que o limiar.
+    varredura : bool, opcional (default=False)
+        Se True, devolve também a matriz de confusão e as métricas em cada limiar.
+    limiares : np.ndarray, opcional (default=None)
+        Limiares da varredura. Se None, usa todos os scores distintos (a curva completa).
+        Em todos os casos a regra é a de `limiar`: previsto 1 quando score > limiar.
+
+    Retorno:
+    --------
+    Tuple[dict, Optional[pd.DataFrame]]
+        Dicionário {métrica: valor} e, com `varredura`, a tabela por limiar (senão None).
+    """
+    y_true = np.asarray(y_true).astype(np.int64)
+    y_prob = np.asarray(y_prob)
+    n = len(y_true)
+    positivos = int(y_true.sum())
+    if positivos in (0, n):
+        raise ValueError("AUC-ROC indefinida: y_true precisa ter as duas classes.")
+
+    # ordenação única, dos maiores scores para os menores
+    ordem = np.argsort(-y_prob, kind="stable")
+    scores = y_prob[ordem]
+    tp_acumulado = np.cumsum(y_true[ordem])
+
+    # fim de cada grupo de scores empatados: pontos da curva ROC
+    fim_grupo = np.r_[np.flatnonzero(np.diff(scores)), n - 1]
+    tpr = np.r_[0.0, tp_acumulado[fim_grupo] / positivos]
+    fpr = np.r_[0.0, (fim_grupo + 1 - tp_acumulado[fim_grupo]) / (n - positivos)]
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    # log loss com o mesmo corte do sklearn (eps do tipo das probabilidades)
+    eps = np.finfo(y_prob.dtype).eps if np.issubdtype(y_prob.dtype, np.floating) else np.finfo(np.float64).eps
+    p = np.clip(y_prob.astype(np.float64), eps, 1 - eps)
+    logloss = float(-np.mean(np.where(y_true == 1, np.log(p), np.log1p(-p))))
+
+    # quantos scores ficam acima de cada limiar, por busca binária nos scores ordenados
+    def acima(valores):
+        return np.searchsorted(-scores, -np.asarray(valores, dtype=np.float64), side="left")
+
+    no_limiar = _contagens(acima([limiar]), tp_acumulado, positivos, n).iloc[0]
+    metricas = {
+        "AUC-ROC": auc,
+        "Acurácia": float(no_limiar["acuracia"]),
+        "Precisão": float(no_limiar["precisao"]),
+        "Recall": float(no_limiar["recall"]),
+        "F1-score": float(no_limiar["f1"]),
+        "Log Loss": logloss,
+    }
+
+    if not varredura:
+        return metricas, None
+
+    if limiares is None:
+        # cada score distinto como limiar; como no resto da função, previsto 1 quando
+        # score > limiar, então o k de cada grupo é a quantidade de scores antes dele
+        limiares, k = scores[fim_grupo], np.r_[0, fim_grupo[:-1] + 1]
+    else:
+        limiares = np.asarray(limiares, dtype=np.float64)
+        k = acima(limiares)
+
+    tabela = _contagens(k, tp_acumulado, positivos, n)
+    tabela.insert(0, "limiar", limiares)
+    return metricas, tabela
+
+
+def avaliar_XGBoost(
+    model,
+    dtrain,
+    y_train,
+    dtest,
+    y_test,
+    limiar: float = 0.5,
+    varredura: bool = False,
+    limiares: Optional[np.ndarray] = None
+):
     """
     Avalia o desempenho de um modelo XGBoost nos conjuntos de treino e teste.
 
@@ -181,47 +525,34 @@ def avaliar_XGBoost(model, dtrain, y_train, dtest, y_test) -> pd.DataFrame:
         Conjunto de dados de teste no formato DMatrix.
     y_test : np.ndarray
         Valores reais do conjunto de teste.
+    limiar : float, opcional (default=0.5)
+        Limiar de classificação das métricas pontuais.
+    varredura : bool, opcional (default=False)
+        Se True, devolve também a tabela de métricas por limiar no conjunto de teste.
+    limiares : np.ndarray, opcional (default=None)
+        Limiares da varredura; se None, todos os scores distintos do teste.
 
     Retorno:
     --------
-    pd.DataFrame
-        DataFrame contendo as métricas de desempenho para os conjuntos de treino e teste.
+    pd.DataFrame ou Tuple[pd.DataFrame, pd.DataFrame]
+        DataFrame contendo as métricas de desempenho para os conjuntos de treino e teste e,
+        com `varredura`, a tabela por limiar (ver `metricas_binarias`).
     """
-
-    # Previsões para treino
-    y_train_pred_prob = model.predict(dtrain)  # Probabilidades para treino
-    y_train_pred = (y_train_pred_prob > 0.5).astype(int)  # Classificação binária para treino
-
-    # Previsões para teste
-    y_test_pred_prob = model.predict(dtest)  # Probabilidades para teste
-    y_test_pred = (y_test_pred_prob > 0.5).astype(int)  # Classificação binária para teste
-
-    # Cálculo das métricas para treino e teste
-    metrics = {
-        "Métrica": ["AUC-ROC", "Acurácia", "Precisão", "Recall", "F1-score", "Log Loss"],
-        "Treino": [
-            roc_auc_score(y_train, y_train_pred_prob),
-            accuracy_score(y_train, y_train_pred),
-            precision_score(y_train, y_train_pred),
-            recall_score(y_train, y_train_pred),
-            f1_score(y_train, y_train_pred),
-            log_loss(y_train, y_train_pred_prob),
-        ],
-        "Teste": [
-            roc_auc_score(y_test, y_test_pred_prob),
-            accuracy_score(y_test, y_test_pred),
-            precision_score(y_test, y_test_pred),
-            recall_score(y_test, y_test_pred),
-            f1_score(y_test, y_test_pred),
-            log_loss(y_test, y_test_pred_prob),
-        ],
-    }
-
-    df_metrics = pd.DataFrame(metrics)
+    # Previsões e métricas para treino e teste, uma ordenação por conjunto
+    metricas_treino, _ = metricas_binarias(y_train, model.predict(dtrain), limiar)
+    metricas_teste, tabela = metricas_binarias(y_test, model.predict(dtest), limiar, varredura, limiares)
+
+    df_metrics = pd.DataFrame({
+        "Métrica": list(metricas_teste),
+        "Treino": list(metricas_treino.values()),
+        "Teste": list(metricas_teste.values()),
+    })
     
     #print("\n### Desempenho do Modelo XGBoost ###")
     #print(df_metrics.to_string(index=False))
 
+    if varredura:
+        return df_metrics, tabela
     return df_metrics
 
 
@@ -269,6 +600,10 @@ def plot_matriz_confusao(y_true_train: np.ndarray,
     None
         Exibe os gráficos das matrizes de confusão para os conjuntos de treino e teste.
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from sklearn.metrics import confusion_matrix
+
     fig, axes = plt.subplots(1, 2, figsize=size)
 
     # Função auxiliar para plotar matriz